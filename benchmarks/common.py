@@ -0,0 +1,31 @@
+"""Helpers shared by the benchmark scripts
+
+Benchmarks run inside Blender, with pycolmap, Pillow and av importable, i.e.
+
+    blender -b --factory-startup --python benchmarks/point_cloud_import.py
+"""
+import sys
+import time
+import importlib.util
+from pathlib import Path
+
+def load_addon():
+    """Import the add-on from this checkout as the `glomap_blender` package"""
+    root = Path(__file__).resolve().parent.parent
+    spec = importlib.util.spec_from_file_location("glomap_blender", root / "__init__.py", submodule_search_locations=[str(root)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["glomap_blender"] = module
+    spec.loader.exec_module(module)
+    return module
+
+def script_args(default):
+    """Arguments passed after `--` on the Blender command line"""
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    return default
+
+def timed(label, function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    print(f"{label}: {time.perf_counter() - start:.3f}s")
+    return result
@@ -0,0 +1,33 @@
+"""Compare the per-point and bulk point cloud import for 100k, 1M and 5M points
+
+    blender -b --factory-startup --python benchmarks/point_cloud_import.py -- 100000 1000000 5000000
+"""
+import bpy
+import numpy as np
+
+from common import load_addon, script_args, timed
+
+def fill_per_point(mesh, positions, colors):
+    # the import as it was before `fill_point_cloud`
+    mesh.from_pydata(positions.tolist(), [], [])
+    mesh.update()
+    color_layer = mesh.color_attributes.new(name="Color", domain='POINT', type='BYTE_COLOR')
+    for i, c in enumerate(colors.tolist()):
+        color_layer.data[i].color = c
+
+def main():
+    operators = load_addon().src.colmap.operators
+
+    rng = np.random.default_rng(0)
+    for count in map(int, script_args(["100000", "1000000", "5000000"])):
+        positions = rng.normal(size=(count, 3)).astype(np.float32)
+        colors = np.ones((count, 4), dtype=np.float32)
+        colors[:, :3] = rng.random((count, 3))
+
+        print(f"--- {count} points")
+        for label, fill in (("per point", fill_per_point), ("foreach_set", operators.fill_point_cloud)):
+            mesh = bpy.data.meshes.new("Benchmark Point Cloud")
+            timed(label, fill, mesh, positions, colors)
+            bpy.data.meshes.remove(mesh)
+
+main()
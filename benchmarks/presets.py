@@ -0,0 +1,78 @@
+"""Time every built-in preset on a reference clip, and store the timings shown in the preset tooltips
+
+    blender -b --factory-startup --python benchmarks/presets.py -- /path/to/reference_clip.mp4
+
+Each preset runs in its own temporary folder, from splitting frames to the GLOMAP solve.
+"""
+import json
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import bpy
+import pycolmap
+
+from common import load_addon, script_args
+
+def match(matcher, kwargs):
+    match matcher:
+        case 'EXHAUSTIVE':
+            pycolmap.match_exhaustive(**kwargs)
+        case 'SPATIAL':
+            pycolmap.match_spatial(**kwargs)
+        case 'VOCABTREE':
+            pycolmap.match_vocabtree(**kwargs)
+        case 'SEQUENTIAL':
+            pycolmap.match_sequential(**kwargs)
+
+def solve(glomap_operators, command, process_options):
+    process = glomap_operators.start_process(command, process_options)
+    process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+def measured(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    addon = load_addon()
+    addon.register()
+    presets = addon.src.presets
+    utils = addon.src.utils
+    glomap_operators = addon.src.glomap.operators
+
+    clip_path = Path(script_args([None])[0]).resolve()
+    clip = bpy.data.movieclips.load(str(clip_path))
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for key, (name, _, _) in presets.BUILTIN_PRESETS.items():
+            print(f"--- {name}")
+            presets.apply_preset(clip, key)
+            clip.colmap.use_custom_directory = True
+            clip.colmap.directory = str(Path(directory) / key)
+
+            stages = {}
+            (database_path, images_path, reconstruction_path), stages['split'] = measured(utils.prepare_database, clip)
+            _, stages['extract'] = measured(pycolmap.extract_features, **clip.colmap.extract_features.build(database_path, images_path, clip))
+            _, stages['match'] = measured(match, *clip.colmap.match_features.build(database_path))
+            _, stages['solve'] = measured(solve, glomap_operators, *glomap_operators.glomap_command(clip, database_path, reconstruction_path))
+            for label, seconds in stages.items():
+                print(f"{label}: {seconds:.3f}s")
+
+            model_path = utils.largest_model(reconstruction_path)
+            timings[key] = {
+                'clip': clip_path.name,
+                'num_frames': len(list(images_path.iterdir())),
+                'stages': stages,
+                'stats': utils.reconstruction_stats(model_path) if model_path is not None else None,
+            }
+
+    with open(presets.TIMINGS_PATH, "w") as f:
+        json.dump(timings, f, indent=4)
+    print(f"Wrote {presets.TIMINGS_PATH}")
+
+main()
@@ -0,0 +1,46 @@
+"""Check that camera rotations survive the conversion to keyed quaternions
+
+    blender -b --factory-startup --python benchmarks/rotations.py
+
+Sweeps pans, tilts and rolls through the full circle, plus random rotations, converts them with
+`camera_world_poses` and compares the matrix of every quaternion with the expected Blender camera rotation.
+Exits with 1 if any of them is off.
+"""
+import sys
+
+import numpy as np
+import mathutils
+
+from common import load_addon
+
+def axis_rotations(axis, angles):
+    """(N, 3, 3) rotations by `angles` about the X, Y or Z axis"""
+    return np.array([np.array(mathutils.Matrix.Rotation(angle, 3, axis)) for angle in angles])
+
+def main():
+    addon = load_addon()
+    operators = addon.src.colmap.operators
+
+    angles = np.linspace(-np.pi, np.pi, 721)
+    rng = np.random.default_rng(0)
+    random = np.array([np.array(mathutils.Quaternion(q / np.linalg.norm(q)).to_matrix()) for q in rng.normal(size=(1000, 4))])
+    sweeps = {
+        'pan': axis_rotations('Y', angles),
+        'tilt': axis_rotations('X', angles),
+        'roll': axis_rotations('Z', angles),
+        'random': random,
+    }
+
+    failed = False
+    for label, rotations in sweeps.items():
+        # COLMAP stores cam_from_world, the camera rotation is the transpose
+        _, quaternions = operators.camera_world_poses(rotations, np.zeros((len(rotations), 3)))
+        expected = rotations.transpose(0, 2, 1) * np.array([1.0, -1.0, -1.0])
+        actual = np.array([np.array(mathutils.Quaternion(q).to_matrix()) for q in quaternions])
+        error = np.abs(actual - expected).max()
+        print(f"{label}: max error {error:.2e}")
+        failed |= error > 1e-5
+
+    sys.exit(1 if failed else 0)
+
+main()
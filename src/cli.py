@@ -0,0 +1,183 @@
+"""Run the tracking pipeline without the UI, e.g. to batch-track shots on a render farm
+
+    blender -b shot.blend --python-expr "from bl_ext.user_default.glomap.src import cli; cli.main()" -- --clip shot_010.mp4 --save
+
+Each clip is split into frames, its features are extracted and matched, camera motion is solved and
+the tracking scene is set up, all with the settings stored on the clip in the .blend file.
+Progress is printed to stdout as one JSON object per line, the output of COLMAP and GLOMAP goes to stderr.
+Blender exits with 1 if any clip failed.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import bpy
+
+from .utils import clip_path, prepare_database, database_stats, enforce_storage_budget, format_bytes, lock_workspace, unlock_workspace, BlockingOperator
+from .presets import apply_preset
+from .colmap.operators import ColmapMatchFeaturesOperator, prepare_extract_features, extract_features, prepare_match_features, match_features, prepare_colmap_solve, colmap_solve, setup_tracking_scene
+from .glomap.operators import prepare_glomap_solve, glomap_solve
+
+STAGES = ['split', 'extract', 'match', 'solve', 'setup']
+
+def emit(event, **fields):
+    # the real stdout, so progress still reaches it while the solvers are redirected to stderr
+    print(json.dumps({'event': event, **fields}), file=sys.__stdout__, flush=True)
+
+def follow_colmap_log(expression, on_progress, function, *args):
+    """Call `function` on a thread, reporting the progress COLMAP logs until it returns"""
+    def log_path():
+        log_paths = glob.glob(str(Path(bpy.app.tempdir) / "colmap_log_*"))
+        return log_paths[0] if len(log_paths) > 0 else None
+
+    # skip what earlier stages logged
+    path = log_path()
+    position = os.path.getsize(path) if path is not None else 0
+    partial_line = ""
+
+    result = {}
+    def run():
+        try:
+            function(*args)
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    while thread.is_alive():
+        thread.join(0.5)
+        path = path or log_path()
+        if path is None:
+            continue
+        with open(path, "r", errors="ignore") as f:
+            f.seek(position)
+            partial_line += f.read()
+            position = f.tell()
+        progress_match = None
+        for progress_match in expression.finditer(partial_line):
+            pass
+        if progress_match:
+            on_progress(int(progress_match.group(1)), int(progress_match.group(2)))
+            partial_line = ""
+
+    if 'error' in result:
+        raise result['error']
+
+def solve_colmap(clip, on_progress):
+    # nothing cancels a headless solve, but resuming from and writing checkpoints work as in the UI
+    colmap_solve(prepare_colmap_solve(clip), on_progress, threading.Event())
+
+def solve_glomap(clip, on_message, on_progress):
+    returncode = glomap_solve(prepare_glomap_solve(clip), on_message, on_progress)
+    if returncode != 0:
+        raise Exception(f"GLOMAP exited with code {returncode}")
+
+def run_stage(stage, clip, solver, context):
+    def on_progress(current, total):
+        emit('progress', clip=clip.name, stage=stage, current=current, total=total)
+    def on_message(message):
+        emit('message', clip=clip.name, stage=stage, message=message)
+    def report(level, message):
+        emit('warning' if 'WARNING' in level else 'message', clip=clip.name, stage=stage, message=message)
+
+    match stage:
+        case 'split':
+            prepare_database(clip)
+        case 'extract':
+            follow_colmap_log(BlockingOperator.progress_expression, on_progress, extract_features, *prepare_extract_features(clip, report))
+        case 'match':
+            follow_colmap_log(ColmapMatchFeaturesOperator.progress_expression, on_progress, match_features, *prepare_match_features(clip, report), on_message)
+        case 'solve':
+            # the solvers' own output would break the JSON lines
+            with contextlib.redirect_stdout(sys.stderr):
+                if solver == 'COLMAP':
+                    solve_colmap(clip, on_progress)
+                else:
+                    solve_glomap(clip, on_message, on_progress)
+        case 'setup':
+            setup_tracking_scene(context, clip, report)
+
+def track_clip(clip, stages, solver, context):
+    """Run `stages` for one clip in order, stopping at the first that fails. Returns whether all of them succeeded"""
+    workspace = clip_path(clip)
+    lock_path = lock_workspace(workspace)
+    try:
+        for stage in stages:
+            emit('stage', clip=clip.name, stage=stage)
+            start = time.perf_counter()
+            try:
+                run_stage(stage, clip, solver, context)
+            except Exception as e:
+                emit('error', clip=clip.name, stage=stage, message=str(e))
+                return False
+            emit('done', clip=clip.name, stage=stage, seconds=round(time.perf_counter() - start, 3))
+    finally:
+        unlock_workspace(lock_path)
+        # there are no timers to refresh the cached results in the background, so count right away
+        database_path = workspace / "database.db"
+        if database_path.exists():
+            for key, value in database_stats(database_path).items():
+                setattr(clip.colmap.cached_results, key, value)
+    return True
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="cli", description="Track clips of the open .blend file without the UI")
+    parser.add_argument("--clip", dest="clips", action="append", default=[], help="Name of a movie clip to track, can be repeated. Defaults to every clip")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated stages to run, in pipeline order. Defaults to '{','.join(STAGES)}'")
+    parser.add_argument("--solver", choices=['GLOMAP', 'COLMAP'], default='GLOMAP', type=str.upper)
+    parser.add_argument("--preset", help="Apply a preset to every clip first, e.g. PREVIEW, PRODUCTION, HERO or USER:<name>")
+    parser.add_argument("--save", action="store_true", help="Save the .blend file after tracking")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip().lower() for stage in args.stages.split(",") if stage.strip() != ""]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if len(unknown) > 0:
+        parser.error(f"unknown stages {', '.join(unknown)}, choose from {', '.join(STAGES)}")
+    args.stages = sorted(stages, key=STAGES.index)
+    return args
+
+def main(argv=None):
+    """Track clips as told by the arguments after `--` on the Blender command line, then exit Blender"""
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args = parse_args(argv)
+    context = bpy.context
+
+    if len(args.clips) == 0:
+        clips = list(bpy.data.movieclips)
+    else:
+        missing = [name for name in args.clips if name not in bpy.data.movieclips]
+        if len(missing) > 0:
+            emit('error', message=f"No movie clip named {', '.join(missing)}")
+            sys.exit(1)
+        clips = [bpy.data.movieclips[name] for name in args.clips]
+
+    failed = []
+    for clip in clips:
+        if args.preset is not None:
+            try:
+                apply_preset(clip, args.preset)
+            except Exception as e:
+                emit('error', clip=clip.name, message=f"Failed to apply preset '{args.preset}': {e!r}")
+                failed.append(clip.name)
+                continue
+        if not track_clip(clip, args.stages, args.solver, context):
+            failed.append(clip.name)
+
+    storage = context.scene.colmap_storage
+    if storage.use_budget and storage.auto_enforce:
+        usage, freed = enforce_storage_budget(**storage.build())
+        storage.last_usage = f"Using {format_bytes(usage)} of {storage.budget:.1f} GB"
+        emit('storage', usage=usage, freed=freed)
+
+    if args.save:
+        bpy.ops.wm.save_mainfile()
+
+    emit('finished', clips=[clip.name for clip in clips], failed=failed)
+    sys.exit(1 if len(failed) > 0 else 0)
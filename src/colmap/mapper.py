@@ -0,0 +1,22 @@
+"""Run the COLMAP incremental mapper in a process of its own
+
+    python mapper.py job.pickle
+
+The job is a pickled dict of `pycolmap.incremental_mapping` arguments, plus an optional `log_path` to log to.
+This runs outside of Blender, so it must only import pycolmap, and the parent passes its `sys.path` in `PYTHONPATH` to find it.
+"""
+import sys
+import pickle
+
+import pycolmap
+
+def main():
+    with open(sys.argv[1], "rb") as f:
+        job = pickle.load(f)
+    log_path = job.pop('log_path', None)
+    if log_path is not None:
+        pycolmap.logging.set_log_destination(pycolmap.logging.Level.INFO, log_path)
+    pycolmap.incremental_mapping(**job)
+
+if __name__ == "__main__":
+    main()
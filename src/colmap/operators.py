@@ -7,10 +7,97 @@ import queue
 from pathlib import Path
 import glob
 import re
+import functools
+import hashlib
 
+import numpy as np
 import pycolmap
 
-from ..utils import prepare_database, refresh_cache, clear_feature_extraction, clear_feature_matches, clear_reconstruction, clear_images, clear_all, BlockingOperator
+from ..model import Model, read_model, write_model
+from ..distortion import tracking_camera_settings, undistort_frames
+from ..filtering import filter_points
+from ..presets import BUILTIN_PRESETS, USER_PREFIX, preset_timings, format_timings, list_user_presets, save_user_preset, delete_user_preset, apply_preset
+from ..utils import clip_path, prepare_database, workspace_paths, pruned_data, drop_pruned_features, compact_database, format_bytes, touch_artifacts, enforce_storage_budget, shared_cache_path, features_cache_key, publish_features, reuse_features, property_values, save_snapshot, restore_snapshot, delete_snapshot, set_active_snapshot, record_solve_snapshot, checkpoints_path, list_models, load_models, selected_model_path, filtered_model_path, CheckpointWriter, SolveCancelled, refresh_cache, clear_feature_extraction, clear_feature_matches, clear_reconstruction, clear_images, clear_all, delete_tombstones, BlockingOperator
+
+def prepare_extract_features(clip, report):
+    """Split the clip if needed and build the feature extraction arguments. Returns `(kwargs, cached_features_path)`
+
+    `report` is called like `Operator.report` for problems that do not stop the extraction.
+    """
+    database_path, images_path, _ = prepare_database(clip)
+
+    if drop_pruned_features(database_path):
+        report({'WARNING'}, "Descriptors were removed to save space, extracting every frame again. Match features again afterwards")
+    touch_artifacts(clip_path(clip), 'descriptors')
+
+    cache_path = shared_cache_path()
+    cached_features_path = None
+    if cache_path is not None:
+        cached_features_path = cache_path / "features" / f"{features_cache_key(clip)}.db"
+        touch_artifacts(cache_path, f"features/{cached_features_path.name}")
+
+    return clip.colmap.extract_features.build(database_path, images_path, clip), cached_features_path
+
+def extract_features(kwargs, cached_features_path):
+    if cached_features_path is not None and reuse_features(cached_features_path, kwargs['database_path']):
+        return
+    pycolmap.extract_features(**kwargs)
+    if cached_features_path is not None and not cached_features_path.exists():
+        publish_features(kwargs['database_path'], cached_features_path)
+
+def prepare_match_features(clip, report):
+    """Build the matcher arguments, and the compaction to run afterwards. Returns `(matcher, kwargs, compact)`
+
+    `report` is called like `Operator.report` for problems that do not stop the matching.
+    """
+    database_path, _, _ = prepare_database(clip)
+
+    matcher, args = clip.colmap.match_features.build(database_path)
+
+    pruned = pruned_data(database_path)
+    if pruned['descriptors']:
+        raise Exception("Descriptors were removed to save space, extract features again before matching")
+    touch_artifacts(clip_path(clip), 'descriptors')
+    # new matches are merged into the current ones, which then no longer match any snapshot
+    set_active_snapshot(database_path, None)
+    if pruned['matches']:
+        report({'WARNING'}, "Unverified matches were removed by 'Compact Database', only newly matched pairs will have them")
+
+    match matcher:
+        case 'VOCABTREE':
+            vocab_tree_path = clip.colmap.match_features.vocab_tree.vocab_tree_path
+            if (vocab_tree_path.startswith("http://") or vocab_tree_path.startswith("https://") or vocab_tree_path == "") and not bpy.app.online_access:
+                raise Exception(
+                    f"'Vocab Tree' matching requires online access to download '{vocab_tree_path}'"
+                    if vocab_tree_path != ""
+                    else "'Vocab Tree' matching requires online access to download default bin"
+                )
+        case 'SEQUENTIAL':
+            vocab_tree_path = clip.colmap.match_features.sequential.vocab_tree_path
+            if (vocab_tree_path.startswith("http://") or vocab_tree_path.startswith("https://") or vocab_tree_path == "") and not bpy.app.online_access:
+                raise Exception(
+                    f"'Sequential' matching requires online access to download '{vocab_tree_path}'"
+                    if vocab_tree_path != ""
+                    else "'Sequential' matching requires online access to download default bin"
+                )
+
+    compact = clip.colmap.compact
+    return matcher, args, compact.build(database_path) if compact.compact_after_matching else None
+
+def match_features(matcher, kwargs, compact, on_message=None):
+    match matcher:
+        case 'EXHAUSTIVE':
+            pycolmap.match_exhaustive(**kwargs)
+        case 'SPATIAL':
+            pycolmap.match_spatial(**kwargs)
+        case 'VOCABTREE':
+            pycolmap.match_vocabtree(**kwargs)
+        case 'SEQUENTIAL':
+            pycolmap.match_sequential(**kwargs)
+    if compact is not None:
+        if on_message is not None:
+            on_message("Compacting database")
+        compact_database(**compact)
 
 class ColmapExtractFeaturesOperator(BlockingOperator):
     bl_idname = "colmap.extract_features"
@@ -18,15 +105,10 @@ class ColmapExtractFeaturesOperator(BlockingOperator):
     bl_description = "Automatically find features to track across all frames"
 
     def prepare(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
-        database_path, images_path, _ = prepare_database(clip)
-
-        return (clip.colmap.extract_features.build(database_path, images_path, clip),)
+        return (prepare_extract_features(context.space_data.clip, self.report),)
 
     def execute_async(self, args):
-        return pycolmap.extract_features(**args)
+        extract_features(*args)
 
 class ColmapMatchFeaturesOperator(BlockingOperator):
     bl_idname = "colmap.match_features"
@@ -36,48 +118,86 @@ class ColmapMatchFeaturesOperator(BlockingOperator):
     progress_expression = re.compile(r"Matching \w+ \[(\d+)\/(\d+)")
 
     def prepare(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
-        database_path, _, _ = prepare_database(clip)
-
-        matcher, args = clip.colmap.match_features.build(database_path)
-
-        match matcher:
-            case 'EXHAUSTIVE':
-                return ((matcher, args),)
-            case 'SPATIAL':
-                return ((matcher, args),)
-            case 'VOCABTREE':
-                vocab_tree_path = clip.colmap.match_features.vocab_tree.vocab_tree_path
-                if (vocab_tree_path.startswith("http://") or vocab_tree_path.startswith("https://") or vocab_tree_path == "") and not bpy.app.online_access:
-                    raise Exception(
-                        f"'Vocab Tree' matching requires online access to download '{vocab_tree_path}'"
-                        if vocab_tree_path != ""
-                        else "'Vocab Tree' matching requires online access to download default bin"
-                    )
-                return ((matcher, args),)
-            case 'SEQUENTIAL':
-                vocab_tree_path = clip.colmap.match_features.sequential.vocab_tree_path
-                if (vocab_tree_path.startswith("http://") or vocab_tree_path.startswith("https://") or vocab_tree_path == "") and not bpy.app.online_access:
-                    raise Exception(
-                        f"'Sequential' matching requires online access to download '{vocab_tree_path}'"
-                        if vocab_tree_path != ""
-                        else "'Sequential' matching requires online access to download default bin"
-                    )
-                return ((matcher, args),)
+        return (prepare_match_features(context.space_data.clip, self.report),)
 
     def execute_async(self, args):
-        matcher, kwargs = args
-        match matcher:
-            case 'EXHAUSTIVE':
-                return pycolmap.match_exhaustive(**kwargs)
-            case 'SPATIAL':
-                return pycolmap.match_spatial(**kwargs)
-            case 'VOCABTREE':
-                return pycolmap.match_vocabtree(**kwargs)
-            case 'SEQUENTIAL':
-                return pycolmap.match_sequential(**kwargs)
+        def on_message(message):
+            self._message = message
+        match_features(*args, on_message=on_message)
+
+def prepare_colmap_solve(clip):
+    """Build the incremental mapper and checkpoint settings for a clip, and record the snapshot it is solved with"""
+    database_path, image_path, reconstruction_path = prepare_database(clip)
+
+    clip.colmap.cached_results.solve_snapshot = record_solve_snapshot(database_path, reconstruction_path) or ""
+
+    checkpoints = clip.colmap.checkpoints
+
+    return {
+        'database_path': database_path,
+        'image_path': image_path,
+        'output_path': reconstruction_path,
+        'options': clip.colmap.incremental_pipeline.build(),
+        'checkpoints': checkpoints.build(checkpoints_path(database_path), database_path) if checkpoints.use_checkpoints else None,
+        'resume': checkpoints.use_checkpoints and checkpoints.resume,
+    }
+
+def colmap_solve(args, on_progress, cancel, on_next_image=None):
+    """Run the incremental mapper, resuming from and writing checkpoints if requested
+
+    `cancel` is checked after every registered image, `on_next_image(reconstruction_manager, num_new_images)` is
+    called after it with the in-progress reconstruction. Returns False if the solve was cancelled.
+    """
+    total = len(os.listdir(args['image_path']))
+    current = 0
+
+    # drive the pipeline directly, so the callbacks can see the in-progress reconstruction
+    reconstruction_manager = pycolmap.ReconstructionManager()
+
+    checkpoint_writer = None
+    if args['checkpoints'] is not None:
+        checkpoint_writer = CheckpointWriter(**args['checkpoints'])
+        if args['resume']:
+            num_reg_images = checkpoint_writer.restore(reconstruction_manager)
+            if num_reg_images is not None:
+                print(f"Resuming from checkpoint with {num_reg_images} registered images")
+                current = num_reg_images
+                on_progress(current, total)
+
+    num_new_images = 0
+
+    def initial_image_pair_callback():
+        nonlocal current
+        current = 0
+        on_progress(current, total)
+    def next_image_callback():
+        nonlocal current, num_new_images
+        if cancel.is_set():
+            raise SolveCancelled()
+        current += 1
+        num_new_images += 1
+        on_progress(current, total)
+        if checkpoint_writer is not None:
+            checkpoint_writer.next_image(reconstruction_manager)
+        if on_next_image is not None:
+            on_next_image(reconstruction_manager, num_new_images)
+
+    pipeline = pycolmap.IncrementalPipeline(args['options'], str(args['image_path']), str(args['database_path']), reconstruction_manager)
+    pipeline.add_callback(pycolmap.IncrementalMapperCallback.INITIAL_IMAGE_PAIR_REG_CALLBACK, initial_image_pair_callback)
+    pipeline.add_callback(pycolmap.IncrementalMapperCallback.NEXT_IMAGE_REG_CALLBACK, next_image_callback)
+    try:
+        pipeline.run()
+    except SolveCancelled:
+        # keep the checkpoints, so the solve can be resumed with different settings
+        print("Solve cancelled")
+        return False
+
+    reconstruction_manager.write(str(args['output_path']))
+
+    if checkpoint_writer is not None:
+        checkpoint_writer.finish()
+
+    return True
 
 class ColmapSolveOperator(BlockingOperator):
     bl_idname = "colmap.solve"
@@ -86,128 +206,823 @@ class ColmapSolveOperator(BlockingOperator):
 
     parse_logs = False
 
+    _cancel = threading.Event() # class state, set by `colmap.cancel_solve`
+
+    _preview_queue = None
+    _preview_timer = None
+
     def prepare(self, context):
-        sc = context.space_data
-        clip = sc.clip
-        
-        database_path, image_path, reconstruction_path = prepare_database(clip)
+        ColmapSolveOperator._cancel.clear()
+
+        clip = context.space_data.clip
+        preview = clip.colmap.preview
 
         return ({
-            'database_path': database_path,
-            'image_path': image_path,
-            'output_path': reconstruction_path,
-            'options': clip.colmap.incremental_pipeline.build()
+            **prepare_colmap_solve(clip),
+            'preview': self._start_preview(preview) if preview.use_preview else None,
         },)
 
+    def _start_preview(self, preview):
+        # only the newest snapshot is kept, so a slow viewport never backs up the mapper
+        self._preview_queue = queue.Queue(maxsize=1)
+        self._preview_timer = functools.partial(ColmapSolveOperator._update_preview, self)
+        bpy.app.timers.register(self._preview_timer, first_interval=0.25)
+        return preview.build()
+
+    def _publish_preview(self, reconstruction_manager, max_points):
+        if reconstruction_manager.size() == 0:
+            return
+        snapshot = Model.from_reconstruction(reconstruction_manager.get(reconstruction_manager.size() - 1), max_points=max_points)
+        try:
+            self._preview_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._preview_queue.put_nowait(snapshot)
+
+    @classmethod
+    def _update_preview(cls, operator):
+        if not operator._running:
+            return None
+        try:
+            snapshot = operator._preview_queue.get_nowait()
+        except queue.Empty:
+            return 0.25
+        # one snapshot per tick, with at most `max_points` points, keeps the cost of each tick bounded
+        update_solve_preview(snapshot)
+        return 0.25
+
     def execute_async(self, args):
-        self._progress_total = len(os.listdir(args['image_path']))
-        def initial_image_pair_callback():
-            self._progress_current = 0
-        def next_image_callback():
-            self._progress_current += 1
-        pycolmap.incremental_mapping(
-            **args,
-            initial_image_pair_callback=initial_image_pair_callback,
-            next_image_callback=next_image_callback,
-        )
+        preview = args['preview']
 
+        def on_progress(current, total):
+            self._progress_current = current
+            self._progress_total = total
+        def on_next_image(reconstruction_manager, num_new_images):
+            if num_new_images % preview['every_images'] == 0:
+                self._publish_preview(reconstruction_manager, preview['max_points'])
+
+        if not colmap_solve(args, on_progress, ColmapSolveOperator._cancel, on_next_image if preview is not None else None):
+            return {'CANCELLED'}
         return {'FINISHED'}
 
-class ColmapSetupTrackingSceneOperator(bpy.types.Operator):
-    bl_idname = "colmap.setup_tracking_scene"
-    bl_label = "Setup Tracking Scene"
-    bl_description = "Load the tracking data as a Camera and point cloud"
+    def modal(self, context, event):
+        result = super().modal(context, event)
+        if 'FINISHED' in result and self._preview_timer is not None:
+            if bpy.app.timers.is_registered(self._preview_timer):
+                bpy.app.timers.unregister(self._preview_timer)
+            self._preview_timer = None
+            self._preview_queue = None
+            remove_solve_preview()
+        return result
+
+class ColmapCancelSolveOperator(bpy.types.Operator):
+    bl_idname = "colmap.cancel_solve"
+    bl_label = "Cancel Solve"
+    bl_description = "Stop the running COLMAP solve after the next registered image"
+
+    @classmethod
+    def poll(cls, context):
+        return BlockingOperator._running_lock.get(ColmapSolveOperator, False)
 
     def execute(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
-        _, _, reconstruction_path = prepare_database(clip)
-
-        reconstruction = pycolmap.Reconstruction(reconstruction_path / "0")
+        ColmapSolveOperator._cancel.set()
+        return {'FINISHED'}
 
+def point_cloud_arrays(models):
+    """Gather the 3D points of all models into contiguous arrays
+
+    Returns `(positions, colors)` as float32 arrays of shape (N, 3) and (N, 4), with colors in 0-1 RGBA.
+    """
+    positions = np.concatenate([model.xyz for model in models]).astype(np.float32)
+    colors = np.ones((len(positions), 4), dtype=np.float32)
+    colors[:, :3] = np.concatenate([model.rgb for model in models]) / 255.0 # NOTE: GLOMAP points are black unless they were colorized
+    return positions, colors
+
+def fill_point_cloud(mesh, positions, colors):
+    """Fill an empty mesh with loose vertices and a point color attribute in bulk"""
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(positions, dtype=np.float32).ravel())
+    mesh.update()
+
+    color_layer = mesh.color_attributes.new(name="Color", domain='POINT', type='BYTE_COLOR')
+    color_layer.data.foreach_set("color", np.ascontiguousarray(colors, dtype=np.float32).ravel())
+
+def update_point_cloud(mesh, positions, colors):
+    """Write the points into a mesh from a previous import, skipping positions or colors that did not change
+
+    A hash of each array is kept on the mesh, so unchanged data is detected without reading the mesh back.
+    Returns whether the positions changed.
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.float32)
+    colors = np.ascontiguousarray(colors, dtype=np.float32)
+    positions_hash = hashlib.blake2b(positions.tobytes(), digest_size=16).hexdigest()
+    colors_hash = hashlib.blake2b(colors.tobytes(), digest_size=16).hexdigest()
+
+    if mesh.get("colmap_positions_hash") != positions_hash or len(mesh.vertices) != len(positions):
+        mesh.clear_geometry()
+        for name in ("Color", "lod"):
+            attribute = mesh.attributes.get(name)
+            if attribute is not None:
+                mesh.attributes.remove(attribute)
+        fill_point_cloud(mesh, positions, colors)
+        mesh["colmap_positions_hash"] = positions_hash
+        mesh["colmap_colors_hash"] = colors_hash
+        return True
+
+    if mesh.get("colmap_colors_hash") != colors_hash:
+        color_layer = mesh.color_attributes.get("Color")
+        if color_layer is None:
+            color_layer = mesh.color_attributes.new(name="Color", domain='POINT', type='BYTE_COLOR')
+        color_layer.data.foreach_set("color", colors.ravel())
+        mesh["colmap_colors_hash"] = colors_hash
+    return False
+
+def voxel_lod(positions, levels):
+    """Assign every point the coarsest level of detail it appears in
+
+    Level `k` keeps one point per voxel of a grid with `32 * 2**k` cells across the extent of the cloud.
+    Points never picked as a voxel representative get `levels`, so showing `lod <= level` shows a decimated cloud
+    for `level < levels` and the full cloud for `level == levels`.
+    """
+    lod = np.full(len(positions), levels, dtype=np.int32)
+    if len(positions) == 0:
+        return lod
+    # ignore stray points when sizing the grid
+    low, high = np.percentile(positions, [1, 99], axis=0)
+    extent = max(float(np.max(high - low)), 1e-6)
+    for level in reversed(range(levels)):
+        voxel_size = extent / (32 * 2 ** level)
+        voxels = np.floor((positions - low) / voxel_size).astype(np.int64)
+        _, representatives = np.unique(voxels, axis=0, return_index=True)
+        lod[representatives] = level
+    return lod
+
+def point_cloud_lod_node_group():
+    """Geometry nodes group that draws a mesh as points, decimated by its `lod` attribute in the viewport only"""
+    name = "COLMAP Point Cloud LOD"
+    if name in bpy.data.node_groups:
+        return bpy.data.node_groups[name]
+
+    group = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    group.interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    level_socket = group.interface.new_socket("Viewport Level", in_out='INPUT', socket_type='NodeSocketInt')
+    level_socket.default_value = 0
+    level_socket.min_value = 0
+    radius_socket = group.interface.new_socket("Radius", in_out='INPUT', socket_type='NodeSocketFloat')
+    radius_socket.default_value = 0.005
+    radius_socket.min_value = 0.0
+    group.interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+
+    nodes = group.nodes
+    links = group.links
+
+    group_input = nodes.new('NodeGroupInput')
+    group_output = nodes.new('NodeGroupOutput')
+
+    lod = nodes.new('GeometryNodeInputNamedAttribute')
+    lod.data_type = 'INT'
+    lod.inputs["Name"].default_value = "lod"
+
+    compare = nodes.new('FunctionNodeCompare')
+    compare.data_type = 'INT'
+    compare.operation = 'GREATER_THAN'
+    compare_a = next(socket for socket in compare.inputs if socket.name == "A" and socket.type == 'INT')
+    compare_b = next(socket for socket in compare.inputs if socket.name == "B" and socket.type == 'INT')
+
+    is_viewport = nodes.new('GeometryNodeIsViewport')
+
+    hide = nodes.new('FunctionNodeBooleanMath')
+    hide.operation = 'AND'
+
+    delete = nodes.new('GeometryNodeDeleteGeometry')
+    delete.domain = 'POINT'
+
+    mesh_to_points = nodes.new('GeometryNodeMeshToPoints')
+
+    links.new(lod.outputs["Attribute"], compare_a)
+    links.new(group_input.outputs["Viewport Level"], compare_b)
+    links.new(is_viewport.outputs["Is Viewport"], hide.inputs[0])
+    links.new(compare.outputs["Result"], hide.inputs[1])
+    links.new(group_input.outputs["Geometry"], delete.inputs["Geometry"])
+    links.new(hide.outputs["Boolean"], delete.inputs["Selection"])
+    links.new(delete.outputs["Geometry"], mesh_to_points.inputs["Mesh"])
+    links.new(group_input.outputs["Radius"], mesh_to_points.inputs["Radius"])
+    links.new(mesh_to_points.outputs["Points"], group_output.inputs["Geometry"])
+
+    for x, node in enumerate((group_input, lod, compare, hide, delete, mesh_to_points, group_output)):
+        node.location = (x * 200, 0)
+    is_viewport.location = (200, -200)
+
+    return group
+
+def add_point_cloud_lod(obj, levels, radius, recompute=True):
+    """Store per-point levels of detail on the mesh and draw it as points, coarse in the viewport and full in renders
+
+    Reuses the modifier and the levels from a previous import, the levels are only recomputed when `recompute` is set
+    or the number of levels changed.
+    """
+    mesh = obj.data
+    if recompute or "lod" not in mesh.attributes or mesh.get("colmap_lod_levels") != levels:
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", positions)
+        lod = voxel_lod(positions.reshape(-1, 3), levels)
+
+        attribute = mesh.attributes.get("lod")
+        if attribute is not None:
+            mesh.attributes.remove(attribute)
+        mesh.attributes.new(name="lod", type='INT', domain='POINT').data.foreach_set("value", lod)
+        mesh["colmap_lod_levels"] = levels
+
+    modifier = obj.modifiers.get("Point Cloud LOD")
+    if modifier is None:
+        modifier = obj.modifiers.new("Point Cloud LOD", 'NODES')
+    modifier.node_group = point_cloud_lod_node_group()
+    # edit mode keeps working on the full cloud, so picking vertices is unaffected
+    modifier.show_in_editmode = False
+    for item in modifier.node_group.interface.items_tree:
+        match item.name:
+            case "Viewport Level":
+                modifier[item.identifier] = levels - 1
+            case "Radius":
+                modifier[item.identifier] = radius
+
+def rotation_matrices_to_quaternions(rotations):
+    """Convert (N, 3, 3) rotation matrices to (N, 4) WXYZ quaternions
+
+    Uses Shepperd's method: the largest of w, x, y and z comes from the diagonal, and the other three
+    from the off-diagonal sums and differences divided by it, so no component is ever derived from a value near zero.
+    """
+    m = rotations
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    # 4w², 4x², 4y², 4z²
+    squares = np.stack((1.0 + trace, 1.0 + 2.0 * m[:, 0, 0] - trace, 1.0 + 2.0 * m[:, 1, 1] - trace, 1.0 + 2.0 * m[:, 2, 2] - trace), axis=1)
+    largest = np.argmax(squares, axis=1)
+    # 4 * the largest component
+    s = 2.0 * np.sqrt(np.maximum(np.take_along_axis(squares, largest[:, None], axis=1)[:, 0], 1e-12))
+
+    dx, dy, dz = m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]
+    sxy, sxz, syz = m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1]
+    # one row of 4 * component * the largest component per case, the diagonal entries are 4 * the largest component²
+    candidates = np.stack((
+        np.stack((s * s / 4.0, dx, dy, dz), axis=1),
+        np.stack((dx, s * s / 4.0, sxy, sxz), axis=1),
+        np.stack((dy, sxy, s * s / 4.0, syz), axis=1),
+        np.stack((dz, sxz, syz, s * s / 4.0), axis=1),
+    ), axis=1)
+    quaternions = np.take_along_axis(candidates, largest[:, None, None], axis=1)[:, 0] / s[:, None]
+    return quaternions / np.linalg.norm(quaternions, axis=1, keepdims=True)
+
+def camera_world_poses(rotations, translations):
+    """Convert COLMAP `cam_from_world` rotations (N, 3, 3) and translations (N, 3) to Blender camera poses
+
+    Returns `(locations, quaternions)` of shape (N, 3) and (N, 4), with quaternions in WXYZ order.
+    """
+    # world_from_cam = inverse(cam_from_world)
+    world_rotations = rotations.transpose(0, 2, 1)
+    locations = -np.einsum('nij,nj->ni', world_rotations, translations)
+
+    # convert COLMAP camera axes (x right, y down, z front) to Blender camera axes (x right, y up, z back)
+    # rotating 180° about X flips Y and Z (equivalent to diag(1,-1,-1))
+    world_rotations = world_rotations * np.array([1.0, -1.0, -1.0])
+
+    quaternions = rotation_matrices_to_quaternions(world_rotations)
+
+    # q and -q are the same rotation, keep neighbouring keys in the same hemisphere so interpolation takes the short path
+    if len(quaternions) > 1:
+        signs = np.sign(np.einsum('ni,ni->n', quaternions[1:], quaternions[:-1]))
+        signs[signs == 0] = 1
+        quaternions[1:] *= np.cumprod(signs)[:, None]
+
+    return locations, quaternions
+
+def new_action_fcurves(id_data, name):
+    """Assign a new action to `id_data` and return the F-curve collection to fill"""
+    anim_data = id_data.animation_data_create()
+    action = bpy.data.actions.new(name)
+    anim_data.action = action
+    slot = action.slots.new(id_type=id_data.id_type, name=id_data.name)
+    anim_data.action_slot = slot
+    strip = action.layers.new("Layer").strips.new(type='KEYFRAME')
+    return strip.channelbag(slot, ensure=True).fcurves
+
+def action_fcurves(id_data, name):
+    """The F-curve collection of the action assigned to `id_data`, or of a new one if it has none"""
+    anim_data = id_data.animation_data
+    if anim_data is not None and anim_data.action is not None and anim_data.action_slot is not None:
+        layers = anim_data.action.layers
+        if len(layers) > 0 and len(layers[0].strips) > 0:
+            return layers[0].strips[0].channelbag(anim_data.action_slot, ensure=True).fcurves
+    return new_action_fcurves(id_data, name)
+
+def set_keyframes(fcurves, data_path, index, frames, values):
+    """Fill all keyframes of an F-curve at once
+
+    An existing F-curve is reused, and left untouched when its keyframes are already the same.
+    """
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0] = frames
+    co[:, 1] = values
+
+    fcurve = fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = fcurves.new(data_path, index=index)
+    elif len(fcurve.keyframe_points) == len(frames):
+        current = np.empty(len(frames) * 2, dtype=np.float32)
+        fcurve.keyframe_points.foreach_get("co", current)
+        if np.array_equal(current, co.ravel()):
+            return fcurve
+    else:
+        fcurve.keyframe_points.clear()
+
+    if len(fcurve.keyframe_points) != len(frames):
+        fcurve.keyframe_points.add(len(frames))
+    fcurve.keyframe_points.foreach_set("co", co.ravel())
+    fcurve.update()
+    return fcurve
+
+def tracking_object(clip, role):
+    """The object a previous `Setup Tracking Scene` created for `clip` with `role`, or `None`"""
+    return next((obj for obj in bpy.data.objects if obj.get("colmap_clip") == clip and obj.get("colmap_role") == role), None)
+
+SOLVE_PREVIEW_PATH = "Solve Preview Path"
+SOLVE_PREVIEW_POINTS = "Solve Preview Points"
+
+def update_solve_preview(model):
+    """Show the camera path and points of an in-progress `Model` in the viewport"""
+    frames = np.array([int(os.path.splitext(os.path.basename(name))[0]) for name in model.image_names], dtype=np.int64)
+    order = np.argsort(frames)
+    locations, _ = camera_world_poses(model.rotation_matrices()[order], model.translations[order])
+
+    path_obj = bpy.data.objects.get(SOLVE_PREVIEW_PATH)
+    if path_obj is None:
+        curve = bpy.data.curves.new(SOLVE_PREVIEW_PATH, 'CURVE')
+        curve.dimensions = '3D'
+        path_obj = bpy.data.objects.new(SOLVE_PREVIEW_PATH, curve)
+        path_obj.hide_render = True
+        bpy.context.scene.collection.objects.link(path_obj)
+    curve = path_obj.data
+    curve.splines.clear()
+    if len(locations) > 0:
+        spline = curve.splines.new('POLY')
+        spline.points.add(len(locations) - 1)
+        points = np.ones((len(locations), 4), dtype=np.float32)
+        points[:, :3] = locations
+        spline.points.foreach_set("co", points.ravel())
+
+    points_obj = bpy.data.objects.get(SOLVE_PREVIEW_POINTS)
+    if points_obj is None:
+        points_obj = bpy.data.objects.new(SOLVE_PREVIEW_POINTS, bpy.data.meshes.new(SOLVE_PREVIEW_POINTS))
+        points_obj.hide_render = True
+        bpy.context.scene.collection.objects.link(points_obj)
+    mesh = points_obj.data
+    mesh.clear_geometry()
+    if "Color" in mesh.color_attributes:
+        mesh.color_attributes.remove(mesh.color_attributes["Color"])
+    colors = np.ones((model.num_points3D, 4), dtype=np.float32)
+    colors[:, :3] = model.rgb / 255.0
+    fill_point_cloud(mesh, model.xyz, colors)
+
+def remove_solve_preview():
+    for name in (SOLVE_PREVIEW_PATH, SOLVE_PREVIEW_POINTS):
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            continue
+        data = obj.data
+        bpy.data.objects.remove(obj)
+        if isinstance(data, bpy.types.Curve):
+            bpy.data.curves.remove(data)
+        else:
+            bpy.data.meshes.remove(data)
+
+def setup_tracking_scene(context, clip, report):
+    """Load the selected models of a clip as a keyed camera and a point cloud, updating a previous import in place
+
+    `report` is called like `Operator.report` for problems that do not stop the setup.
+    """
+    _, _, reconstruction_path = workspace_paths(clip)
+
+    models = load_models(reconstruction_path, clip.colmap.model, filtered=clip.colmap.use_filtered)
+
+    # objects from a previous import of this clip are updated in place, so the root keeps the user's origin, floor and scale
+    root_empty = tracking_object(clip, 'ROOT')
+    if root_empty is None:
         root_empty = bpy.data.objects.new("Track Root", None)
+        root_empty["colmap_clip"] = clip
+        root_empty["colmap_role"] = 'ROOT'
         bpy.context.collection.objects.link(root_empty)
 
-        # create point cloud
-        positions = []
-        colors = []
-        for point in reconstruction.points3D.values():
-            positions.append(point.xyz.tolist())
-            colors.append((point.color / 255.0).tolist()) # NOTE: GLOMAP doesn't produce colors yet, COLMAP's mapper does
+    # create point cloud
+    positions, colors = point_cloud_arrays(models)
+    obj = tracking_object(clip, 'POINTS')
+    if obj is None:
         mesh = bpy.data.meshes.new("Track Point Cloud")
         obj = bpy.data.objects.new("Track Point Cloud", mesh)
+        obj["colmap_clip"] = clip
+        obj["colmap_role"] = 'POINTS'
         bpy.context.collection.objects.link(obj)
-        
-        obj.parent = root_empty
-        obj.hide_render = True
-
-        mesh.from_pydata(positions, [], [])  # only verts, no edges/faces
-        mesh.update()
-        color_layer = mesh.color_attributes.new(name="Color", domain='POINT', type='BYTE_COLOR')
-        for i, c in enumerate(colors):
-            color_layer.data[i].color = (*c, 1.0)  # RGBA
-        
-        obj.lock_location = (True, True, True)
-        obj.lock_rotation = (True, True, True)
-        obj.lock_scale = (True, True, True)
+    mesh = obj.data
+
+    obj.parent = root_empty
+    obj.hide_render = True
+
+    positions_changed = update_point_cloud(mesh, positions, colors)
+    if clip.colmap.point_cloud_type == 'POINTS':
+        add_point_cloud_lod(obj, clip.colmap.lod_levels, clip.colmap.point_radius, recompute=positions_changed)
+        obj.hide_render = False
+    elif "Point Cloud LOD" in obj.modifiers:
+        obj.modifiers.remove(obj.modifiers["Point Cloud LOD"])
 
-        # create camera
+    obj.lock_location = (True, True, True)
+    obj.lock_rotation = (True, True, True)
+    obj.lock_scale = (True, True, True)
+
+    # create camera
+    camera_obj = tracking_object(clip, 'CAMERA')
+    if camera_obj is None:
         camera = bpy.data.cameras.new("Track Camera")
-        camera.show_background_images = True
+        camera_obj = bpy.data.objects.new("Track Camera", camera)
+        camera_obj["colmap_clip"] = clip
+        camera_obj["colmap_role"] = 'CAMERA'
+        bpy.context.collection.objects.link(camera_obj)
+    camera = camera_obj.data
+
+    camera.show_background_images = True
+    if not any(bg.source == 'MOVIE_CLIP' and bg.clip == clip for bg in camera.background_images):
         bg = camera.background_images.new()
         bg.source = 'MOVIE_CLIP'
         bg.clip = clip
 
-        camera_obj = bpy.data.objects.new("Track Camera", camera)
-        camera_obj.rotation_mode = 'QUATERNION'
-        bpy.context.collection.objects.link(camera_obj)
-        camera_obj.parent = root_empty
+    camera_obj.rotation_mode = 'QUATERNION'
+    camera_obj.parent = root_empty
 
-        context.scene.camera = camera_obj
+    context.scene.camera = camera_obj
 
-        for _, image in reconstruction.images.items():
-            # images are always named as {frame}.tiff
-            frame = int(os.path.splitext(os.path.basename(image.name))[0])
+    # transfer the intrinsics of the camera most images were solved with to the clip
+    model = models[0]
+    camera_index = np.bincount(model.camera_indices()).argmax()
+    try:
+        settings = tracking_camera_settings(
+            int(model.camera_model_ids[camera_index]),
+            model.camera_params[camera_index],
+            int(model.camera_widths[camera_index]),
+            int(model.camera_heights[camera_index]),
+        )
+    except Exception as e:
+        report({'WARNING'}, str(e))
+    else:
+        clip.tracking.camera.sensor_width = camera.sensor_width
+        for key, value in settings.items():
+            setattr(clip.tracking.camera, key, value)
+
+    # merged models share frames, the first (largest) model wins
+    frames, rotations, translations, lenses = [], [], [], []
+    seen_frames = set()
+    for model in models:
+        # images are always named as {frame}.tiff
+        model_frames = np.array([int(os.path.splitext(os.path.basename(name))[0]) for name in model.image_names], dtype=np.int64)
+        new = np.array([frame not in seen_frames for frame in model_frames.tolist()], dtype=bool)
+        seen_frames.update(model_frames.tolist())
+        frames.append(model_frames[new])
+        rotations.append(model.rotation_matrices()[new])
+        translations.append(model.translations[new])
+        # convert focal length to mm
+        lenses.append((model.focal_lengths() * (camera.sensor_width / model.image_widths()))[new])
+    frames = np.concatenate(frames)
+    order = np.argsort(frames)
+    frames = frames[order].astype(np.float32)
+    rotations = np.concatenate(rotations)[order]
+    translations = np.concatenate(translations)[order]
+    lenses = np.concatenate(lenses)[order]
+
+    locations, quaternions = camera_world_poses(rotations, translations)
+
+    if len(frames) > 0:
+        camera.lens = lenses[0]
+        camera_obj.location = locations[0]
+        camera_obj.rotation_quaternion = quaternions[0]
+
+    # key every frame in bulk instead of calling `keyframe_insert` per frame
+    fcurves = action_fcurves(camera_obj, "Track Camera Action")
+    for index in range(3):
+        set_keyframes(fcurves, "location", index, frames, locations[:, index])
+    for index in range(4):
+        set_keyframes(fcurves, "rotation_quaternion", index, frames, quaternions[:, index])
+
+    # only key the lens where the focal length changes, keeping both ends of each constant run
+    changed = np.ones(len(lenses), dtype=bool)
+    changed[1:-1] = (lenses[1:-1] != lenses[:-2]) | (lenses[1:-1] != lenses[2:])
+    if len(lenses) > 1 and np.all(lenses == lenses[0]):
+        changed[1:] = False
+    set_keyframes(action_fcurves(camera, "Track Camera Lens Action"), "lens", 0, frames[changed], lenses[changed])
+
+class ColmapSetupTrackingSceneOperator(bpy.types.Operator):
+    bl_idname = "colmap.setup_tracking_scene"
+    bl_label = "Setup Tracking Scene"
+    bl_description = "Load the tracking data as a Camera and point cloud"
 
-            # convert focal length to mm
-            camera.lens = image.camera.focal_length_x * (camera.sensor_width / image.camera.width)
+    def execute(self, context):
+        try:
+            setup_tracking_scene(context, context.space_data.clip, self.report)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        return {'FINISHED'}
 
-            # get cam -> world transform
-            world_from_cam = image.cam_from_world().inverse()
+class ColmapFilterPointsOperator(BlockingOperator):
+    bl_idname = "colmap.filter_points"
+    bl_label = "Filter Points"
+    bl_description = "Remove unreliable 3D points and write a filtered version of every model, which is loaded instead when Filtered Points is enabled"
 
-            # build Blender 4x4 matrix from pycolmap rotation & translation
-            # world_from_cam.rotation.matrix() is a 3x3 numpy array-like
-            R = world_from_cam.rotation.matrix()
-            t = world_from_cam.translation  # numpy (3,)
+    parse_logs = False
 
-            rot_mat = mathutils.Matrix((
-                (float(R[0,0]), float(R[0,1]), float(R[0,2])),
-                (float(R[1,0]), float(R[1,1]), float(R[1,2])),
-                (float(R[2,0]), float(R[2,1]), float(R[2,2])),
-            ))
-            mat = rot_mat.to_4x4()
-            mat.translation = mathutils.Vector((float(t[0]), float(t[1]), float(t[2])))
+    def prepare(self, context):
+        sc = context.space_data
+        clip = sc.clip
 
-            # convert COLMAP camera axes (x right, y down, z front) to Blender camera axes (x right, y up, z back)
-            # rotating 180° about X flips Y and Z (equivalent to diag(1,-1,-1))
-            flip_x180 = mathutils.Matrix.Rotation(math.pi, 4, 'X')
-            blender_world_mat = mat @ flip_x180
+        _, _, reconstruction_path = workspace_paths(clip)
 
-            # apply transform
-            camera_obj.matrix_world = blender_world_mat
+        model_paths = list_models(reconstruction_path)
+        if len(model_paths) == 0:
+            raise Exception("No reconstruction found, solve camera motion first")
 
-            # insert keyframe for transform
-            camera.keyframe_insert(data_path="lens", frame=frame)
-            camera_obj.keyframe_insert(data_path="location", frame=frame)
-            camera_obj.keyframe_insert(data_path="rotation_quaternion", frame=frame)
+        return ({
+            'model_paths': model_paths,
+            'options': clip.colmap.filter_points.build(),
+        },)
 
+    def execute_async(self, args):
+        self._progress_total = len(args['model_paths'])
+        num_points, num_kept = 0, 0
+        for i, model_path in enumerate(args['model_paths']):
+            self._message = f"Filtering model {model_path.name}"
+            model = read_model(model_path, tracks=True)
+            keep = filter_points(model, **args['options'])
+            write_model(model.select_points(keep), model_path / "filtered", model_path)
+            num_points += model.num_points3D
+            num_kept += int(np.count_nonzero(keep))
+            self._progress_current = i + 1
+        print(f"Kept {num_kept} of {num_points} points")
         return {'FINISHED'}
 
+class ColmapUndistortFramesOperator(BlockingOperator):
+    bl_idname = "colmap.undistort_frames"
+    bl_label = "Undistort Frames"
+    bl_description = "Write undistorted copies of all frames using the solved lens distortion"
+
+    parse_logs = False
+
+    def prepare(self, context):
+        sc = context.space_data
+        clip = sc.clip
+
+        _, images_path, reconstruction_path = prepare_database(clip)
+
+        model_path = selected_model_path(reconstruction_path, clip.colmap.model)
+        if model_path is None:
+            raise Exception("No reconstructed model found")
+        model = read_model(model_path)
+        camera_index = np.bincount(model.camera_indices()).argmax()
+
+        return ({
+            'frame_paths': sorted(images_path.glob("*.tiff")),
+            'output_path': clip_path(clip) / "undistorted",
+            'model_id': int(model.camera_model_ids[camera_index]),
+            'params': model.camera_params[camera_index],
+            'width': int(model.camera_widths[camera_index]),
+            'height': int(model.camera_heights[camera_index]),
+        },)
+
+    def execute_async(self, args):
+        self._progress_total = len(args['frame_paths'])
+        def on_progress(current, total):
+            self._progress_current = current
+        undistort_frames(**args, on_progress=on_progress)
+        return {'FINISHED'}
+
+TRACK_PREFIX = "COLMAP "
+
+def best_tracks(model, count, min_track_length, max_error):
+    """Indices of the `count` best points, longest tracks first and lowest error among equal lengths"""
+    candidates = np.flatnonzero((model.track_lengths >= min_track_length) & (model.errors <= max_error))
+    order = np.lexsort((model.errors[candidates], -model.track_lengths[candidates].astype(np.int64)))
+    return candidates[order[:count]]
+
+def track_markers(model, point_indices):
+    """Gather the observations of the given points as marker arrays
+
+    The model must be read with `tracks=True`.
+    Returns `(offsets, frames, coords)`, with the markers of the `i`th point at `offsets[i]:offsets[i + 1]`, sorted by frame.
+    Coordinates are normalized with the origin at the bottom left, like `MovieTrackingMarker.co`.
+    """
+    starts = model.track_offsets[point_indices]
+    lengths = model.track_offsets[point_indices + 1] - starts
+    slots = np.repeat(np.arange(len(point_indices)), lengths)
+    elements = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+
+    order = np.argsort(model.image_ids)
+    image_indices = order[np.searchsorted(model.image_ids, model.track_image_ids[elements], sorter=order)]
+
+    # images are always named as {frame}.tiff
+    image_frames = np.array([int(os.path.splitext(os.path.basename(name))[0]) for name in model.image_names], dtype=np.int64)
+    points2D_offsets = np.concatenate(([0], np.cumsum([len(points2D) for points2D in model.image_points2D]))).astype(np.int64)
+    xy = np.concatenate([points2D['xy'] for points2D in model.image_points2D])[points2D_offsets[image_indices] + model.track_point2D_idxs[elements]]
+
+    camera_indices = model.camera_indices()[image_indices]
+    coords = np.stack((
+        xy[:, 0] / model.camera_widths[camera_indices],
+        1.0 - xy[:, 1] / model.camera_heights[camera_indices],
+    ), axis=1)
+    frames = image_frames[image_indices]
+
+    # sort each track by frame, keeping a single observation per frame
+    order = np.lexsort((frames, slots))
+    slots, frames, coords = slots[order], frames[order], coords[order]
+    unique = np.ones(len(frames), dtype=bool)
+    unique[1:] = (slots[1:] != slots[:-1]) | (frames[1:] != frames[:-1])
+    slots, frames, coords = slots[unique], frames[unique], coords[unique]
+
+    offsets = np.searchsorted(slots, np.arange(len(point_indices) + 1))
+    return offsets, frames, coords
+
+TRACK_SELECTION = ("select_anchor", "select_pattern", "select_search")
+
+def delete_tracks(clip, names):
+    """Delete the camera tracks with the given names from the clip in the clip editor, keeping the selection as it was
+
+    There is no Python API to remove a track, and `clip.delete_track` removes every selected track and plane track
+    of the active tracking object, so only the tracks to delete are selected while it runs.
+    """
+    tracking = clip.tracking
+    camera = next(obj for obj in tracking.objects if obj.is_camera)
+    tracks = camera.tracks
+    plane_tracks = camera.plane_tracks
+
+    active_object = tracking.objects.active
+    active_track = tracks.active.name if tracks.active is not None and tracks.active.name not in names else None
+    selection = {track.name: [getattr(track, key) for key in TRACK_SELECTION] for track in tracks if track.name not in names}
+    plane_selection = [plane_track.select for plane_track in plane_tracks]
+
+    try:
+        tracking.objects.active = camera
+        tracks.foreach_set("select", [track.name in names for track in tracks])
+        plane_tracks.foreach_set("select", [False] * len(plane_tracks))
+        bpy.ops.clip.delete_track()
+    finally:
+        tracking.objects.active = active_object
+        for track in tracks:
+            for key, value in zip(TRACK_SELECTION, selection.get(track.name, (False,) * len(TRACK_SELECTION))):
+                setattr(track, key, value)
+        plane_tracks.foreach_set("select", plane_selection)
+        if active_track is not None:
+            tracks.active = tracks[active_track]
+
+class ColmapExportTracksOperator(bpy.types.Operator):
+    bl_idname = "colmap.export_tracks"
+    bl_label = "Export Tracks"
+    bl_description = "Create 2D tracks in the clip from the best reconstructed points, replacing previously exported tracks"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    count: bpy.props.IntProperty(name="Tracks", default=500, min=1, description="Number of tracks to export")
+    min_track_length: bpy.props.IntProperty(name="Min Track Length", default=10, min=2, description="Skip points seen in fewer frames")
+    max_error: bpy.props.FloatProperty(name="Max Error", default=2.0, min=0, description="Skip points with a larger reprojection error in pixels")
+
+    @classmethod
+    def poll(cls, context):
+        # previously exported tracks are deleted through `clip.delete_track`, which only runs in the clip editor
+        sc = context.space_data
+        return sc is not None and sc.type == 'CLIP_EDITOR' and sc.clip is not None
+
+    def execute(self, context):
+        sc = context.space_data
+        clip = sc.clip
+
+        _, _, reconstruction_path = workspace_paths(clip)
+
+        # merged models are aligned in memory without their observations, so tracks come from a single model
+        model_path = selected_model_path(reconstruction_path, clip.colmap.model)
+        if model_path is None:
+            self.report({'ERROR'}, "No reconstructed model found")
+            return {'CANCELLED'}
+        if clip.colmap.use_filtered:
+            model_path = filtered_model_path(model_path)
+        model = read_model(model_path, tracks=True)
+
+        point_indices = best_tracks(model, self.count, self.min_track_length, self.max_error)
+        offsets, frames, coords = track_markers(model, point_indices)
+
+        tracks = clip.tracking.tracks
+        previous = {track.name for track in tracks if track.name.startswith(TRACK_PREFIX)}
+        if len(previous) > 0:
+            delete_tracks(clip, previous)
+
+        bundles = {}
+        for i, point_index in enumerate(point_indices):
+            track_frames = frames[offsets[i]:offsets[i + 1]]
+            track_coords = coords[offsets[i]:offsets[i + 1]]
+            if len(track_frames) == 0:
+                continue
+
+            # a disabled marker ends each run of frames, so the track does not hold its last position through gaps
+            gaps = track_frames[1:] != track_frames[:-1] + 1
+            disabled_frames = np.concatenate((track_frames[:-1][gaps] + 1, track_frames[-1:] + 1))
+            marker_frames = np.concatenate((track_frames, disabled_frames))
+            marker_coords = np.concatenate((track_coords, track_coords[np.concatenate((np.flatnonzero(gaps), [len(track_frames) - 1]))]))
+            marker_mute = np.concatenate((np.zeros(len(track_frames), dtype=bool), np.ones(len(disabled_frames), dtype=bool)))
+            order = np.argsort(marker_frames, kind='stable')
+
+            point_id = int(model.point_ids[point_index])
+            track = tracks.new(name=f"{TRACK_PREFIX}{point_id}", frame=int(marker_frames[order[0]]))
+            # there is no bulk marker allocation, inserting in frame order appends, then every field is written in one call
+            for frame in marker_frames[order[1:]].tolist():
+                track.markers.insert(frame)
+            track.markers.foreach_set("co", marker_coords[order].astype(np.float32).ravel())
+            track.markers.foreach_set("mute", marker_mute[order].tolist())
+
+            bundles[track.name] = model.xyz[point_index].tolist()
+
+        # the track bundle is read-only in Python, so exported tracks are linked to their 3D points by name,
+        # in the same coordinates as the point cloud from `Setup Tracking Scene`
+        clip["colmap_bundles"] = bundles
+
+        self.report({'INFO'}, f"Exported {len(bundles)} tracks")
+        return {'FINISHED'}
+
+def object_points(obj, selected_only=True):
+    """World-space vertex positions of a mesh object, read in bulk, as a float64 (N, 3) array"""
+    vertices = obj.data.vertices
+    positions = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", positions)
+    positions = positions.reshape(-1, 3).astype(np.float64)
+    if selected_only:
+        select = np.empty(len(vertices), dtype=bool)
+        vertices.foreach_get("select", select)
+        positions = positions[select]
+    matrix = np.array(obj.matrix_world)
+    return positions @ matrix[:3, :3].T + matrix[:3, 3]
+
+def fit_plane(points, iterations=256, threshold=None, up=None, max_tilt=np.pi, above=None, sample_size=50000, seed=0):
+    """Fit a plane to noisy points with RANSAC, refined by least squares on the inliers
+
+    All candidate planes are built and scored at once on a random subset of at most `sample_size` points.
+    With `up`, only planes whose normal is within `max_tilt` radians of it are considered,
+    and with `above` as well, only planes that have the point `above` on the side `up` points to.
+    The default `threshold` is 1% of the extent of the points.
+
+    Returns `(normal, centroid, inliers)`.
+    """
+    if len(points) < 3:
+        raise Exception("At least 3 points are needed to fit a plane")
+    rng = np.random.default_rng(seed)
+
+    if threshold is None:
+        # ignore far outliers when measuring the extent
+        threshold = 0.01 * np.linalg.norm(np.percentile(points, 98, axis=0) - np.percentile(points, 2, axis=0))
+        threshold = max(threshold, 1e-9)
+
+    sample = points if len(points) <= sample_size else points[rng.choice(len(points), sample_size, replace=False)]
+    triplets = sample[rng.integers(0, len(sample), size=(iterations, 3))]
+    normals = np.cross(triplets[:, 1] - triplets[:, 0], triplets[:, 2] - triplets[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    candidates = lengths > 1e-12
+    normals[candidates] /= lengths[candidates, None]
+    if up is not None:
+        candidates &= np.abs(normals @ up) >= np.cos(max_tilt)
+        if above is not None:
+            # a level plane above the point, like a ceiling, would otherwise win as often as the floor
+            candidates &= np.einsum('ij,ij->i', above - triplets[:, 0], normals) * (normals @ up) > 0
+    if not np.any(candidates):
+        raise Exception("No plane found, the points may be collinear or the tilt too strict")
+    normals = normals[candidates]
+    offsets = np.einsum('ij,ij->i', normals, triplets[candidates, 0])
+
+    # score the candidates in chunks to bound the size of the distance matrix
+    counts = np.empty(len(normals), dtype=np.int64)
+    for start in range(0, len(normals), 32):
+        distances = np.abs(sample @ normals[start:start + 32].T - offsets[start:start + 32])
+        counts[start:start + 32] = (distances < threshold).sum(axis=0)
+    best = np.argmax(counts)
+
+    inliers = np.abs(points @ normals[best] - offsets[best]) < threshold
+    centroid = points[inliers].mean(axis=0)
+    _, _, vt = np.linalg.svd(points[inliers] - centroid, full_matrices=False)
+    normal = vt[-1]
+    if normal @ normals[best] < 0:
+        normal = -normal
+    return normal, centroid, inliers
+
+def split_clusters(points):
+    """Split points into two groups at the largest gap along their main axis"""
+    centered = points - points.mean(axis=0)
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    projection = centered @ vt[0]
+    order = np.argsort(projection)
+    split = np.argmax(np.diff(projection[order])) + 1
+    return points[order[:split]], points[order[split:]]
+
 class ColmapSetOriginOperator(bpy.types.Operator):
     bl_idname = "colmap.set_origin"
     bl_label = "Set Origin"
-    bl_description = "Set selected vertex as origin by moving the camera and point cloud in 3D space"
+    bl_description = "Set the median of the selected vertices as origin by moving the camera and point cloud in 3D space"
 
     def execute(self, context):
         camera = context.scene.camera
@@ -218,25 +1033,38 @@ class ColmapSetOriginOperator(bpy.types.Operator):
         if was_edit_mode:
             bpy.ops.object.mode_set(mode='OBJECT')
 
-        selected_vertex = next((v for v in active_object.data.vertices if v.select), None)
-        if selected_vertex is None:
+        selection = object_points(active_object)
+
+        if was_edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
+
+        if len(selection) == 0:
             self.report({'ERROR'}, "Select a vertex to mark the scene origin point")
-            return {'FINISHED'}
+            return {'CANCELLED'}
 
-        vert_world = active_object.matrix_world @ selected_vertex.co
-        translation = mathutils.Matrix.Translation(-vert_world)
+        # the median ignores stray points caught in the selection
+        origin = mathutils.Vector(np.median(selection, axis=0))
+        translation = mathutils.Matrix.Translation(-origin)
         
         track_root.matrix_world = translation @ track_root.matrix_world
-
-        if was_edit_mode:
-            bpy.ops.object.mode_set(mode='EDIT')
         
         return {'FINISHED'}
 
 class ColmapSetFloorOperator(bpy.types.Operator):
     bl_idname = "colmap.set_floor"
     bl_label = "Set Floor"
-    bl_description = "Select 3 vertices in the point cloud to use as the floor plane"
+    bl_description = "Fit the floor plane to the selected vertices, at least 3, and make it the ground at Z = 0"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    mode: bpy.props.EnumProperty(
+        name="Mode",
+        items=[
+            ('SELECTED', 'Selected', 'Fit the plane to the selected vertices'),
+            ('AUTO', 'Auto', 'Find the dominant plane below the camera across the whole point cloud'),
+        ],
+        default='SELECTED'
+    )
+    max_tilt: bpy.props.FloatProperty(name="Max Tilt", default=math.radians(30), min=0, max=math.radians(90), subtype='ANGLE', description="In auto mode, only consider planes that are within this angle of level with the camera")
 
     def execute(self, context):
         camera = context.scene.camera
@@ -248,43 +1076,46 @@ class ColmapSetFloorOperator(bpy.types.Operator):
         if was_edit_mode:
             bpy.ops.object.mode_set(mode='OBJECT')
 
-        mesh = active_object.data
+        points = object_points(active_object, selected_only=self.mode == 'SELECTED')
+
+        if was_edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
 
-        selection = [active_object.matrix_world @ v.co for v in mesh.vertices if v.select]
-        if len(selection) != 3:
-            self.report({'ERROR'}, f"Select 3 vertices in the point cloud")
-            if was_edit_mode:
-                bpy.ops.object.mode_set(mode='EDIT')
+        if self.mode == 'SELECTED' and len(points) < 3:
+            self.report({'ERROR'}, f"Select at least 3 vertices in the point cloud")
             return {'CANCELLED'}
 
-        p1, p2, p3 = selection
+        camera_matrix = np.array(camera.matrix_world)
+        # the camera's local Y is up in its view
+        up = camera_matrix[:3, 1] / np.linalg.norm(camera_matrix[:3, 1]) if self.mode == 'AUTO' else None
+        try:
+            normal, centroid, inliers = fit_plane(points, up=up, max_tilt=self.max_tilt, above=camera_matrix[:3, 3] if self.mode == 'AUTO' else None)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
 
-        normal = (p2 - p1).cross(p3 - p1)
-        normal.normalize()
-        if normal.z < 0:
+        # the camera is above the floor, which auto mode already requires of every candidate
+        if normal @ (camera_matrix[:3, 3] - centroid) < 0:
             normal = -normal
 
-        target = mathutils.Vector((0.0, 0.0, 1.0))
-
-        rot_quat = normal.rotation_difference(target)
+        rot_quat = mathutils.Vector(normal).rotation_difference(mathutils.Vector((0.0, 0.0, 1.0)))
 
-        orig_loc = active_object.matrix_world.to_translation()
-        orig_basis = active_object.matrix_world.to_3x3()
-
-        rot_mat = rot_quat.to_matrix()
-        new_basis = rot_mat @ orig_basis
-
-        track_root.matrix_world = mathutils.Matrix.Translation(orig_loc) @ new_basis.to_4x4()
-
-        if was_edit_mode:
-            bpy.ops.object.mode_set(mode='EDIT')
+        # rotate about the floor, then move it down to Z = 0
+        pivot = mathutils.Vector(centroid)
+        track_root.matrix_world = (
+            mathutils.Matrix.Translation((pivot.x, pivot.y, 0.0))
+            @ rot_quat.to_matrix().to_4x4()
+            @ mathutils.Matrix.Translation(-pivot)
+            @ track_root.matrix_world
+        )
 
+        self.report({'INFO'}, f"Floor fitted to {np.count_nonzero(inliers)} of {len(points)} points")
         return {'FINISHED'}
 
 class ColmapSetScaleOperator(bpy.types.Operator):
     bl_idname = "colmap.set_scale"
     bl_label = "Set Scale"
-    bl_description = "Select 3 vertices in the point cloud to use as the floor plane"
+    bl_description = "Select two points, or two groups of vertices, a known distance apart to scale the scene"
 
     distance: bpy.props.FloatProperty(name="Distance", description="Distance between two vertices used for scene scaling", default=1)
 
@@ -298,17 +1129,24 @@ class ColmapSetScaleOperator(bpy.types.Operator):
         if was_edit_mode:
             bpy.ops.object.mode_set(mode='OBJECT')
 
-        selection = [active_object.matrix_world @ v.co for v in active_object.data.vertices if v.select]
-        if len(selection) != 2:
-            self.report({'ERROR'}, f"Exactly 2 vertices must be selected (found {len(sel_verts)}).")
-            if was_edit_mode:
-                bpy.ops.object.mode_set(mode='EDIT')
+        selection = object_points(active_object)
+
+        if was_edit_mode:
+            bpy.ops.object.mode_set(mode='EDIT')
+
+        if len(selection) < 2:
+            self.report({'ERROR'}, f"At least 2 vertices must be selected (found {len(selection)}).")
             return {'CANCELLED'}
 
-        # world-space positions
-        p1, p2 = selection
+        # each end of the measurement is the median of its group of vertices
+        first, second = split_clusters(selection)
+        p1 = mathutils.Vector(np.median(first, axis=0))
+        p2 = mathutils.Vector(np.median(second, axis=0))
 
         current_dist = (p1 - p2).length
+        if current_dist == 0:
+            self.report({'ERROR'}, "The selected vertices are at the same position")
+            return {'CANCELLED'}
 
         target = float(self.distance)
 
@@ -319,10 +1157,191 @@ class ColmapSetScaleOperator(bpy.types.Operator):
         S = mathutils.Matrix.Scale(scale_factor, 4)
 
         # Apply transform about pivot: M' = T(pivot) * S * T(-pivot) * M
-        track_root.matrix_world = mathutils.Matrix.Translation(pivot) @ S @ mathutils.Matrix.Translation(-pivot) @ active_object.matrix_world
+        track_root.matrix_world = mathutils.Matrix.Translation(pivot) @ S @ mathutils.Matrix.Translation(-pivot) @ track_root.matrix_world
 
-        if was_edit_mode:
-            bpy.ops.object.mode_set(mode='EDIT')
+        return {'FINISHED'}
+
+class ColmapCompactDatabaseOperator(BlockingOperator):
+    bl_idname = "colmap.compact_database"
+    bl_label = "Compact Database"
+    bl_description = "Remove data the solvers no longer need from the database and shrink the file"
+
+    parse_logs = False
+
+    _reclaimed = None
+
+    def prepare(self, context):
+        clip = context.space_data.clip
+        database_path = clip_path(clip) / "database.db"
+        if not database_path.exists():
+            raise Exception("There is no database to compact")
+        return (clip.colmap.compact.build(database_path),)
+
+    def execute_async(self, args):
+        self._reclaimed = compact_database(**args)
+
+    def modal(self, context, event):
+        clip = self._clip
+        result = super().modal(context, event)
+        if result == {'FINISHED'} and self._reclaimed is not None:
+            clip.colmap.cached_results.last_compaction = f"Reclaimed {format_bytes(self._reclaimed)}"
+            self.report({'INFO'}, f"Compacted database, reclaimed {format_bytes(self._reclaimed)}")
+            self._reclaimed = None
+        return result
+
+class ColmapEnforceStorageBudgetOperator(BlockingOperator):
+    bl_idname = "colmap.enforce_storage_budget"
+    bl_label = "Enforce Storage Budget"
+    bl_description = "Evict the least recently used frames, then descriptors, of all clips until they fit in the storage budget"
+
+    parse_logs = False
+    uses_workspace = False
+
+    _result = None
+
+    def prepare(self, context):
+        return (context.scene.colmap_storage.build(),)
+
+    def execute_async(self, args):
+        def on_progress(current, total):
+            self._progress_current = current
+            self._progress_total = total
+        self._result = enforce_storage_budget(**args, on_progress=on_progress)
+
+    def modal(self, context, event):
+        result = super().modal(context, event)
+        if result == {'FINISHED'} and self._result is not None:
+            usage, freed = self._result
+            storage = context.scene.colmap_storage
+            storage.last_usage = f"Using {format_bytes(usage)} of {storage.budget:.1f} GB"
+            self.report({'INFO'}, f"Freed {format_bytes(freed)}")
+            self._result = None
+        return result
+
+class ColmapSaveSnapshotOperator(BlockingOperator):
+    bl_idname = "colmap.save_snapshot"
+    bl_label = "Save Snapshot"
+    bl_description = "Save the current matches under a name, to switch back to them without matching again"
+
+    parse_logs = False
+
+    def prepare(self, context):
+        clip = context.space_data.clip
+        database_path = clip_path(clip) / "database.db"
+        if not database_path.exists():
+            raise Exception("Match features before saving a snapshot")
+        match_features = clip.colmap.match_features
+        return ({
+            'database_path': database_path,
+            'name': clip.colmap.snapshot_name if clip.colmap.snapshot_name.strip() != "" else match_features.matcher.lower(),
+            'settings': property_values(match_features),
+        },)
+
+    def execute_async(self, args):
+        save_snapshot(**args)
+
+class ColmapRestoreSnapshotOperator(BlockingOperator):
+    bl_idname = "colmap.restore_snapshot"
+    bl_label = "Restore Snapshot"
+    bl_description = "Replace the current matches with those of a snapshot"
+
+    parse_logs = False
+
+    name: bpy.props.StringProperty(name="Name")
+
+    def prepare(self, context):
+        clip = context.space_data.clip
+        return ({
+            'database_path': clip_path(clip) / "database.db",
+            'name': self.name,
+        },)
+
+    def execute_async(self, args):
+        restore_snapshot(**args)
+
+class ColmapDeleteSnapshotOperator(bpy.types.Operator):
+    bl_idname = "colmap.delete_snapshot"
+    bl_label = "Delete Snapshot"
+    bl_description = "Delete a saved snapshot of the matches"
+
+    name: bpy.props.StringProperty(name="Name")
+
+    def execute(self, context):
+        clip = context.space_data.clip
+
+        delete_snapshot(clip_path(clip) / "database.db", self.name)
+
+        refresh_cache(clip, force=True)
+
+        return {'FINISHED'}
+
+_preset_items = [] # Blender requires dynamic enum items to stay referenced from Python
+
+def preset_items(self, context):
+    _preset_items.clear()
+    for key, (name, description, _) in BUILTIN_PRESETS.items():
+        timings = preset_timings(key)
+        measured = f"Measured: {format_timings(timings)}" if timings is not None else "Not timed yet, run benchmarks/presets.py on a reference clip to measure it"
+        _preset_items.append((key, name, f"{description}. {measured}"))
+    for name in list_user_presets():
+        _preset_items.append((USER_PREFIX + name, name, "User preset"))
+    return _preset_items
+
+_user_preset_items = []
+
+def user_preset_items(self, context):
+    _user_preset_items.clear()
+    for name in list_user_presets():
+        _user_preset_items.append((name, name, "User preset"))
+    return _user_preset_items
+
+class ColmapApplyPresetOperator(bpy.types.Operator):
+    bl_idname = "colmap.apply_preset"
+    bl_label = "Apply Preset"
+    bl_description = "Set feature extraction, matching and both solvers to a consistent speed and quality trade-off"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    preset: bpy.props.EnumProperty(name="Preset", items=preset_items)
+
+    def execute(self, context):
+        clip = context.space_data.clip
+
+        try:
+            apply_preset(clip, self.preset)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+class ColmapSavePresetOperator(bpy.types.Operator):
+    bl_idname = "colmap.save_preset"
+    bl_label = "Save Preset"
+    bl_description = "Save the current feature, matching and solver settings as a user preset, available in every .blend file"
+
+    name: bpy.props.StringProperty(name="Name")
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        if self.name.strip() == "":
+            self.report({'ERROR'}, "Enter a name for the preset")
+            return {'CANCELLED'}
+
+        save_user_preset(context.space_data.clip, self.name)
+
+        return {'FINISHED'}
+
+class ColmapDeletePresetOperator(bpy.types.Operator):
+    bl_idname = "colmap.delete_preset"
+    bl_label = "Delete Preset"
+    bl_description = "Delete a user preset"
+
+    preset: bpy.props.EnumProperty(name="Preset", items=user_preset_items)
+
+    def execute(self, context):
+        delete_user_preset(self.preset)
 
         return {'FINISHED'}
 
@@ -335,36 +1354,49 @@ class ColmapRefreshCacheOperator(bpy.types.Operator):
         sc = context.space_data
         clip = sc.clip
 
-        refresh_cache(clip)
+        refresh_cache(clip, force=True)
 
         return {'FINISHED'}
 
-class ColmapClearCacheOperator(bpy.types.Operator):
-    bl_idname = "colmap.clear_cache"
-    bl_label = "Clear Cache"
-    bl_description = "Clear all cached data"
+class BaseClearOperator(BlockingOperator):
+    """Renames what it clears right away, then deletes it in the background with progress"""
 
-    def execute(self, context):
+    parse_logs = False
+
+    def clear(self, clip):
+        pass
+
+    def prepare(self, context):
         sc = context.space_data
         clip = sc.clip
 
-        clear_all(clip)
+        self.clear(clip)
 
-        return {'FINISHED'}
+        return (clip_path(clip),)
 
-class ColmapClearFeatureExtractionOperator(bpy.types.Operator):
+    def execute_async(self, path):
+        self._message = "Deleting files"
+        def on_progress(current, total):
+            self._progress_current = current
+            self._progress_total = total
+        delete_tombstones(path, on_progress=on_progress)
+
+class ColmapClearCacheOperator(BaseClearOperator):
+    bl_idname = "colmap.clear_cache"
+    bl_label = "Clear Cache"
+    bl_description = "Clear all cached data"
+
+    def clear(self, clip):
+        clear_all(clip)
+
+class ColmapClearFeatureExtractionOperator(BaseClearOperator):
     bl_idname = "colmap.clear_feature_extraction"
     bl_label = "Clear Feature Extraction"
     bl_description = "Clear all extracted features"
 
-    def execute(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
+    def clear(self, clip):
         clear_feature_extraction(clip)
 
-        return {'FINISHED'}
-
 class ColmapClearFeatureMatchesOperator(bpy.types.Operator):
     bl_idname = "colmap.clear_feature_matches"
     bl_label = "Clear Feature Matches"
@@ -378,41 +1410,43 @@ class ColmapClearFeatureMatchesOperator(bpy.types.Operator):
 
         return {'FINISHED'}
 
-class ColmapClearReconstructionOperator(bpy.types.Operator):
+class ColmapClearReconstructionOperator(BaseClearOperator):
     bl_idname = "colmap.clear_reconstruction"
     bl_label = "Clear Reconstruction"
     bl_description = "Clear all reconstruction data"
 
-    def execute(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
+    def clear(self, clip):
         clear_reconstruction(clip)
 
-        return {'FINISHED'}
-
-class ColmapClearImagesOperator(bpy.types.Operator):
+class ColmapClearImagesOperator(BaseClearOperator):
     bl_idname = "colmap.clear_images"
     bl_label = "Clear Images"
     bl_description = "Clear all split frames"
 
-    def execute(self, context):
-        sc = context.space_data
-        clip = sc.clip
-
+    def clear(self, clip):
         clear_images(clip)
 
-        return {'FINISHED'}
-
 def register():
     bpy.utils.register_class(ColmapExtractFeaturesOperator)
     
     bpy.utils.register_class(ColmapMatchFeaturesOperator)
     
     bpy.utils.register_class(ColmapSolveOperator)
+    bpy.utils.register_class(ColmapCancelSolveOperator)
     
     bpy.utils.register_class(ColmapSetupTrackingSceneOperator)
+    bpy.utils.register_class(ColmapExportTracksOperator)
+    bpy.utils.register_class(ColmapFilterPointsOperator)
+    bpy.utils.register_class(ColmapUndistortFramesOperator)
     
+    bpy.utils.register_class(ColmapCompactDatabaseOperator)
+    bpy.utils.register_class(ColmapEnforceStorageBudgetOperator)
+    bpy.utils.register_class(ColmapSaveSnapshotOperator)
+    bpy.utils.register_class(ColmapRestoreSnapshotOperator)
+    bpy.utils.register_class(ColmapDeleteSnapshotOperator)
+    bpy.utils.register_class(ColmapApplyPresetOperator)
+    bpy.utils.register_class(ColmapSavePresetOperator)
+    bpy.utils.register_class(ColmapDeletePresetOperator)
     bpy.utils.register_class(ColmapRefreshCacheOperator)
 
     bpy.utils.register_class(ColmapSetOriginOperator)
@@ -431,9 +1465,21 @@ def unregister():
     bpy.utils.unregister_class(ColmapMatchFeaturesOperator)
     
     bpy.utils.unregister_class(ColmapSolveOperator)
+    bpy.utils.unregister_class(ColmapCancelSolveOperator)
     
     bpy.utils.unregister_class(ColmapSetupTrackingSceneOperator)
-
+    bpy.utils.unregister_class(ColmapExportTracksOperator)
+    bpy.utils.unregister_class(ColmapFilterPointsOperator)
+    bpy.utils.unregister_class(ColmapUndistortFramesOperator)
+
+    bpy.utils.unregister_class(ColmapCompactDatabaseOperator)
+    bpy.utils.unregister_class(ColmapEnforceStorageBudgetOperator)
+    bpy.utils.unregister_class(ColmapSaveSnapshotOperator)
+    bpy.utils.unregister_class(ColmapRestoreSnapshotOperator)
+    bpy.utils.unregister_class(ColmapDeleteSnapshotOperator)
+    bpy.utils.unregister_class(ColmapApplyPresetOperator)
+    bpy.utils.unregister_class(ColmapSavePresetOperator)
+    bpy.utils.unregister_class(ColmapDeletePresetOperator)
     bpy.utils.unregister_class(ColmapRefreshCacheOperator)
 
     bpy.utils.unregister_class(ColmapSetOriginOperator)
@@ -1,5 +1,6 @@
 import bpy
-from .operators import ColmapExtractFeaturesOperator, ColmapMatchFeaturesOperator, ColmapSolveOperator, ColmapSetupTrackingSceneOperator, ColmapRefreshCacheOperator, ColmapClearCacheOperator, ColmapClearFeatureExtractionOperator, ColmapClearFeatureMatchesOperator, ColmapClearReconstructionOperator, ColmapClearImagesOperator, ColmapSetOriginOperator, ColmapSetFloorOperator, ColmapSetScaleOperator
+from ..utils import clip_path, list_snapshots
+from .operators import ColmapExtractFeaturesOperator, ColmapMatchFeaturesOperator, ColmapSolveOperator, ColmapSetupTrackingSceneOperator, ColmapRefreshCacheOperator, ColmapCompactDatabaseOperator, ColmapEnforceStorageBudgetOperator, ColmapSaveSnapshotOperator, ColmapRestoreSnapshotOperator, ColmapDeleteSnapshotOperator, ColmapApplyPresetOperator, ColmapSavePresetOperator, ColmapDeletePresetOperator, ColmapClearCacheOperator, ColmapClearFeatureExtractionOperator, ColmapClearFeatureMatchesOperator, ColmapClearReconstructionOperator, ColmapClearImagesOperator, ColmapSetOriginOperator, ColmapSetFloorOperator, ColmapSetScaleOperator
 
 class CLIP_PT_ColmapFeatureExtractionPanel(bpy.types.Panel):
     bl_space_type = 'CLIP_EDITOR'
@@ -20,6 +21,11 @@ class CLIP_PT_ColmapFeatureExtractionPanel(bpy.types.Panel):
 
         sc = context.space_data
         clip = sc.clip
+
+        row = layout.row(align=True)
+        row.operator_menu_enum(ColmapApplyPresetOperator.bl_idname, "preset", text="Preset", icon="PRESET")
+        row.operator(ColmapSavePresetOperator.bl_idname, text="", icon="ADD")
+        row.operator_menu_enum(ColmapDeletePresetOperator.bl_idname, "preset", text="", icon="REMOVE")
         
         layout.prop(clip.colmap.extract_features, "estimate_camera")
 
@@ -95,10 +101,13 @@ class CLIP_PT_ColmapFeatureMatchingPanel(bpy.types.Panel):
         clip = sc.clip
 
         layout.prop(clip.colmap.match_features, "matcher")
+        layout.prop(clip.colmap.match_features, "use_auto")
 
         match clip.colmap.match_features.matcher:
             case 'EXHAUSTIVE':
-                layout.prop(clip.colmap.match_features.exhaustive, "block_size")
+                row = layout.row()
+                row.enabled = not clip.colmap.match_features.use_auto
+                row.prop(clip.colmap.match_features.exhaustive, "block_size")
             case 'SPATIAL':
                 layout.prop(clip.colmap.match_features.spatial, "ignore_z")
                 layout.prop(clip.colmap.match_features.spatial, "max_num_neighbors")
@@ -186,6 +195,25 @@ class CLIP_PT_ColmapFootagePanel(bpy.types.Panel):
         
         layout.menu(COLMAP_MT_ClearCacheMenu.bl_idname)
 
+        layout.separator()
+
+        storage = context.scene.colmap_storage
+        layout.prop(storage, "use_budget")
+        col = layout.column()
+        col.enabled = storage.use_budget
+        col.prop(storage, "budget")
+        col.prop(storage, "auto_enforce")
+        col.operator(ColmapEnforceStorageBudgetOperator.bl_idname)
+        if storage.last_usage != "":
+            row = col.row()
+            row.alignment = 'RIGHT'
+            row.label(text=storage.last_usage)
+
+        layout.prop(storage, "use_shared_cache")
+        col = layout.column()
+        col.enabled = storage.use_shared_cache
+        col.prop(storage, "shared_cache_directory")
+
 class CLIP_PT_ColmapSolverPanel(bpy.types.Panel):
     bl_space_type = 'CLIP_EDITOR'
     bl_region_type = 'TOOLS'
@@ -207,6 +235,7 @@ class CLIP_PT_ColmapSolverPanel(bpy.types.Panel):
         sc = context.space_data
         clip = sc.clip
 
+        layout.prop(clip.colmap.incremental_pipeline, "use_auto_threads")
         layout.prop(clip.colmap.incremental_pipeline, "min_num_matches")
         layout.prop(clip.colmap.incremental_pipeline, "ignore_watermarks")
         layout.prop(clip.colmap.incremental_pipeline, "multiple_models")
@@ -232,13 +261,24 @@ class CLIP_PT_ColmapSolverPanel(bpy.types.Panel):
         col.scale_y = 2.0
         col.operator(ColmapSolveOperator.bl_idname, text="Solve Camera Motion")
 
+        if clip.colmap.cached_results.solve_snapshot != "":
+            col = layout.column()
+            col.alignment = 'RIGHT'
+            col.label(text=f"Solved With Snapshot: {clip.colmap.cached_results.solve_snapshot}")
+
         layout.separator()
 
+        layout.prop(clip.colmap, "model")
+        layout.prop(clip.colmap, "point_cloud_type")
+        if clip.colmap.point_cloud_type == 'POINTS':
+            layout.prop(clip.colmap, "lod_levels")
+            layout.prop(clip.colmap, "point_radius")
         layout.operator(ColmapSetupTrackingSceneOperator.bl_idname)
 
         col = layout.column(align=True)
         col.operator(ColmapSetOriginOperator.bl_idname)
         col.operator(ColmapSetFloorOperator.bl_idname)
+        col.operator(ColmapSetFloorOperator.bl_idname, text="Auto Floor").mode = 'AUTO'
         
         set_scale = layout.operator(ColmapSetScaleOperator.bl_idname)
         layout.prop(set_scale, "distance")
@@ -258,6 +298,50 @@ class BaseColmapSolverPanel(bpy.types.Panel):
     def poll(cls, context):
         return context.space_data.mode == 'TRACKING'
 
+class CLIP_PT_CheckpointsPanel(BaseColmapSolverPanel):
+    bl_label = "Checkpoints"
+
+    def draw_header(self, context):
+        self.layout.prop(context.space_data.clip.colmap.checkpoints, "use_checkpoints", text="")
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        layout.enabled = clip.colmap.checkpoints.use_checkpoints
+
+        layout.prop(clip.colmap.checkpoints, "every_images")
+        layout.prop(clip.colmap.checkpoints, "every_minutes")
+        layout.prop(clip.colmap.checkpoints, "keep")
+        layout.prop(clip.colmap.checkpoints, "resume")
+
+class CLIP_PT_PreviewPanel(BaseColmapSolverPanel):
+    bl_label = "Live Preview"
+
+    def draw_header(self, context):
+        self.layout.prop(context.space_data.clip.colmap.preview, "use_preview", text="")
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        col = layout.column()
+        col.enabled = clip.colmap.preview.use_preview
+        col.prop(clip.colmap.preview, "every_images")
+        col.prop(clip.colmap.preview, "max_points")
+
+        layout.operator("colmap.cancel_solve")
+
 class CLIP_PT_IncrementalBundleAdjustmentPanel(BaseColmapSolverPanel):
     bl_label = "Bundle Adjustment"
 
@@ -430,6 +514,55 @@ class CLIP_PT_RansacOptionsPanel(BaseColmapFeatureMatchingPanel):
         layout.prop(clip.colmap.match_features.verification_options.ransac, "min_num_trials")
         layout.prop(clip.colmap.match_features.verification_options.ransac, "max_num_trials")
 
+class CLIP_PT_CompactDatabasePanel(BaseColmapFeatureMatchingPanel):
+    bl_label = "Compact Database"
+    bl_order = 0
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        layout.prop(clip.colmap.compact, "drop_descriptors")
+        layout.prop(clip.colmap.compact, "drop_matches")
+        layout.prop(clip.colmap.compact, "compact_after_matching")
+
+        layout.operator(ColmapCompactDatabaseOperator.bl_idname)
+
+        if clip.colmap.cached_results.last_compaction != "":
+            col = layout.column()
+            col.alignment = 'RIGHT'
+            col.label(text=clip.colmap.cached_results.last_compaction)
+
+class CLIP_PT_SnapshotsPanel(BaseColmapFeatureMatchingPanel):
+    bl_label = "Snapshots"
+    bl_order = 0
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        row = layout.row(align=True)
+        row.prop(clip.colmap, "snapshot_name", text="")
+        row.operator(ColmapSaveSnapshotOperator.bl_idname, text="Save", icon="FILE_TICK")
+
+        active = clip.colmap.cached_results.active_snapshot
+        col = layout.column(align=True)
+        for name in list_snapshots(clip_path(clip) / "database.db"):
+            row = col.row(align=True)
+            row.label(text=name, icon="CHECKMARK" if name == active else "BLANK1")
+            row.operator(ColmapRestoreSnapshotOperator.bl_idname, text="", icon="IMPORT").name = name
+            row.operator(ColmapDeleteSnapshotOperator.bl_idname, text="", icon="X").name = name
+
 def register():
     bpy.utils.register_class(CLIP_PT_ColmapFeatureExtractionPanel)
     bpy.utils.register_class(CLIP_PT_SiftExtractionOptionsPanel)
@@ -438,6 +571,8 @@ def register():
     bpy.utils.register_class(CLIP_PT_SiftOptionsPanel)
     bpy.utils.register_class(CLIP_PT_VerificationOptionsPanel)
     bpy.utils.register_class(CLIP_PT_RansacOptionsPanel)
+    bpy.utils.register_class(CLIP_PT_CompactDatabasePanel)
+    bpy.utils.register_class(CLIP_PT_SnapshotsPanel)
 
     bpy.utils.register_class(COLMAP_MT_ClearCacheMenu)
     bpy.utils.register_class(CLIP_PT_ColmapFootagePanel)
@@ -445,6 +580,8 @@ def register():
     bpy.utils.register_class(CLIP_PT_IncrementalBundleAdjustmentPanel)
     bpy.utils.register_class(CLIP_PT_IncrementalMapperPanel)
     bpy.utils.register_class(CLIP_PT_IncrementalTriangulatorPanel)
+    bpy.utils.register_class(CLIP_PT_CheckpointsPanel)
+    bpy.utils.register_class(CLIP_PT_PreviewPanel)
 
 def unregister():
     bpy.utils.unregister_class(CLIP_PT_ColmapFeatureExtractionPanel)
@@ -454,10 +591,14 @@ def unregister():
     bpy.utils.unregister_class(CLIP_PT_SiftOptionsPanel)
     bpy.utils.unregister_class(CLIP_PT_VerificationOptionsPanel)
     bpy.utils.unregister_class(CLIP_PT_RansacOptionsPanel)
+    bpy.utils.unregister_class(CLIP_PT_CompactDatabasePanel)
+    bpy.utils.unregister_class(CLIP_PT_SnapshotsPanel)
 
     bpy.utils.unregister_class(COLMAP_MT_ClearCacheMenu)
     bpy.utils.unregister_class(CLIP_PT_ColmapFootagePanel)
     bpy.utils.unregister_class(CLIP_PT_ColmapSolverPanel)
     bpy.utils.unregister_class(CLIP_PT_IncrementalBundleAdjustmentPanel)
     bpy.utils.unregister_class(CLIP_PT_IncrementalMapperPanel)
-    bpy.utils.unregister_class(CLIP_PT_IncrementalTriangulatorPanel)
\ No newline at end of file
+    bpy.utils.unregister_class(CLIP_PT_IncrementalTriangulatorPanel)
+    bpy.utils.unregister_class(CLIP_PT_CheckpointsPanel)
+    bpy.utils.unregister_class(CLIP_PT_PreviewPanel)
\ No newline at end of file
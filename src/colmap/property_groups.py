@@ -1,6 +1,9 @@
 import bpy
 import pycolmap
 
+from ..utils import clip_path, list_models, model_summary, storage_workspaces, shared_cache_path, database_state, format_bytes
+from ..hardware import auto_matching_settings, auto_solver_settings
+
 class SiftExtractionOptionsPropertyGroup(bpy.types.PropertyGroup):
     max_num_features: bpy.props.IntProperty(name="Max Features", default=8192, description="Maximum number of features to detect, keeping larger-scale features")
     first_octave: bpy.props.IntProperty(name="First Octave", default=-1, description="First octave in the pyramid, i.e. -1 upsamples the image by one level")
@@ -270,6 +273,8 @@ class MatchFeaturesPropertyGroup(bpy.types.PropertyGroup):
     # TwoViewGeometryOptions
     verification_options: bpy.props.PointerProperty(type=TwoViewGeometryOptionsPropertyGroup)
 
+    use_auto: bpy.props.BoolProperty(name="Auto Configure", default=False, description="Derive the thread count, match cap and exhaustive block size from the available memory, the cores and the keypoint counts in the database")
+
     def matching_options(self):
         match self.matcher:
             case 'EXHAUSTIVE':
@@ -282,10 +287,24 @@ class MatchFeaturesPropertyGroup(bpy.types.PropertyGroup):
                 return self.sequential.build()
 
     def build(self, database_path):
+        sift_options = self.sift_options.build()
+        matching_options = self.matching_options()
+        if self.use_auto:
+            auto = auto_matching_settings(database_path, self.matcher, self.sift_options.use_gpu, self.sift_options.max_num_matches)
+            sift_options.num_threads = auto['num_threads']
+            sift_options.max_num_matches = auto['max_num_matches']
+            if auto['block_size'] is not None:
+                matching_options.block_size = auto['block_size']
+            print(
+                f"Auto matching: {auto['num_threads']} threads, {auto['max_num_matches']} max matches"
+                + (f", block size {auto['block_size']}" if auto['block_size'] is not None else "")
+                + f". Expected peak memory {format_bytes(auto['peak_memory'])} of {format_bytes(auto['available_memory'])} available"
+                + f" for {auto['num_images']} images with up to {auto['max_keypoints']} keypoints on {auto['num_cores']} cores"
+            )
         return self.matcher, {
             'database_path': database_path,
-            'sift_options': self.sift_options.build(),
-            'matching_options': self.matching_options(),
+            'sift_options': sift_options,
+            'matching_options': matching_options,
             'verification_options': self.verification_options.build()
         }
 
@@ -482,8 +501,10 @@ class IncrementalPipelineOptionsPropertyGroup(bpy.types.PropertyGroup):
     mapper: bpy.props.PointerProperty(type=IncrementalMapperOptionsPropertyGroup)
     triangulation: bpy.props.PointerProperty(type=IncrementalTriangulatorOptionsPropertyGroup)
 
+    use_auto_threads: bpy.props.BoolProperty(name="Auto Threads", default=False, description="Use every available core, and multi-thread bundle adjustment on smaller problems the more cores there are")
+
     def build(self):
-        return pycolmap.IncrementalPipelineOptions(
+        options = pycolmap.IncrementalPipelineOptions(
             min_num_matches=self.min_num_matches,
             ignore_watermarks=self.ignore_watermarks,
             multiple_models=self.multiple_models,
@@ -528,6 +549,85 @@ class IncrementalPipelineOptionsPropertyGroup(bpy.types.PropertyGroup):
             mapper=self.mapper.build(),
             triangulation=self.triangulation.build(),
         )
+        if self.use_auto_threads:
+            auto = auto_solver_settings()
+            options.num_threads = auto['num_threads']
+            options.ba_min_num_residuals_for_cpu_multi_threading = auto['min_num_residuals_for_cpu_multi_threading']
+            print(f"Auto solver: {auto['num_threads']} threads, multi-threaded bundle adjustment above {auto['min_num_residuals_for_cpu_multi_threading']} residuals")
+        return options
+
+class CheckpointsPropertyGroup(bpy.types.PropertyGroup):
+    use_checkpoints: bpy.props.BoolProperty(name="Checkpoints", default=True, description="Periodically save the in-progress reconstruction so a crashed solve can be resumed")
+    every_images: bpy.props.IntProperty(name="Every Images", default=50, min=0, description="Save a checkpoint after this many newly registered images. Set to 0 to disable")
+    every_minutes: bpy.props.FloatProperty(name="Every Minutes", default=5.0, min=0, description="Save a checkpoint after this many minutes. Set to 0 to disable")
+    keep: bpy.props.IntProperty(name="Keep", default=3, min=1, description="Number of checkpoints to keep on disk")
+    resume: bpy.props.BoolProperty(name="Resume", default=True, description="Continue from the newest checkpoint if a previous solve did not finish")
+
+    def build(self, checkpoints_path, database_path):
+        return {
+            'checkpoints_path': checkpoints_path,
+            'database_state': database_state(database_path),
+            'every_images': self.every_images,
+            'every_minutes': self.every_minutes,
+            'keep': self.keep,
+        }
+
+class PreviewPropertyGroup(bpy.types.PropertyGroup):
+    use_preview: bpy.props.BoolProperty(name="Live Preview", default=False, description="Show the camera path and a subset of the points in the viewport while the solve is running")
+    every_images: bpy.props.IntProperty(name="Every Images", default=10, min=1, description="Update the preview after this many newly registered images")
+    max_points: bpy.props.IntProperty(name="Max Points", default=5000, min=0, description="Maximum number of points shown in the preview")
+
+    def build(self):
+        return {
+            'every_images': self.every_images,
+            'max_points': self.max_points,
+        }
+
+class FilterPointsPropertyGroup(bpy.types.PropertyGroup):
+    max_error: bpy.props.FloatProperty(name="Max Error", default=2.0, min=0, description="Remove points with a larger mean reprojection error in pixels")
+    min_track_length: bpy.props.IntProperty(name="Min Track Length", default=3, min=2, description="Remove points seen in fewer images")
+    min_tri_angle: bpy.props.FloatProperty(name="Min Triangulation Angle", default=1.5, min=0, max=90, description="Remove points whose observing rays are closer than this angle in degrees, their depth is unreliable")
+    use_statistical: bpy.props.BoolProperty(name="Statistical Outliers", default=True, description="Remove points that are far from their neighbors compared to the rest of the cloud")
+    num_neighbors: bpy.props.IntProperty(name="Neighbors", default=8, min=1, description="Number of neighbors used for the distance statistics")
+    std_ratio: bpy.props.FloatProperty(name="Std Ratio", default=2.0, min=0, description="Remove points whose mean neighbor distance is more than this many standard deviations above the mean")
+
+    def build(self):
+        return {
+            'max_error': self.max_error,
+            'min_track_length': self.min_track_length,
+            'min_tri_angle': self.min_tri_angle,
+            'num_neighbors': self.num_neighbors if self.use_statistical else 0,
+            'std_ratio': self.std_ratio,
+        }
+
+class CompactDatabasePropertyGroup(bpy.types.PropertyGroup):
+    drop_descriptors: bpy.props.BoolProperty(name="Drop Descriptors", default=True, description="Remove the feature descriptors. They are only needed to match again, which then requires extracting features again")
+    drop_matches: bpy.props.BoolProperty(name="Drop Unverified Matches", default=False, description="Remove the raw matches. The solvers only use the verified matches, which are kept")
+    compact_after_matching: bpy.props.BoolProperty(name="Compact After Matching", default=False, description="Compact the database automatically once feature matching finishes")
+
+    def build(self, database_path):
+        return {
+            'database_path': database_path,
+            'drop_descriptors': self.drop_descriptors,
+            'drop_matches': self.drop_matches,
+        }
+
+class StoragePropertyGroup(bpy.types.PropertyGroup):
+    use_budget: bpy.props.BoolProperty(name="Storage Budget", default=False, description="Limit the disk space used by the COLMAP folders of all clips and the shared cache, evicting the least recently used frames, then shared cache entries, then descriptors")
+    budget: bpy.props.FloatProperty(name="Budget (GB)", default=50.0, min=0.1, description="Maximum disk space used by the COLMAP folders of all clips and the shared cache, in gigabytes")
+    auto_enforce: bpy.props.BoolProperty(name="Enforce After Each Stage", default=True, description="Check the budget in the background every time a stage finishes")
+
+    use_shared_cache: bpy.props.BoolProperty(name="Shared Cache", default=False, description="Reuse frames and features across clips and .blend files that load the same footage with the same settings")
+    shared_cache_directory: bpy.props.StringProperty(name="Shared Cache Directory", subtype='DIR_PATH', description="Where the shared frames and features are stored. Leave empty to use the extension's user directory")
+
+    last_usage: bpy.props.StringProperty()
+
+    def build(self):
+        return {
+            'workspaces': storage_workspaces(),
+            'budget': int(self.budget * 1024 ** 3),
+            'shared_cache': shared_cache_path(),
+        }
 
 class ColmapCachedResultsPropertyGroup(bpy.types.PropertyGroup):
     num_descriptors: bpy.props.IntProperty()
@@ -537,6 +637,27 @@ class ColmapCachedResultsPropertyGroup(bpy.types.PropertyGroup):
     num_matched_image_pairs: bpy.props.IntProperty()
     num_verified_image_pairs: bpy.props.IntProperty()
 
+    # the database mtime and size the values were counted at
+    database_state: bpy.props.StringProperty()
+
+    # byte counts can overflow an IntProperty, so the last compaction is kept as its message
+    last_compaction: bpy.props.StringProperty()
+
+    # the snapshot the matches in the database came from, and the one the last solve used
+    active_snapshot: bpy.props.StringProperty()
+    solve_snapshot: bpy.props.StringProperty()
+
+_model_items = [] # Blender requires dynamic enum items to stay referenced from Python
+
+def model_items(self, context):
+    _model_items.clear()
+    _model_items.append(('LARGEST', "Largest", "Load the model with the most registered frames"))
+    _model_items.append(('MERGED', "Merge Overlapping", "Load the largest model and merge in every model that shares frames with it"))
+    for model_path in list_models(clip_path(self.id_data) / "reconstruction"):
+        summary = model_summary(model_path)
+        _model_items.append((model_path.name, f"Model {model_path.name}", f"{summary['num_reg_images']} frames, {summary['num_points3D']} points"))
+    return _model_items
+
 class ColmapPropertyGroup(bpy.types.PropertyGroup):
     use_custom_directory: bpy.props.BoolProperty(name="Custom Directory")
     directory: bpy.props.StringProperty(name="Directory", subtype = 'DIR_PATH')
@@ -547,8 +668,33 @@ class ColmapPropertyGroup(bpy.types.PropertyGroup):
 
     incremental_pipeline: bpy.props.PointerProperty(type=IncrementalPipelineOptionsPropertyGroup)
 
+    checkpoints: bpy.props.PointerProperty(type=CheckpointsPropertyGroup)
+
+    preview: bpy.props.PointerProperty(type=PreviewPropertyGroup)
+
     cached_results: bpy.props.PointerProperty(type=ColmapCachedResultsPropertyGroup)
 
+    filter_points: bpy.props.PointerProperty(type=FilterPointsPropertyGroup)
+
+    compact: bpy.props.PointerProperty(type=CompactDatabasePropertyGroup)
+
+    snapshot_name: bpy.props.StringProperty(name="Snapshot Name", description="Name to save the current matches under. Leave empty to name it after the matcher")
+
+    use_filtered: bpy.props.BoolProperty(name="Filtered Points", default=True, description="Load the filtered version of the model when there is one")
+
+    model: bpy.props.EnumProperty(name="Model", items=model_items, description="Which reconstructed model to load when the mapper splits the clip into several")
+
+    point_cloud_type: bpy.props.EnumProperty(
+        name="Point Cloud",
+        items=[
+            ('MESH', 'Mesh', 'Import the point cloud as loose mesh vertices'),
+            ('POINTS', 'Points', 'Draw the point cloud as points with geometry nodes, decimated in the viewport. Renders and vertex picking use the full cloud'),
+        ],
+        default='MESH'
+    )
+    lod_levels: bpy.props.IntProperty(name="Detail Levels", default=3, min=1, max=8, description="Number of decimated viewport levels to precompute for the points")
+    point_radius: bpy.props.FloatProperty(name="Point Radius", default=0.005, min=0, description="Radius of each point")
+
 def register():
     bpy.utils.register_class(RansacOptionsPropertyGroup)
     bpy.utils.register_class(SiftMatchingOptionsPropertyGroup)
@@ -563,6 +709,11 @@ def register():
     bpy.utils.register_class(IncrementalMapperOptionsPropertyGroup)
     bpy.utils.register_class(IncrementalTriangulatorOptionsPropertyGroup)
     bpy.utils.register_class(IncrementalPipelineOptionsPropertyGroup)
+    bpy.utils.register_class(CheckpointsPropertyGroup)
+    bpy.utils.register_class(PreviewPropertyGroup)
+    bpy.utils.register_class(FilterPointsPropertyGroup)
+    bpy.utils.register_class(CompactDatabasePropertyGroup)
+    bpy.utils.register_class(StoragePropertyGroup)
 
     bpy.utils.register_class(SiftExtractionOptionsPropertyGroup)
     bpy.utils.register_class(ExtractFeaturesPropertyGroup)
@@ -570,6 +721,8 @@ def register():
     bpy.utils.register_class(ColmapPropertyGroup)
 
     bpy.types.MovieClip.colmap = bpy.props.PointerProperty(type=ColmapPropertyGroup)
+    # the budget covers the folders of every clip, so it lives on the scene
+    bpy.types.Scene.colmap_storage = bpy.props.PointerProperty(type=StoragePropertyGroup)
 
 def unregister():
     bpy.utils.unregister_class(RansacOptionsPropertyGroup)
@@ -585,6 +738,11 @@ def unregister():
     bpy.utils.unregister_class(IncrementalMapperOptionsPropertyGroup)
     bpy.utils.unregister_class(IncrementalTriangulatorOptionsPropertyGroup)
     bpy.utils.unregister_class(IncrementalPipelineOptionsPropertyGroup)
+    bpy.utils.unregister_class(CheckpointsPropertyGroup)
+    bpy.utils.unregister_class(PreviewPropertyGroup)
+    bpy.utils.unregister_class(FilterPointsPropertyGroup)
+    bpy.utils.unregister_class(CompactDatabasePropertyGroup)
+    bpy.utils.unregister_class(StoragePropertyGroup)
 
     bpy.utils.unregister_class(SiftExtractionOptionsPropertyGroup)
     bpy.utils.unregister_class(ExtractFeaturesPropertyGroup)
@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from .model import read_model, write_points3D_binary
+from .utils import filtered_model_path
+
+def sample_point_colors(model, images_path, max_samples=3, max_workers=None, on_progress=None):
+    """Average the pixel colors of up to `max_samples` observations of each point
+
+    The observations are spread evenly along each track. They are grouped by frame,
+    so every frame is read once and all of its samples are gathered with one fancy index.
+    Requires tracks. Returns RGB colors as a uint8 (M, 3) array.
+    """
+    lengths = model.track_lengths.astype(np.int64)
+    counts = np.minimum(lengths, max_samples)
+    point_indices = np.repeat(np.arange(model.num_points3D), counts)
+    slots = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    elements = model.track_offsets[point_indices] + ((slots + 0.5) * lengths[point_indices] / counts[point_indices]).astype(np.int64)
+
+    order = np.argsort(model.image_ids)
+    image_indices = order[np.searchsorted(model.image_ids, model.track_image_ids[elements], sorter=order)]
+    point2D_idxs = model.track_point2D_idxs[elements]
+
+    samples = np.zeros((len(elements), 3), dtype=np.float64)
+    by_image = np.argsort(image_indices, kind='stable')
+    splits = np.flatnonzero(np.diff(image_indices[by_image])) + 1
+    groups = np.split(by_image, splits) if len(by_image) > 0 else []
+
+    def sample(group):
+        image_index = image_indices[group[0]]
+        with Image.open(Path(images_path) / model.image_names[image_index]) as image:
+            pixels = np.asarray(image.convert('RGB'))
+        # COLMAP pixel centers are at +0.5, so flooring gives the pixel each observation falls in
+        xy = model.image_points2D[image_index]['xy'][point2D_idxs[group]]
+        columns = np.clip(np.floor(xy[:, 0]).astype(np.int64), 0, pixels.shape[1] - 1)
+        rows = np.clip(np.floor(xy[:, 1]).astype(np.int64), 0, pixels.shape[0] - 1)
+        return group, pixels[rows, columns]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, (group, colors) in enumerate(executor.map(sample, groups)):
+            samples[group] = colors
+            if on_progress is not None:
+                on_progress(i + 1, len(groups))
+
+    totals = np.stack([np.bincount(point_indices, weights=samples[:, channel], minlength=model.num_points3D) for channel in range(3)], axis=1)
+    return np.clip(np.rint(totals / np.maximum(counts, 1)[:, None]), 0, 255).astype(np.uint8)
+
+def colorize_model(model_path, images_path, max_samples=3, max_workers=None, on_progress=None):
+    """Sample colors for every point of a binary model and write them back into its points3D.bin"""
+    model = read_model(model_path, tracks=True)
+    model.rgb = sample_point_colors(model, images_path, max_samples, max_workers, on_progress)
+    # replace the file in one step, so an interrupted write never leaves a broken model
+    partial_path = Path(model_path) / "points3D.bin.partial"
+    write_points3D_binary(model, partial_path)
+    os.replace(partial_path, Path(model_path) / "points3D.bin")
+
+def colorize_models(model_paths, images_path, max_samples=3, max_workers=None, on_progress=None):
+    """Colorize every model, and the filtered version of each one that has an up to date version"""
+    for model_path in model_paths:
+        # check before writing, the filtered version must stay newer than its model
+        versions = [model_path]
+        if filtered_model_path(model_path) != model_path:
+            versions.append(model_path / "filtered")
+        for version_path in versions:
+            colorize_model(version_path, images_path, max_samples, max_workers, on_progress)
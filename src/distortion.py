@@ -0,0 +1,185 @@
+import os
+import sys
+import pickle
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# peak bytes `remap` allocates per channel of a pixel, its float32 temporaries plus the decoded and encoded frames
+REMAP_BYTES_PER_SAMPLE = 28
+
+def camera_intrinsics(model_id, params):
+    """Split COLMAP camera parameters into `(fx, fy, cx, cy, k1, k2, p1, p2)`"""
+    match model_id:
+        case 0: # SIMPLE_PINHOLE
+            f, cx, cy = params
+            return f, f, cx, cy, 0.0, 0.0, 0.0, 0.0
+        case 1: # PINHOLE
+            fx, fy, cx, cy = params
+            return fx, fy, cx, cy, 0.0, 0.0, 0.0, 0.0
+        case 2: # SIMPLE_RADIAL
+            f, cx, cy, k = params
+            return f, f, cx, cy, k, 0.0, 0.0, 0.0
+        case 3: # RADIAL
+            f, cx, cy, k1, k2 = params
+            return f, f, cx, cy, k1, k2, 0.0, 0.0
+        case 4: # OPENCV
+            fx, fy, cx, cy, k1, k2, p1, p2 = params
+            return fx, fy, cx, cy, k1, k2, p1, p2
+        case _:
+            raise Exception(f"Unsupported camera model {model_id}, only SIMPLE_PINHOLE, PINHOLE, SIMPLE_RADIAL, RADIAL and OPENCV can be transferred")
+
+def tracking_camera_settings(model_id, params, width, height):
+    """Blender `MovieTrackingCamera` settings for a COLMAP camera
+
+    Radial-only models map to the polynomial model, OPENCV maps to Brown.
+    COLMAP measures from the top left with Y down, Blender from the bottom left with Y up.
+    """
+    fx, fy, cx, cy, k1, k2, p1, p2 = camera_intrinsics(model_id, params)
+    settings = {
+        'focal_length_pixels': fx,
+        'pixel_aspect': fy / fx,
+        'principal_point_pixels': (cx, height - cy),
+    }
+    if model_id == 4: # OPENCV
+        # flipping Y negates the tangential term that is driven by Y
+        settings.update({
+            'distortion_model': 'BROWN',
+            'brown_k1': k1,
+            'brown_k2': k2,
+            'brown_k3': 0.0,
+            'brown_k4': 0.0,
+            'brown_p1': -p1,
+            'brown_p2': p2,
+        })
+    else:
+        settings.update({
+            'distortion_model': 'POLYNOMIAL',
+            'k1': k1,
+            'k2': k2,
+            'k3': 0.0,
+        })
+    return settings
+
+def undistortion_map(model_id, params, width, height):
+    """Precompute a bilinear remap table that undistorts frames of a COLMAP camera
+
+    The undistorted frame keeps the same size and intrinsics, without distortion.
+    Returns `(indices, weights, valid)`: the flat index of the top left source pixel,
+    the (x, y) interpolation weights and a mask of pixels that land inside the source frame.
+    """
+    fx, fy, cx, cy, k1, k2, p1, p2 = camera_intrinsics(model_id, params)
+
+    # COLMAP pixel centers are at +0.5
+    u, v = np.meshgrid(np.arange(width, dtype=np.float64) + 0.5, np.arange(height, dtype=np.float64) + 0.5)
+    x = (u - cx) / fx
+    y = (v - cy) / fy
+
+    r2 = x * x + y * y
+    radial = 1.0 + k1 * r2 + k2 * r2 * r2
+    xd = x * radial + 2.0 * p1 * x * y + p2 * (r2 + 2.0 * x * x)
+    yd = y * radial + p1 * (r2 + 2.0 * y * y) + 2.0 * p2 * x * y
+
+    # source position in pixel index space
+    source_x = fx * xd + cx - 0.5
+    source_y = fy * yd + cy - 0.5
+    valid = (source_x > -0.5) & (source_x < width - 0.5) & (source_y > -0.5) & (source_y < height - 0.5)
+
+    source_x = np.clip(source_x, 0, width - 1)
+    source_y = np.clip(source_y, 0, height - 1)
+    x0 = np.minimum(np.floor(source_x).astype(np.int64), width - 2)
+    y0 = np.minimum(np.floor(source_y).astype(np.int64), height - 2)
+    weights = np.stack((source_x - x0, source_y - y0), axis=-1).astype(np.float32)
+
+    return (y0 * width + x0).astype(np.int32).ravel(), weights.reshape(-1, 2), valid.ravel()
+
+def remap(image, remap_table):
+    """Bilinearly resample an (H, W, C) image with a table from `undistortion_map`"""
+    indices, weights, valid = remap_table
+    height, width, channels = image.shape
+    pixels = image.reshape(-1, channels).astype(np.float32)
+    wx = weights[:, 0:1]
+    wy = weights[:, 1:2]
+    top = pixels[indices] * (1.0 - wx) + pixels[indices + 1] * wx
+    bottom = pixels[indices + width] * (1.0 - wx) + pixels[indices + width + 1] * wx
+    result = top * (1.0 - wy) + bottom * wy
+    result[~valid] = 0
+    if np.issubdtype(image.dtype, np.integer):
+        result = np.clip(np.rint(result), np.iinfo(image.dtype).min, np.iinfo(image.dtype).max)
+    return result.astype(image.dtype).reshape(height, width, channels)
+
+def undistort_workers(width, height, channels=4):
+    """Number of frames to undistort at once, no more than there are cores or than fit in the available memory"""
+    # imported here, the worker processes import this module on its own, outside of the add-on package
+    from .hardware import available_memory, available_cores, MEMORY_HEADROOM
+    frame_bytes = width * height * channels * REMAP_BYTES_PER_SAMPLE
+    return max(1, min(available_cores(), int(available_memory() * MEMORY_HEADROOM) // frame_bytes))
+
+def undistort_frames(frame_paths, output_path, model_id, params, width, height, max_workers=None, on_progress=None):
+    """Undistort every frame into `output_path`, keeping the file names
+
+    The frames are shared out between worker processes running `undistort.py`, as many as `undistort_workers`
+    allows for RGBA frames without `max_workers`. The remap table is computed once and memory mapped by every worker.
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if len(frame_paths) == 0:
+        return
+
+    if max_workers is None:
+        max_workers = undistort_workers(width, height)
+    max_workers = min(max_workers, len(frame_paths))
+
+    # the worker processes run Blender's Python without Blender, so they need to be told where numpy and PIL are installed
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path != "")
+    script_path = Path(__file__).with_name("undistort.py").resolve()
+
+    lock = threading.Lock()
+    num_done = 0
+    errors = []
+
+    def follow(process):
+        nonlocal num_done
+        last_line = ""
+        for line in process.stdout:
+            if line.startswith("undistorted "):
+                with lock:
+                    num_done += 1
+                    if on_progress is not None:
+                        on_progress(num_done, len(frame_paths))
+            else:
+                print(line, end='')
+                last_line = line.strip() or last_line
+        if process.wait() != 0:
+            errors.append(last_line or f"undistort.py exited with code {process.returncode}")
+
+    with tempfile.TemporaryDirectory() as table_path:
+        table_path = Path(table_path)
+        for name, array in zip(("indices", "weights", "valid"), undistortion_map(model_id, params, width, height)):
+            np.save(table_path / f"{name}.npy", array)
+
+        threads = []
+        for i in range(max_workers):
+            job_path = table_path / f"job_{i}.pickle"
+            with open(job_path, "wb") as f:
+                pickle.dump({
+                    'table_path': table_path,
+                    'frame_paths': frame_paths[i::max_workers],
+                    'output_path': output_path,
+                    'width': width,
+                    'height': height,
+                }, f)
+            process = subprocess.Popen([sys.executable, str(script_path), str(job_path)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+            thread = threading.Thread(target=follow, args=(process,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    if len(errors) > 0:
+        raise Exception(f"Failed to undistort frames: {errors[0]}")
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+def camera_centers(model):
+    """World-space centers of the registered images, `-R^T t` of each `cam_from_world`"""
+    return -np.einsum('nji,nj->ni', model.rotation_matrices(), model.translations)
+
+def triangulation_angles(model):
+    """Approximate the widest angle, in degrees, between the rays that observe each point
+
+    The ray furthest from the mean direction is taken as one end of the widest pair,
+    and the angle to the ray furthest from it is the result. Requires tracks.
+    """
+    lengths = model.track_lengths.astype(np.int64)
+    if lengths.sum() == 0:
+        return np.zeros(model.num_points3D)
+    point_indices = np.repeat(np.arange(model.num_points3D), lengths)
+    order = np.argsort(model.image_ids)
+    image_indices = order[np.searchsorted(model.image_ids, model.track_image_ids, sorter=order)]
+
+    rays = model.xyz[point_indices] - camera_centers(model)[image_indices]
+    rays /= np.maximum(np.linalg.norm(rays, axis=1, keepdims=True), 1e-12)
+
+    mean_rays = np.stack([np.bincount(point_indices, weights=rays[:, axis], minlength=model.num_points3D) for axis in range(3)], axis=1)
+    mean_rays /= np.maximum(np.linalg.norm(mean_rays, axis=1, keepdims=True), 1e-12)
+    cos_to_mean = np.einsum('ij,ij->i', rays, mean_rays[point_indices])
+
+    # sorting by point, then by the cosine, puts the furthest ray first in each track
+    order = np.lexsort((cos_to_mean, point_indices))
+    starts = np.minimum(np.searchsorted(point_indices[order], np.arange(model.num_points3D)), len(order) - 1)
+    extremes = rays[order[starts]]
+
+    min_cos = np.ones(model.num_points3D)
+    np.minimum.at(min_cos, point_indices, np.einsum('ij,ij->i', rays, extremes[point_indices]))
+    angles = np.degrees(np.arccos(np.clip(min_cos, -1.0, 1.0)))
+    angles[lengths < 2] = 0.0
+    return angles
+
+def neighbor_distances(xyz, num_neighbors):
+    """Mean distance from each point to its `num_neighbors` nearest neighbors
+
+    The tree is built and queried in native code on every core, without holding the GIL.
+    """
+    # the nearest result is the point itself
+    distances, _ = cKDTree(xyz).query(xyz, k=num_neighbors + 1, workers=-1)
+    return distances.sum(axis=1) / num_neighbors
+
+def filter_points(model, max_error, min_track_length, min_tri_angle, num_neighbors=0, std_ratio=2.0):
+    """Mask of the points to keep
+
+    The cheap per-point limits run first, so the neighbor statistics only cover the points that pass them.
+    Points whose mean neighbor distance is more than `std_ratio` standard deviations above the mean are outliers.
+    `num_neighbors` of 0 skips the statistical test.
+    """
+    keep = (model.errors <= max_error) & (model.track_lengths >= min_track_length)
+    if min_tri_angle > 0:
+        keep &= triangulation_angles(model) >= min_tri_angle
+    if num_neighbors > 0 and np.count_nonzero(keep) > num_neighbors:
+        candidates = np.flatnonzero(keep)
+        distances = neighbor_distances(model.xyz[candidates], num_neighbors)
+        keep[candidates[distances > distances.mean() + std_ratio * distances.std()]] = False
+    return keep
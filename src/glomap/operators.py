@@ -2,9 +2,168 @@ import bpy
 import subprocess
 from pathlib import Path
 import sys
+import os
 import re
+import shutil
+import threading
+import itertools
+import time
+import json
+import csv
+import pickle
+import glob
+from concurrent.futures import ThreadPoolExecutor
 
-from ..utils import prepare_database, BlockingOperator
+if not sys.platform.startswith('win'):
+    import resource
+
+from .property_groups import resolve_property, assign_properties
+from ..colors import colorize_models
+from ..utils import clip_path, prepare_database, copy_database, remove_database, tombstone, delete_tombstones, record_solve_snapshot, list_models, largest_model, reconstruction_stats, stats_key, BlockingOperator
+
+def format_argument(value):
+    """Format a value from `GlomapPropertyGroup.arguments()` for the glomap command line"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    elif isinstance(value, float):
+        # enough digits to round-trip Blender's single precision floats
+        return format(value, ".9g")
+    else:
+        return str(value)
+
+def glomap_command(clip, database_path, output_path):
+    """Build the glomap mapper command line and `start_process` options for a clip"""
+    # path to the precompiled glomap executable
+    if sys.platform.startswith('win'):
+        executable = Path(__file__).parent / "../../glomap_subprocess/glomap.exe"
+    elif sys.platform == 'darwin':
+        executable = Path(__file__).parent / "../../glomap_subprocess/glomap.app/Contents/MacOS/glomap"
+    else:
+        executable = Path(__file__).parent / "../../glomap_subprocess/glomap.AppImage"
+
+    command = [
+        str(executable.resolve()),
+        "mapper",
+        "--database_path", str(database_path),
+        "--output_path", str(output_path),
+        *(format_argument(argument) for argument in clip.glomap.arguments()),
+    ]
+
+    process = clip.glomap.process
+    if process.memory_limit > 0 and clip.glomap.use_gpu:
+        raise Exception("'Memory Limit' leaves CUDA too little address space, disable it or 'Use GPU'")
+
+    return command, process.build()
+
+def start_process(command, process_options):
+    """Start a process with its output piped as text, then apply the `limits` from `ProcessPropertyGroup.build()` to it
+
+    The limits are set from here rather than with `preexec_fn`, which can deadlock when called from a thread
+    of a multi-threaded process like Blender, and would rule out the faster ways of spawning.
+    """
+    options = dict(process_options)
+    limits = options.pop('limits', {})
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, **options)
+    try:
+        if 'cpus' in limits and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(process.pid, limits['cpus'])
+        if 'niceness' in limits:
+            os.setpriority(os.PRIO_PROCESS, process.pid, limits['niceness'])
+        if 'memory_limit' in limits and hasattr(resource, 'prlimit'):
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (limits['memory_limit'], limits['memory_limit']))
+    except ProcessLookupError:
+        # already exited
+        pass
+    return process
+
+def colmap_mapper_command(job_path, job):
+    """Write a `pycolmap.incremental_mapping` job to `job_path`, and build the command line and `start_process`
+    options that run it in a process of its own"""
+    with open(job_path, "wb") as f:
+        pickle.dump(job, f)
+    env = os.environ.copy()
+    # the mapper process runs Blender's Python without Blender, so it needs to be told where pycolmap is installed
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path != "")
+    return [sys.executable, str((Path(__file__).parent.parent / "colmap" / "mapper.py").resolve()), str(job_path)], { 'env': env }
+
+def follow_glomap_output(process, on_message, on_progress):
+    """Echo glomap's output and report the current stage and progress until the process exits"""
+    progress_expression = re.compile(r"(\d+) \/ (\d+)")
+    message_expression = re.compile(r"-+\nRunning ([\w\s]+) \.\.\.\n-+")
+    buffer = ""
+    for line in process.stdout:
+        print(line, end='')
+        buffer += line
+        progress_match = progress_expression.search(buffer)
+        message_match = message_expression.search(buffer)
+        if message_match:
+            on_message(message_match.group(1).title())
+        if progress_match:
+            on_progress(int(progress_match.group(1)), int(progress_match.group(2)))
+        if progress_match or message_match:
+            buffer = ''
+    return process.wait()
+
+def follow_colmap_mapper(process, log_path, on_progress):
+    """Echo the output of a `colmap_mapper_command` process and report the images registered so far, read from
+    the log it writes to `log_path`, until the process exits"""
+    # COLMAP logs "Registering image #12 (13)", or "(num_reg_frames=13)" in newer versions
+    registered_expression = re.compile(r"Registering image #\d+ \((?:num_reg_\w+=)?(\d+)\)")
+
+    # the output is drained on a thread of its own, so the pipe never fills up and blocks the mapper
+    def echo_output():
+        for line in process.stdout:
+            print(line, end='')
+    echo = threading.Thread(target=echo_output, daemon=True)
+    echo.start()
+
+    position = 0
+    partial_line = ""
+    while True:
+        # checked before reading, so whatever was logged right before exiting is still read
+        exited = process.poll() is not None
+        log_paths = glob.glob(f"{log_path}*")
+        if len(log_paths) > 0:
+            with open(log_paths[0], "r", errors="ignore") as f:
+                f.seek(position)
+                partial_line += f.read()
+                position = f.tell()
+            registered_match = None
+            for registered_match in registered_expression.finditer(partial_line):
+                pass
+            if registered_match:
+                on_progress(int(registered_match.group(1)))
+                partial_line = ""
+        if exited:
+            break
+        time.sleep(0.25)
+    echo.join()
+    return process.returncode
+
+def prepare_glomap_solve(clip):
+    """Build the glomap command and the colorization settings for a clip, and record the snapshot it is solved with"""
+    database_path, images_path, reconstruction_path = prepare_database(clip)
+
+    clip.colmap.cached_results.solve_snapshot = record_solve_snapshot(database_path, reconstruction_path) or ""
+
+    return {
+        'glomap': glomap_command(clip, database_path, reconstruction_path),
+        'images_path': images_path,
+        'output_path': reconstruction_path,
+        'colorize_samples': clip.glomap.colorize_samples if clip.glomap.use_colorize else 0,
+    }
+
+def glomap_solve(args, on_message, on_progress):
+    """Run glomap, then colorize its models if requested. Returns the exit code of glomap"""
+    command, process_options = args['glomap']
+    process = start_process(command, process_options)
+    follow_glomap_output(process, on_message, on_progress)
+
+    if process.returncode == 0 and args['colorize_samples'] > 0:
+        on_message("Colorizing points")
+        colorize_models(list_models(args['output_path']), args['images_path'], args['colorize_samples'], on_progress=on_progress)
+
+    return process.returncode
 
 class GlomapSolveOperator(BlockingOperator):
     bl_idname = "colmap.glomap"
@@ -13,51 +172,424 @@ class GlomapSolveOperator(BlockingOperator):
 
     parse_logs = False
 
+    def prepare(self, context):
+        return (prepare_glomap_solve(context.space_data.clip),)
+
+    def execute_async(self, args):
+        def on_message(message):
+            self._message = message
+        def on_progress(current, total):
+            self._progress_current = current
+            self._progress_total = total
+        glomap_solve(args, on_message, on_progress)
+
+        return {'FINISHED'}
+
+class GlomapColorizePointsOperator(BlockingOperator):
+    bl_idname = "colmap.colorize_points"
+    bl_label = "Colorize Points"
+    bl_description = "Sample the color of every 3D point from the frames it was observed in"
+
+    parse_logs = False
+
+    def prepare(self, context):
+        sc = context.space_data
+        clip = sc.clip
+
+        _, images_path, reconstruction_path = prepare_database(clip)
+
+        model_paths = list_models(reconstruction_path)
+        if len(model_paths) == 0:
+            raise Exception("No reconstruction found, solve camera motion first")
+
+        return ({
+            'model_paths': model_paths,
+            'images_path': images_path,
+            'max_samples': clip.glomap.colorize_samples,
+        },)
+
+    def execute_async(self, args):
+        def on_progress(current, total):
+            self._progress_current = current
+            self._progress_total = total
+        colorize_models(**args, on_progress=on_progress)
+        return {'FINISHED'}
+
+class GlomapRaceSolveOperator(BlockingOperator):
+    bl_idname = "colmap.race_solve"
+    bl_label = "Race GLOMAP and COLMAP"
+    bl_description = "Solve camera motion with GLOMAP and COLMAP at the same time and keep the better result"
+
+    parse_logs = False
+
+    _winner = None
+
     def prepare(self, context):
         sc = context.space_data
         clip = sc.clip
 
         database_path, images_path, reconstruction_path = prepare_database(clip)
 
-        # path to the precompiled glomap executable
-        if sys.platform.startswith('win'):
-            executable = Path(__file__).parent / "../../glomap_subprocess/glomap.exe"
-        elif sys.platform == 'darwin':
-            executable = Path(__file__).parent / "../../glomap_subprocess/glomap.app/Contents/MacOS/glomap"
-        else:
-            executable = Path(__file__).parent / "../../glomap_subprocess/glomap.AppImage"
-        
-        return ([
-            str(executable.resolve()),
-            "mapper",
-            "--database_path", str(database_path),
-            "--output_path", str(reconstruction_path),
-        ],)
+        # the previous race is deleted in the background, so a large one never freezes the UI
+        workspace = clip_path(clip)
+        race_path = workspace / "race"
+        tombstone(race_path)
+        glomap_path = race_path / "glomap"
+        colmap_path = race_path / "colmap"
+        glomap_path.mkdir(parents=True)
+        colmap_path.mkdir(parents=True)
+
+        # the winner's folder replaces the reconstruction, so both carry the record
+        record_solve_snapshot(database_path, glomap_path)
+        clip.colmap.cached_results.solve_snapshot = record_solve_snapshot(database_path, colmap_path) or ""
+
+        race = clip.glomap.race
+        target = (race.target_registered_ratio, race.target_max_reprojection_error) if race.use_target else None
+
+        colmap_log_path = race_path / "colmap_log_"
+
+        return ({
+            'glomap': glomap_command(clip, database_path, glomap_path),
+            'glomap_path': glomap_path,
+            # in a process of its own like GLOMAP, so a crash of the mapper only loses its side of the race
+            'colmap': colmap_mapper_command(race_path / "job.pickle", {
+                'database_path': database_path,
+                'image_path': images_path,
+                'output_path': colmap_path,
+                'options': clip.colmap.incremental_pipeline.build(),
+                'log_path': colmap_log_path,
+            }),
+            'colmap_path': colmap_path,
+            'colmap_log_path': colmap_log_path,
+            'images_path': images_path,
+            'workspace': workspace,
+            'race_path': race_path,
+            'reconstruction_path': reconstruction_path,
+            'colorize_samples': clip.glomap.colorize_samples if clip.glomap.use_colorize else 0,
+            'target': target,
+        },)
 
     def execute_async(self, args):
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        delete_tombstones(args['workspace'])
 
-        progress_expression = re.compile(r"(\d+) \/ (\d+)")
-        message_expression = re.compile(r"-+\nRunning ([\w\s]+) \.\.\.\n-+")
-        buffer = ""
-        for line in process.stdout:
-            print(line, end='')
-            buffer += line
-            progress_match = progress_expression.search(buffer)
-            message_match = message_expression.search(buffer)
-            if message_match:
-                self._message = message_match.group(1).title()
-            if progress_match:
-                self._progress_current = int(progress_match.group(1))
-                self._progress_total = int(progress_match.group(2))
-            if progress_match or message_match:
-                buffer = ''
-        process.wait()
+        num_images = len(os.listdir(args['images_path']))
+        self._progress_total = num_images
+        self._winner = None
+
+        lock = threading.Lock()
+        cancel = threading.Event()
+        results = {}
+        processes = {}
+
+        # COLMAP's registered images drive the progress bar, GLOMAP's stage and progress are shown next to it
+        status = {'GLOMAP': "Starting", 'COLMAP': 0}
+        def update_status():
+            self._message = f"GLOMAP: {status['GLOMAP']}, COLMAP: {status['COLMAP']} / {num_images} frames"
+            self._progress_current = status['COLMAP']
+        update_status()
+
+        def meets_target(stats):
+            if args['target'] is None or stats is None:
+                return False
+            registered_ratio, max_reprojection_error = args['target']
+            return stats['num_reg_images'] >= registered_ratio * num_images and stats['mean_reprojection_error'] <= max_reprojection_error
+
+        def finish(solver, output_path):
+            model_path = largest_model(output_path)
+            stats = reconstruction_stats(model_path) if model_path is not None else None
+            with lock:
+                results[solver] = (stats, output_path)
+                if meets_target(stats):
+                    # the other solver is stopped like a cancelled solve, its partial result is never used
+                    cancel.set()
+                    for process in processes.values():
+                        if process.poll() is None:
+                            process.terminate()
+
+        def start(solver):
+            command, process_options = args[solver.lower()]
+            with lock:
+                if cancel.is_set():
+                    return None
+                processes[solver] = start_process(command, process_options)
+                return processes[solver]
+
+        def solve_glomap():
+            process = start('GLOMAP')
+            if process is None:
+                return
+            stage = "Starting"
+            def on_message(message):
+                nonlocal stage
+                stage = message
+                status['GLOMAP'] = stage
+                update_status()
+            def on_progress(current, total):
+                status['GLOMAP'] = f"{stage} {current} / {total}"
+                update_status()
+            if follow_glomap_output(process, on_message, on_progress) == 0:
+                status['GLOMAP'] = "Done"
+                update_status()
+                finish('GLOMAP', args['glomap_path'])
+
+        def solve_colmap():
+            process = start('COLMAP')
+            if process is None:
+                return
+            def on_progress(num_reg_images):
+                status['COLMAP'] = num_reg_images
+                update_status()
+            if follow_colmap_mapper(process, args['colmap_log_path'], on_progress) == 0:
+                finish('COLMAP', args['colmap_path'])
+
+        threads = [threading.Thread(target=solve_glomap), threading.Thread(target=solve_colmap)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if len(results) > 0:
+            winner = max(results, key=lambda solver: stats_key(results[solver][0]))
+            stats, output_path = results[winner]
+            if stats is not None:
+                reconstruction_path = args['reconstruction_path']
+                shutil.rmtree(reconstruction_path)
+                shutil.move(output_path, reconstruction_path)
+                self._winner = (winner, stats)
+
+                # GLOMAP leaves its points black, like in `glomap_solve`, only the winner is worth colorizing
+                if winner == 'GLOMAP' and args['colorize_samples'] > 0:
+                    def on_progress(current, total):
+                        self._progress_current = current
+                        self._progress_total = total
+                    self._message = "Colorizing points"
+                    colorize_models(list_models(reconstruction_path), args['images_path'], args['colorize_samples'], on_progress=on_progress)
+
+        shutil.rmtree(args['race_path'], ignore_errors=True)
+
+        return {'FINISHED'}
+
+    def modal(self, context, event):
+        result = super().modal(context, event)
+        if result == {'FINISHED'}:
+            if self._winner is None:
+                self.report({'ERROR'}, "Neither GLOMAP nor COLMAP produced a reconstruction")
+            else:
+                winner, stats = self._winner
+                self.report({'INFO'}, f"Kept {winner} result: {stats['num_reg_images']} frames, {stats['mean_reprojection_error']:.3f}px mean error")
+        return result
+
+class GlomapSweepOperator(BlockingOperator):
+    bl_idname = "colmap.sweep"
+    bl_label = "Run Sweep"
+    bl_description = "Solve once for every combination of the sweep values and compare the results"
+
+    parse_logs = False
+
+    _results = None
+
+    def prepare(self, context):
+        sc = context.space_data
+        clip = sc.clip
+        sweep = clip.glomap.sweep
+
+        if len(sweep.parameters) == 0:
+            raise Exception("Add at least one property to sweep")
+
+        grid = [(parameter.data_path.strip(), parameter.parse_values(clip)) for parameter in sweep.parameters]
+        data_paths = [data_path for data_path, _ in grid]
+
+        database_path, images_path, _ = prepare_database(clip)
+
+        # the previous sweep is deleted in the background, so a large one never freezes the UI
+        workspace = clip_path(clip)
+        sweep_path = workspace / "sweep"
+        tombstone(sweep_path)
+
+        # build every configuration with the regular `build()` and `arguments()`, then restore the user's settings
+        originals = {}
+        for data_path in data_paths:
+            owner, name = resolve_property(clip, data_path)
+            originals[data_path] = getattr(owner, name)
+
+        runs = []
+        try:
+            for i, values in enumerate(itertools.product(*(values for _, values in grid))):
+                assignments = dict(zip(data_paths, values))
+                assign_properties(clip, assignments)
+
+                run_path = sweep_path / f"{i:03d}"
+                output_path = run_path / "reconstruction"
+                output_path.mkdir(parents=True)
+                run_database_path = run_path / "database.db"
+
+                match sweep.solver:
+                    case 'GLOMAP':
+                        job = glomap_command(clip, run_database_path, output_path)
+                    case 'COLMAP':
+                        # in a process of its own like GLOMAP, so `max_workers` bounds the processes and a crash only fails its run
+                        job = colmap_mapper_command(run_path / "job.pickle", {
+                            'database_path': run_database_path,
+                            'image_path': images_path,
+                            'output_path': output_path,
+                            'options': clip.colmap.incremental_pipeline.build()
+                        })
+                runs.append((assignments, run_path, output_path, job))
+        finally:
+            assign_properties(clip, originals)
+
+        return ({
+            'solver': sweep.solver,
+            'max_workers': sweep.max_workers,
+            'database_path': database_path,
+            'workspace': workspace,
+            'sweep_path': sweep_path,
+            'data_paths': data_paths,
+            'runs': runs,
+        },)
+
+    def execute_async(self, args):
+        delete_tombstones(args['workspace'])
+
+        runs = args['runs']
+        self._progress_current = 0
+        self._progress_total = len(runs)
+        self._message = f"Sweep ({len(runs)} solves)"
+        lock = threading.Lock()
+
+        def solve(run):
+            assignments, run_path, output_path, job = run
+            run_database_path = run_path / "database.db"
+            start = time.perf_counter()
+            stats = None
+            error = ""
+            # a failing combination is recorded and the sweep goes on with the rest
+            try:
+                # every solve gets its own copy of the database so SQLite never contends between workers
+                copy_database(args['database_path'], run_database_path)
+
+                command, process_options = job
+                process = start_process(command, process_options)
+                output, _ = process.communicate()
+                if process.returncode != 0:
+                    lines = output.strip().splitlines()
+                    error = lines[-1] if len(lines) > 0 else f"{args['solver']} exited with code {process.returncode}"
+
+                model_path = largest_model(output_path)
+                stats = reconstruction_stats(model_path) if model_path is not None else None
+            except Exception as e:
+                error = str(e)
+            finally:
+                # only the reconstruction and results.csv are kept, a copy per run would soon outgrow any storage budget
+                remove_database(run_database_path)
+                (run_path / "job.pickle").unlink(missing_ok=True)
+            runtime = time.perf_counter() - start
+
+            with lock:
+                self._progress_current += 1
+            return assignments, runtime, stats, error
+
+        with ThreadPoolExecutor(max_workers=args['max_workers']) as executor:
+            results = list(executor.map(solve, runs))
+
+        with open(args['sweep_path'] / "results.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["run", *args['data_paths'], "runtime", "num_reg_images", "num_points3D", "mean_reprojection_error", "mean_track_length", "error"])
+            for i, (assignments, runtime, stats, error) in enumerate(results):
+                stats_row = [stats[key] for key in ('num_reg_images', 'num_points3D', 'mean_reprojection_error', 'mean_track_length')] if stats is not None else ["", "", "", ""]
+                writer.writerow([i, *(assignments[data_path] for data_path in args['data_paths']), f"{runtime:.3f}", *stats_row, error])
+
+        self._results = results
+
+        return {'FINISHED'}
+
+    def modal(self, context, event):
+        clip = self._clip
+        result = super().modal(context, event)
+        if result == {'FINISHED'} and self._results is not None:
+            sweep = clip.glomap.sweep
+            sweep.results.clear()
+            for assignments, runtime, stats, error in self._results:
+                item = sweep.results.add()
+                item.label = ", ".join(f"{data_path.rpartition('.')[2]}={value}" for data_path, value in assignments.items())
+                item.assignments = json.dumps(assignments)
+                item.runtime = runtime
+                item.succeeded = stats is not None
+                item.error = error
+                if stats is not None:
+                    item.num_reg_images = stats['num_reg_images']
+                    item.mean_reprojection_error = stats['mean_reprojection_error']
+                    item.mean_track_length = stats['mean_track_length']
+            succeeded = [i for i, (_, _, stats, _) in enumerate(self._results) if stats is not None]
+            sweep.best_result = max(succeeded, key=lambda i: stats_key(self._results[i][2])) if len(succeeded) > 0 else -1
+            self._results = None
+        return result
+
+class GlomapSweepAddParameterOperator(bpy.types.Operator):
+    bl_idname = "colmap.sweep_add_parameter"
+    bl_label = "Add Sweep Property"
+    bl_description = "Add a solver property to the sweep grid"
+
+    def execute(self, context):
+        sc = context.space_data
+        clip = sc.clip
+
+        clip.glomap.sweep.parameters.add()
+
+        return {'FINISHED'}
+
+class GlomapSweepRemoveParameterOperator(bpy.types.Operator):
+    bl_idname = "colmap.sweep_remove_parameter"
+    bl_label = "Remove Sweep Property"
+    bl_description = "Remove a solver property from the sweep grid"
+
+    index: bpy.props.IntProperty()
+
+    def execute(self, context):
+        sc = context.space_data
+        clip = sc.clip
+
+        clip.glomap.sweep.parameters.remove(self.index)
+
+        return {'FINISHED'}
+
+class GlomapSweepApplyOperator(bpy.types.Operator):
+    bl_idname = "colmap.sweep_apply"
+    bl_label = "Apply Sweep Result"
+    bl_description = "Apply the solver settings of a sweep result"
+
+    index: bpy.props.IntProperty(default=-1, description="Result to apply, or -1 for the best result")
+
+    def execute(self, context):
+        sc = context.space_data
+        clip = sc.clip
+        sweep = clip.glomap.sweep
+
+        index = sweep.best_result if self.index < 0 else self.index
+        if index < 0 or index >= len(sweep.results):
+            self.report({'ERROR'}, "Run a sweep first")
+            return {'CANCELLED'}
+
+        sweep.results[index].apply(clip)
 
         return {'FINISHED'}
 
 def register():
     bpy.utils.register_class(GlomapSolveOperator)
+    bpy.utils.register_class(GlomapColorizePointsOperator)
+    bpy.utils.register_class(GlomapRaceSolveOperator)
+
+    bpy.utils.register_class(GlomapSweepOperator)
+    bpy.utils.register_class(GlomapSweepAddParameterOperator)
+    bpy.utils.register_class(GlomapSweepRemoveParameterOperator)
+    bpy.utils.register_class(GlomapSweepApplyOperator)
 
 def unregister():
-    bpy.utils.unregister_class(GlomapSolveOperator)
\ No newline at end of file
+    bpy.utils.unregister_class(GlomapSolveOperator)
+    bpy.utils.unregister_class(GlomapColorizePointsOperator)
+    bpy.utils.unregister_class(GlomapRaceSolveOperator)
+
+    bpy.utils.unregister_class(GlomapSweepOperator)
+    bpy.utils.unregister_class(GlomapSweepAddParameterOperator)
+    bpy.utils.unregister_class(GlomapSweepRemoveParameterOperator)
+    bpy.utils.unregister_class(GlomapSweepApplyOperator)
\ No newline at end of file
@@ -1,7 +1,7 @@
 import bpy
 
-from .operators import GlomapSolveOperator
-from ..colmap.operators import ColmapSetupTrackingSceneOperator, ColmapClearReconstructionOperator, ColmapSetOriginOperator, ColmapSetFloorOperator, ColmapSetScaleOperator
+from .operators import GlomapSolveOperator, GlomapColorizePointsOperator, GlomapRaceSolveOperator, GlomapSweepOperator, GlomapSweepAddParameterOperator, GlomapSweepRemoveParameterOperator, GlomapSweepApplyOperator
+from ..colmap.operators import ColmapSetupTrackingSceneOperator, ColmapExportTracksOperator, ColmapUndistortFramesOperator, ColmapFilterPointsOperator, ColmapClearReconstructionOperator, ColmapSetOriginOperator, ColmapSetFloorOperator, ColmapSetScaleOperator
 
 class CLIP_PT_GlomapSolverPanel(bpy.types.Panel):
     bl_space_type = 'CLIP_EDITOR'
@@ -29,18 +29,37 @@ class CLIP_PT_GlomapSolverPanel(bpy.types.Panel):
         layout.prop(clip.glomap, "use_preprocessing")
         layout.prop(clip.glomap, "use_rotation_averaging")
         layout.prop(clip.glomap, "use_pruning")
+        layout.prop(clip.glomap, "use_colorize")
+        if clip.glomap.use_colorize:
+            layout.prop(clip.glomap, "colorize_samples")
 
         col = layout.column(align=True)
         col.scale_y = 2.0
         col.operator(GlomapSolveOperator.bl_idname, text="Solve Camera Motion")
+        layout.operator(GlomapRaceSolveOperator.bl_idname)
+
+        if clip.colmap.cached_results.solve_snapshot != "":
+            col = layout.column()
+            col.alignment = 'RIGHT'
+            col.label(text=f"Solved With Snapshot: {clip.colmap.cached_results.solve_snapshot}")
         
         layout.separator()
 
+        layout.prop(clip.colmap, "model")
+        layout.prop(clip.colmap, "use_filtered")
+        layout.prop(clip.colmap, "point_cloud_type")
+        if clip.colmap.point_cloud_type == 'POINTS':
+            layout.prop(clip.colmap, "lod_levels")
+            layout.prop(clip.colmap, "point_radius")
         layout.operator(ColmapSetupTrackingSceneOperator.bl_idname)
+        layout.operator(GlomapColorizePointsOperator.bl_idname)
+        layout.operator(ColmapExportTracksOperator.bl_idname)
+        layout.operator(ColmapUndistortFramesOperator.bl_idname)
 
         col = layout.column(align=True)
         col.operator(ColmapSetOriginOperator.bl_idname)
         col.operator(ColmapSetFloorOperator.bl_idname)
+        col.operator(ColmapSetFloorOperator.bl_idname, text="Auto Floor").mode = 'AUTO'
         
         set_scale = layout.operator(ColmapSetScaleOperator.bl_idname)
         layout.prop(set_scale, "distance")
@@ -61,6 +80,114 @@ class BaseGlomapPanel(bpy.types.Panel):
     def poll(cls, context):
         return context.space_data.mode == 'TRACKING'
 
+class CLIP_PT_GlomapProcess(BaseGlomapPanel):
+    bl_label = "Process"
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        layout.prop(clip.glomap.process, "num_threads")
+        layout.prop(clip.glomap.process, "cpu_affinity")
+        layout.prop(clip.glomap.process, "priority")
+        layout.prop(clip.glomap.process, "memory_limit")
+
+class CLIP_PT_GlomapRace(BaseGlomapPanel):
+    bl_label = "Race"
+
+    def draw_header(self, context):
+        self.layout.prop(context.space_data.clip.glomap.race, "use_target", text="")
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        layout.enabled = clip.glomap.race.use_target
+
+        layout.prop(clip.glomap.race, "target_registered_ratio")
+        layout.prop(clip.glomap.race, "target_max_reprojection_error")
+
+class CLIP_PT_FilterPoints(BaseGlomapPanel):
+    bl_label = "Filter Points"
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+
+        layout.prop(clip.colmap.filter_points, "max_error")
+        layout.prop(clip.colmap.filter_points, "min_track_length")
+        layout.prop(clip.colmap.filter_points, "min_tri_angle")
+        layout.prop(clip.colmap.filter_points, "use_statistical")
+        col = layout.column()
+        col.enabled = clip.colmap.filter_points.use_statistical
+        col.prop(clip.colmap.filter_points, "num_neighbors")
+        col.prop(clip.colmap.filter_points, "std_ratio")
+
+        layout.operator(ColmapFilterPointsOperator.bl_idname)
+
+class CLIP_PT_GlomapSweep(BaseGlomapPanel):
+    bl_label = "Parameter Sweep"
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        sc = context.space_data
+        clip = sc.clip
+        sweep = clip.glomap.sweep
+
+        layout.prop(sweep, "solver")
+        layout.prop(sweep, "max_workers")
+
+        for i, parameter in enumerate(sweep.parameters):
+            box = layout.box()
+            row = box.row(align=True)
+            row.prop(parameter, "data_path", text="")
+            row.operator(GlomapSweepRemoveParameterOperator.bl_idname, text="", icon="X").index = i
+            box.prop(parameter, "values", text="")
+        layout.operator(GlomapSweepAddParameterOperator.bl_idname, icon="ADD")
+
+        col = layout.column(align=True)
+        col.scale_y = 2.0
+        col.operator(GlomapSweepOperator.bl_idname)
+
+        if len(sweep.results) > 0:
+            layout.use_property_split = False
+            col = layout.column(align=True)
+            row = col.row()
+            row.label(text="Settings")
+            row.label(text="Time")
+            row.label(text="Frames")
+            row.label(text="Error")
+            for i, result in enumerate(sweep.results):
+                row = col.row()
+                row.alert = not result.succeeded
+                row.label(text=result.label, icon="SOLO_ON" if i == sweep.best_result else "BLANK1")
+                row.label(text=f"{result.runtime:.1f}s")
+                row.label(text=f"{result.num_reg_images}" if result.succeeded else "-")
+                row.label(text=f"{result.mean_reprojection_error:.3f}" if result.succeeded else "-")
+                row.operator(GlomapSweepApplyOperator.bl_idname, text="", icon="CHECKMARK").index = i
+                if result.error != "":
+                    col.label(text=result.error, icon="ERROR")
+            layout.operator(GlomapSweepApplyOperator.bl_idname, text="Apply Best").index = -1
+
 class CLIP_PT_ViewGraphCalibration(BaseGlomapPanel):
     bl_label = "View Graph Calibration"
 
@@ -220,6 +347,10 @@ def register():
     bpy.utils.register_class(CLIP_PT_BundleAdjustment)
     bpy.utils.register_class(CLIP_PT_Triangulation)
     bpy.utils.register_class(CLIP_PT_Thresholds)
+    bpy.utils.register_class(CLIP_PT_GlomapProcess)
+    bpy.utils.register_class(CLIP_PT_GlomapRace)
+    bpy.utils.register_class(CLIP_PT_GlomapSweep)
+    bpy.utils.register_class(CLIP_PT_FilterPoints)
 
 def unregister():
     bpy.utils.unregister_class(CLIP_PT_GlomapSolverPanel)
@@ -230,4 +361,8 @@ def unregister():
     bpy.utils.unregister_class(CLIP_PT_GlobalPositioning)
     bpy.utils.unregister_class(CLIP_PT_BundleAdjustment)
     bpy.utils.unregister_class(CLIP_PT_Triangulation)
-    bpy.utils.unregister_class(CLIP_PT_Thresholds)
\ No newline at end of file
+    bpy.utils.unregister_class(CLIP_PT_Thresholds)
+    bpy.utils.unregister_class(CLIP_PT_GlomapProcess)
+    bpy.utils.unregister_class(CLIP_PT_GlomapRace)
+    bpy.utils.unregister_class(CLIP_PT_GlomapSweep)
+    bpy.utils.unregister_class(CLIP_PT_FilterPoints)
\ No newline at end of file
@@ -1,4 +1,8 @@
 import bpy
+import os
+import sys
+import subprocess
+import json
 
 class ViewGraphCalibrationPropertyGroup(bpy.types.PropertyGroup):
     # --ViewGraphCalib.thres_lower_ratio arg (=0.10000000000000001)
@@ -52,7 +56,7 @@ class GlobalPositioningPropertyGroup(bpy.types.PropertyGroup):
     # --GlobalPositioning.thres_loss_function arg (=0.10000000000000001)
     thres_loss_function: bpy.props.FloatProperty(name="Threshold Loss Function", default=0.10000000000000001)
     # --GlobalPositioning.max_num_iterations arg (=100)
-    max_num_iterations: bpy.props.FloatProperty(name="Max Iterations", default=100)
+    max_num_iterations: bpy.props.IntProperty(name="Max Iterations", default=100)
 
     def arguments(self):
         return [
@@ -141,6 +145,147 @@ class ThresholdsPropertyGroup(bpy.types.PropertyGroup):
             "--Thresholds.max_rotation_error", self.max_rotation_error,
         ]
 
+class ProcessPropertyGroup(bpy.types.PropertyGroup):
+    num_threads: bpy.props.IntProperty(name="Threads", default=0, min=0, description="Maximum number of threads the solver may use. Set to 0 to use all cores")
+    cpu_affinity: bpy.props.StringProperty(name="CPU Affinity", default="", description="Cores the solver may run on, i.e. '0-3,8'. Leave empty to allow all cores. Only supported on Linux")
+    priority: bpy.props.EnumProperty(
+        name="Priority",
+        items=[
+            ('NORMAL', 'Normal', 'Run the solver with normal process priority'),
+            ('BELOW_NORMAL', 'Below Normal', 'Run the solver with lowered process priority'),
+            ('IDLE', 'Idle', 'Only run the solver when the machine is otherwise idle'),
+        ],
+        default='NORMAL'
+    )
+    memory_limit: bpy.props.IntProperty(name="Memory Limit", default=0, min=0, description="Maximum memory the solver may allocate in MB. Set to 0 for no limit. Only supported on Linux. This limits the address space, which leaves CUDA too little to reserve, so it cannot be combined with 'Use GPU'")
+
+    def cpus(self):
+        """Parse `cpu_affinity` into a set of core indices, or `None` if unrestricted"""
+        if self.cpu_affinity.strip() == "":
+            cpus = None
+        else:
+            cpus = set()
+            for part in self.cpu_affinity.split(","):
+                part = part.strip()
+                if "-" in part:
+                    start, end = part.split("-")
+                    cpus.update(range(int(start), int(end) + 1))
+                elif part != "":
+                    cpus.add(int(part))
+        if self.num_threads > 0:
+            # glomap sizes its thread pools from the number of available cores
+            available = sorted(cpus) if cpus is not None else list(range(os.cpu_count() or 1))
+            cpus = set(available[:self.num_threads])
+        return cpus
+
+    def build(self):
+        """Keyword arguments for `subprocess.Popen`, and the `limits` that `start_process` applies once the child runs"""
+        env = os.environ.copy()
+        if self.num_threads > 0:
+            env['OMP_NUM_THREADS'] = str(self.num_threads)
+
+        kwargs = { 'env': env }
+
+        if sys.platform.startswith('win'):
+            match self.priority:
+                case 'BELOW_NORMAL':
+                    kwargs['creationflags'] = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+                case 'IDLE':
+                    kwargs['creationflags'] = subprocess.IDLE_PRIORITY_CLASS
+            return kwargs
+
+        limits = {}
+        cpus = self.cpus()
+        if cpus is not None:
+            limits['cpus'] = cpus
+        niceness = { 'NORMAL': 0, 'BELOW_NORMAL': 10, 'IDLE': 19 }[self.priority]
+        if niceness > 0:
+            limits['niceness'] = niceness
+        if self.memory_limit > 0:
+            limits['memory_limit'] = self.memory_limit * 1024 * 1024
+        if len(limits) > 0:
+            kwargs['limits'] = limits
+        return kwargs
+
+class RacePropertyGroup(bpy.types.PropertyGroup):
+    use_target: bpy.props.BoolProperty(name="Stop at Target", default=False, description="Cancel the other solver as soon as one result reaches the quality target")
+    target_registered_ratio: bpy.props.FloatProperty(name="Registered Frames", default=0.95, min=0, max=1, subtype='FACTOR', description="Fraction of frames that must be registered to reach the target")
+    target_max_reprojection_error: bpy.props.FloatProperty(name="Max Reprojection Error", default=1.0, min=0, description="Maximum mean reprojection error in pixels to reach the target")
+
+def resolve_property(clip, data_path):
+    """Find the property group and property name for a data path relative to the clip"""
+    owner_path, _, name = data_path.strip().rpartition(".")
+    try:
+        owner = clip.path_resolve(owner_path) if owner_path != "" else clip
+    except ValueError:
+        owner = None
+    if owner is None or name not in owner.bl_rna.properties:
+        raise Exception(f"'{data_path}' is not a solver property")
+    return owner, name
+
+def assign_properties(clip, assignments):
+    """Set each `{data_path: value}` in assignments on the clip"""
+    for data_path, value in assignments.items():
+        owner, name = resolve_property(clip, data_path)
+        setattr(owner, name, value)
+
+class SweepParameterPropertyGroup(bpy.types.PropertyGroup):
+    data_path: bpy.props.StringProperty(name="Property", description="Path of the solver property relative to the clip, i.e. 'glomap.thresholds.max_reprojection_error'")
+    values: bpy.props.StringProperty(name="Values", description="Comma separated values to try")
+
+    def parse_values(self, clip):
+        owner, name = resolve_property(clip, self.data_path)
+        prop = owner.bl_rna.properties[name]
+        values = []
+        for value in self.values.split(","):
+            value = value.strip()
+            if value == "":
+                continue
+            match prop.type:
+                case 'BOOLEAN':
+                    values.append(value.lower() in ("1", "true", "yes", "on"))
+                case 'INT':
+                    values.append(int(value))
+                case 'FLOAT':
+                    values.append(float(value))
+                case 'ENUM':
+                    if value not in prop.enum_items.keys():
+                        raise Exception(f"'{value}' is not a valid value for '{self.data_path}'")
+                    values.append(value)
+                case _:
+                    raise Exception(f"'{self.data_path}' cannot be swept")
+        if len(values) == 0:
+            raise Exception(f"No values to try for '{self.data_path}'")
+        return values
+
+class SweepResultPropertyGroup(bpy.types.PropertyGroup):
+    label: bpy.props.StringProperty()
+    assignments: bpy.props.StringProperty() # JSON encoded {data_path: value}
+    succeeded: bpy.props.BoolProperty()
+    error: bpy.props.StringProperty()
+    runtime: bpy.props.FloatProperty()
+    num_reg_images: bpy.props.IntProperty()
+    mean_reprojection_error: bpy.props.FloatProperty()
+    mean_track_length: bpy.props.FloatProperty()
+
+    def apply(self, clip):
+        assign_properties(clip, json.loads(self.assignments))
+
+class SweepPropertyGroup(bpy.types.PropertyGroup):
+    solver: bpy.props.EnumProperty(
+        name="Solver",
+        items=[
+            ('GLOMAP', 'GLOMAP', 'Sweep GLOMAP solves'),
+            ('COLMAP', 'COLMAP', 'Sweep COLMAP incremental solves'),
+        ],
+        default='GLOMAP'
+    )
+    max_workers: bpy.props.IntProperty(name="Parallel Solves", default=2, min=1, description="Maximum number of solves to run at the same time")
+
+    parameters: bpy.props.CollectionProperty(type=SweepParameterPropertyGroup)
+    results: bpy.props.CollectionProperty(type=SweepResultPropertyGroup)
+    best_result: bpy.props.IntProperty(default=-1)
+
 class GlomapPropertyGroup(bpy.types.PropertyGroup):
     # --GlobalPositioning.use_gpu 1 --BundleAdjustment.use_gpu
     use_gpu: bpy.props.BoolProperty(name="Use GPU", default=True)
@@ -166,6 +311,10 @@ class GlomapPropertyGroup(bpy.types.PropertyGroup):
     # --skip_pruning arg (=1)
     use_pruning: bpy.props.BoolProperty(name="Prune", default=False)
 
+    # GLOMAP leaves every point black, colors are sampled from the frames after solving
+    use_colorize: bpy.props.BoolProperty(name="Colorize Points", default=True, description="Sample point colors from the frames after solving")
+    colorize_samples: bpy.props.IntProperty(name="Color Samples", default=3, min=1, description="Number of observations averaged for the color of each point")
+
     view_graph_calibration: bpy.props.PointerProperty(type=ViewGraphCalibrationPropertyGroup)
     relative_pose_estimation: bpy.props.PointerProperty(type=RelativePoseEstimationPropertyGroup)
     track_establishment: bpy.props.PointerProperty(type=TrackEstablishmentPropertyGroup)
@@ -174,6 +323,10 @@ class GlomapPropertyGroup(bpy.types.PropertyGroup):
     triangulation: bpy.props.PointerProperty(type=TriangulationPropertyGroup)
     thresholds: bpy.props.PointerProperty(type=ThresholdsPropertyGroup)
 
+    process: bpy.props.PointerProperty(type=ProcessPropertyGroup)
+    race: bpy.props.PointerProperty(type=RacePropertyGroup)
+    sweep: bpy.props.PointerProperty(type=SweepPropertyGroup)
+
     def arguments(self):
         return [
             "--GlobalPositioning.use_gpu", self.use_gpu,
@@ -206,6 +359,11 @@ def register():
     bpy.utils.register_class(BundleAdjustmentPropertyGroup)
     bpy.utils.register_class(TriangulationPropertyGroup)
     bpy.utils.register_class(ThresholdsPropertyGroup)
+    bpy.utils.register_class(ProcessPropertyGroup)
+    bpy.utils.register_class(RacePropertyGroup)
+    bpy.utils.register_class(SweepParameterPropertyGroup)
+    bpy.utils.register_class(SweepResultPropertyGroup)
+    bpy.utils.register_class(SweepPropertyGroup)
     bpy.utils.register_class(GlomapPropertyGroup)
 
     bpy.types.MovieClip.glomap = bpy.props.PointerProperty(type=GlomapPropertyGroup)
@@ -218,4 +376,9 @@ def unregister():
     bpy.utils.unregister_class(BundleAdjustmentPropertyGroup)
     bpy.utils.unregister_class(TriangulationPropertyGroup)
     bpy.utils.unregister_class(ThresholdsPropertyGroup)
+    bpy.utils.unregister_class(ProcessPropertyGroup)
+    bpy.utils.unregister_class(RacePropertyGroup)
+    bpy.utils.unregister_class(SweepParameterPropertyGroup)
+    bpy.utils.unregister_class(SweepResultPropertyGroup)
+    bpy.utils.unregister_class(SweepPropertyGroup)
     bpy.utils.unregister_class(GlomapPropertyGroup)
\ No newline at end of file
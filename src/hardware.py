@@ -0,0 +1,132 @@
+import os
+import sys
+import sqlite3
+
+import numpy as np
+
+# share of the available memory the matcher may plan for, the rest is left to Blender and the OS
+MEMORY_HEADROOM = 0.7
+
+DESCRIPTOR_BYTES = 128 # uint8 SIFT descriptor
+KEYPOINT_BYTES = 24 # six float32 affine shape values
+MATCH_BYTES = 8 # a pair of uint32 feature indices
+DISTANCE_BYTES = 4 # int32 descriptor distance in the brute force CPU matcher
+
+# COLMAP caches the features of this many blocks of images while matching exhaustively
+CACHE_BLOCKS = 5
+# larger blocks stop paying off once they keep every thread busy
+MAX_BLOCK_SIZE = 200
+
+def available_memory():
+    """Memory in bytes that can be allocated without swapping"""
+    if sys.platform.startswith('linux'):
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    if sys.platform.startswith('win'):
+        import ctypes
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ('dwLength', ctypes.c_ulong),
+                ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong),
+                ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong),
+                ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong),
+                ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+            ]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullAvailPhys
+    # macOS only reports the physical total, and keeps most of the rest in reclaimable caches
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def keypoint_counts(database_path):
+    """Number of keypoints of every image in a COLMAP database"""
+    if not database_path.exists():
+        return np.zeros(0, dtype=np.int64)
+    connection = sqlite3.connect(f"{database_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = connection.execute("SELECT rows FROM keypoints").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        connection.close()
+    return np.array([row[0] for row in rows], dtype=np.int64)
+
+def matching_peak_memory(num_cached_images, num_pairs, num_threads, mean_keypoints, max_keypoints, max_num_matches, use_gpu):
+    """Estimate the peak memory of feature matching in bytes
+
+    The feature cache holds the keypoints and descriptors of the cached images. Every pair in flight keeps
+    its raw and verified matches. Without a GPU, every thread also fills a distance matrix for one pair.
+    """
+    features = num_cached_images * mean_keypoints * (DESCRIPTOR_BYTES + KEYPOINT_BYTES)
+    matches = num_pairs * min(max_num_matches, max_keypoints) * MATCH_BYTES * 2
+    distances = 0 if use_gpu else num_threads * max_keypoints * max_keypoints * DISTANCE_BYTES
+    return int(features + matches + distances)
+
+def auto_matching_settings(database_path, matcher, use_gpu, max_num_matches):
+    """Pick the thread count, match cap and exhaustive block size that fit the available memory
+
+    The configured `max_num_matches` is only ever lowered. The block size is the largest that fits.
+    Returns a dict with the chosen values, the expected peak memory and what it was derived from.
+    """
+    counts = keypoint_counts(database_path)
+    if len(counts) == 0:
+        raise Exception("Extract features before matching")
+
+    memory = available_memory()
+    cores = available_cores()
+    budget = memory * MEMORY_HEADROOM
+    mean_keypoints = float(counts.mean())
+    # a few images with far more features than the rest should not shrink everything else
+    max_keypoints = int(np.percentile(counts, 99))
+
+    # an image pair never has more matches than its smaller image has keypoints
+    max_num_matches = max(1, min(max_num_matches, max_keypoints))
+
+    # the distance matrices are the largest per-thread cost, they get at most half the budget
+    num_threads = cores
+    if not use_gpu:
+        per_thread = max_keypoints * max_keypoints * DISTANCE_BYTES
+        num_threads = int(np.clip((budget / 2) // max(per_thread, 1), 1, cores))
+
+    def peak(block_size):
+        if matcher == 'EXHAUSTIVE':
+            return matching_peak_memory(min(len(counts), CACHE_BLOCKS * block_size), block_size * block_size, num_threads, mean_keypoints, max_keypoints, max_num_matches, use_gpu)
+        # the other matchers only keep a few pairs per thread in flight
+        return matching_peak_memory(min(len(counts), CACHE_BLOCKS * 50), 2 * num_threads, num_threads, mean_keypoints, max_keypoints, max_num_matches, use_gpu)
+
+    block_size = min(MAX_BLOCK_SIZE, len(counts))
+    if matcher == 'EXHAUSTIVE':
+        while block_size > 2 and peak(block_size) > budget:
+            block_size -= 1
+
+    return {
+        'num_threads': num_threads,
+        'max_num_matches': max_num_matches,
+        'block_size': block_size if matcher == 'EXHAUSTIVE' else None,
+        'peak_memory': peak(block_size),
+        'available_memory': memory,
+        'num_cores': cores,
+        'num_images': len(counts),
+        'max_keypoints': max_keypoints,
+    }
+
+def auto_solver_settings():
+    """Thread count for the incremental mapper, and the problem size above which bundle adjustment uses them"""
+    cores = available_cores()
+    return {
+        'num_threads': cores,
+        # the COLMAP default of 50000 residuals suits 8 cores, more cores pay off on smaller problems
+        'min_num_residuals_for_cpu_multi_threading': int(np.clip(400000 // cores, 10000, 100000)),
+    }
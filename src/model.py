@@ -0,0 +1,331 @@
+import struct
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pycolmap
+
+INVALID_POINT3D_ID = np.iinfo(np.uint64).max
+
+POINTS2D_DTYPE = np.dtype([('xy', '<f8', 2), ('point3D_id', '<u8')])
+
+# the fixed size part of each point in points3D.bin
+POINT3D_HEADER_DTYPE = np.dtype([('point_id', '<u8'), ('xyz', '<f8', 3), ('rgb', 'u1', 3), ('error', '<f8'), ('track_length', '<u8')])
+
+# number of parameters for each COLMAP camera model id
+CAMERA_MODEL_NUM_PARAMS = {
+    0: 3,   # SIMPLE_PINHOLE
+    1: 4,   # PINHOLE
+    2: 4,   # SIMPLE_RADIAL
+    3: 5,   # RADIAL
+    4: 8,   # OPENCV
+    5: 8,   # OPENCV_FISHEYE
+    6: 12,  # FULL_OPENCV
+    7: 5,   # FOV
+    8: 4,   # SIMPLE_RADIAL_FISHEYE
+    9: 5,   # RADIAL_FISHEYE
+    10: 12, # THIN_PRISM_FISHEYE
+    11: 16, # RAD_TAN_THIN_PRISM_FISHEYE
+}
+
+class Model:
+    """A COLMAP model as column arrays
+
+    Cameras:
+        `camera_ids`, `camera_model_ids`, `camera_widths`, `camera_heights` with shape (C,), and `camera_params`, a list of C float64 arrays.
+    Images (registered only):
+        `image_ids`, `image_camera_ids` with shape (N,), `image_names` a list of N names,
+        `quaternions` (N, 4) WXYZ and `translations` (N, 3) of the `cam_from_world` transform.
+    Points:
+        `point_ids`, `errors`, `track_lengths` with shape (M,), `xyz` (M, 3) float64 and `rgb` (M, 3) uint8.
+    Observations, only when read with `tracks=True`:
+        `track_offsets` (M + 1,), with the track of point `i` at `track_offsets[i]:track_offsets[i + 1]` in
+        `track_image_ids` and `track_point2D_idxs`, and `image_points2D`, a list of N structured arrays with `xy` and `point3D_id`.
+    """
+    def __init__(self):
+        self.camera_ids = np.empty(0, dtype=np.uint32)
+        self.camera_model_ids = np.empty(0, dtype=np.int32)
+        self.camera_widths = np.empty(0, dtype=np.uint64)
+        self.camera_heights = np.empty(0, dtype=np.uint64)
+        self.camera_params = []
+
+        self.image_ids = np.empty(0, dtype=np.uint32)
+        self.image_camera_ids = np.empty(0, dtype=np.uint32)
+        self.image_names = []
+        self.quaternions = np.empty((0, 4))
+        self.translations = np.empty((0, 3))
+
+        self.point_ids = np.empty(0, dtype=np.uint64)
+        self.xyz = np.empty((0, 3))
+        self.rgb = np.empty((0, 3), dtype=np.uint8)
+        self.errors = np.empty(0)
+        self.track_lengths = np.empty(0, dtype=np.uint64)
+
+        self.track_offsets = None
+        self.track_image_ids = None
+        self.track_point2D_idxs = None
+        self.image_points2D = None
+
+    @property
+    def num_reg_images(self):
+        return len(self.image_ids)
+
+    @property
+    def num_points3D(self):
+        return len(self.point_ids)
+
+    def camera_indices(self):
+        """Index into the camera arrays for each image"""
+        order = np.argsort(self.camera_ids)
+        return order[np.searchsorted(self.camera_ids, self.image_camera_ids, sorter=order)]
+
+    def focal_lengths(self):
+        """Focal length in pixels for each image, the first parameter of every camera model"""
+        return np.array([params[0] for params in self.camera_params])[self.camera_indices()]
+
+    def image_widths(self):
+        return self.camera_widths[self.camera_indices()].astype(np.float64)
+
+    def rotation_matrices(self):
+        """`cam_from_world` rotations of shape (N, 3, 3)"""
+        w, x, y, z = self.quaternions.T
+        return np.stack((
+            np.stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)), axis=1),
+            np.stack((2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)), axis=1),
+            np.stack((2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)), axis=1),
+        ), axis=1)
+
+    @classmethod
+    def from_reconstruction(cls, reconstruction, tracks=False, max_points=None):
+        """Copy a `pycolmap.Reconstruction` into column arrays
+
+        With `max_points`, only that many points are copied, evenly spread over the point ids.
+        """
+        model = cls()
+
+        cameras = list(reconstruction.cameras.items())
+        model.camera_ids = np.array([camera_id for camera_id, _ in cameras], dtype=np.uint32)
+        model.camera_model_ids = np.array([int(camera.model.value) for _, camera in cameras], dtype=np.int32)
+        model.camera_widths = np.array([camera.width for _, camera in cameras], dtype=np.uint64)
+        model.camera_heights = np.array([camera.height for _, camera in cameras], dtype=np.uint64)
+        model.camera_params = [np.array(camera.params, dtype=np.float64) for _, camera in cameras]
+
+        images = [reconstruction.images[image_id] for image_id in sorted(reconstruction.reg_image_ids())]
+        model.image_ids = np.array([image.image_id for image in images], dtype=np.uint32)
+        model.image_camera_ids = np.array([image.camera_id for image in images], dtype=np.uint32)
+        model.image_names = [image.name for image in images]
+        poses = [image.cam_from_world() for image in images]
+        # pycolmap quaternions are XYZW
+        model.quaternions = np.array([pose.rotation.quat for pose in poses], dtype=np.float64).reshape(-1, 4)[:, [3, 0, 1, 2]]
+        model.translations = np.array([pose.translation for pose in poses], dtype=np.float64).reshape(-1, 3)
+
+        if max_points is not None:
+            point_ids = sorted(reconstruction.point3D_ids())
+            if len(point_ids) > max_points:
+                point_ids = [point_ids[i] for i in np.linspace(0, len(point_ids) - 1, max_points).astype(np.int64)]
+            points = [(point_id, reconstruction.points3D[point_id]) for point_id in point_ids]
+        else:
+            points = list(reconstruction.points3D.items())
+        model.point_ids = np.array([point_id for point_id, _ in points], dtype=np.uint64)
+        model.xyz = np.array([point.xyz for _, point in points], dtype=np.float64).reshape(-1, 3)
+        model.rgb = np.array([point.color for _, point in points], dtype=np.uint8).reshape(-1, 3)
+        model.errors = np.array([point.error for _, point in points], dtype=np.float64)
+        model.track_lengths = np.array([point.track.length() for _, point in points], dtype=np.uint64)
+
+        if tracks:
+            model.track_offsets = np.concatenate(([0], np.cumsum(model.track_lengths))).astype(np.int64)
+            elements = [element for _, point in points for element in point.track.elements]
+            model.track_image_ids = np.array([element.image_id for element in elements], dtype=np.uint32)
+            model.track_point2D_idxs = np.array([element.point2D_idx for element in elements], dtype=np.uint32)
+            model.image_points2D = []
+            for image in images:
+                points2D = np.empty(len(image.points2D), dtype=POINTS2D_DTYPE)
+                for i, point2D in enumerate(image.points2D):
+                    points2D[i] = (point2D.xy, point2D.point3D_id if point2D.has_point3D() else INVALID_POINT3D_ID)
+                model.image_points2D.append(points2D)
+
+        return model
+
+    def select_points(self, keep):
+        """A copy with only the points where `keep` is set
+
+        Requires tracks. Observations of removed points are unlinked from their images.
+        """
+        model = Model()
+        model.camera_ids = self.camera_ids
+        model.camera_model_ids = self.camera_model_ids
+        model.camera_widths = self.camera_widths
+        model.camera_heights = self.camera_heights
+        model.camera_params = self.camera_params
+        model.image_ids = self.image_ids
+        model.image_camera_ids = self.image_camera_ids
+        model.image_names = self.image_names
+        model.quaternions = self.quaternions
+        model.translations = self.translations
+
+        model.point_ids = self.point_ids[keep]
+        model.xyz = self.xyz[keep]
+        model.rgb = self.rgb[keep]
+        model.errors = self.errors[keep]
+        model.track_lengths = self.track_lengths[keep]
+
+        keep_elements = np.repeat(keep, self.track_lengths.astype(np.int64))
+        model.track_offsets = np.concatenate(([0], np.cumsum(model.track_lengths.astype(np.int64))))
+        model.track_image_ids = self.track_image_ids[keep_elements]
+        model.track_point2D_idxs = self.track_point2D_idxs[keep_elements]
+
+        removed = self.point_ids[~keep]
+        model.image_points2D = []
+        for points2D in self.image_points2D:
+            points2D = points2D.copy()
+            points2D['point3D_id'][np.isin(points2D['point3D_id'], removed)] = INVALID_POINT3D_ID
+            model.image_points2D.append(points2D)
+        return model
+
+def read_cameras_binary(model, path):
+    data = Path(path).read_bytes()
+    num_cameras, = struct.unpack_from("<Q", data, 0)
+    offset = 8
+    camera_ids, model_ids, widths, heights = [], [], [], []
+    for _ in range(num_cameras):
+        camera_id, model_id, width, height = struct.unpack_from("<IiQQ", data, offset)
+        offset += 24
+        num_params = CAMERA_MODEL_NUM_PARAMS[model_id]
+        model.camera_params.append(np.frombuffer(data, dtype="<f8", count=num_params, offset=offset).copy())
+        offset += 8 * num_params
+        camera_ids.append(camera_id)
+        model_ids.append(model_id)
+        widths.append(width)
+        heights.append(height)
+    model.camera_ids = np.array(camera_ids, dtype=np.uint32)
+    model.camera_model_ids = np.array(model_ids, dtype=np.int32)
+    model.camera_widths = np.array(widths, dtype=np.uint64)
+    model.camera_heights = np.array(heights, dtype=np.uint64)
+
+def read_images_binary(model, path, tracks):
+    data = Path(path).read_bytes()
+    num_images, = struct.unpack_from("<Q", data, 0)
+    offset = 8
+    image_ids, camera_ids, poses = [], [], []
+    if tracks:
+        model.image_points2D = []
+    for _ in range(num_images):
+        image_id, *pose, camera_id = struct.unpack_from("<I7dI", data, offset)
+        offset += 64
+        name_end = data.index(b"\0", offset)
+        model.image_names.append(data[offset:name_end].decode("utf-8"))
+        offset = name_end + 1
+        num_points2D, = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        if tracks:
+            model.image_points2D.append(np.frombuffer(data, dtype=POINTS2D_DTYPE, count=num_points2D, offset=offset).copy())
+        # skip the observations unless they were asked for
+        offset += POINTS2D_DTYPE.itemsize * num_points2D
+        image_ids.append(image_id)
+        camera_ids.append(camera_id)
+        poses.append(pose)
+    poses = np.array(poses, dtype=np.float64).reshape(-1, 7)
+    model.image_ids = np.array(image_ids, dtype=np.uint32)
+    model.image_camera_ids = np.array(camera_ids, dtype=np.uint32)
+    model.quaternions = poses[:, :4]
+    model.translations = poses[:, 4:]
+
+def point3D_header_mask(lengths):
+    """Mask of the header bytes among the points of a points3D.bin, after its count
+
+    Each point is a fixed size header followed by its variable length track, so the file alternates runs of each.
+    """
+    runs = np.stack((np.full(len(lengths), POINT3D_HEADER_DTYPE.itemsize), 8 * lengths), axis=1).ravel()
+    return np.repeat(np.tile([True, False], len(lengths)), runs)
+
+def read_points3D_binary(model, path, tracks):
+    data = np.fromfile(path, dtype=np.uint8)
+    num_points = int(data[:8].view("<u8")[0])
+
+    # where each header starts depends on every track before it, so only the track lengths are walked in Python.
+    # The headers and tracks are then split apart with one mask, instead of gathering every byte by index
+    buffer = memoryview(data)
+    unpack_length = struct.Struct("<Q").unpack_from
+    lengths = []
+    offset = 8 + POINT3D_HEADER_DTYPE.itemsize - 8
+    for _ in range(num_points):
+        length, = unpack_length(buffer, offset)
+        lengths.append(length)
+        offset += POINT3D_HEADER_DTYPE.itemsize + 8 * length
+    lengths = np.array(lengths, dtype=np.int64)
+    model.track_lengths = lengths.astype(np.uint64)
+
+    body = data[8:]
+    is_header = point3D_header_mask(lengths)
+    headers = body[is_header].view(POINT3D_HEADER_DTYPE)
+    model.point_ids = headers['point_id'].copy()
+    model.xyz = headers['xyz'].copy()
+    model.rgb = headers['rgb'].copy()
+    model.errors = headers['error'].copy()
+
+    if tracks:
+        model.track_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        elements = body[~is_header].view("<u4").reshape(-1, 2)
+        model.track_image_ids = elements[:, 0].copy()
+        model.track_point2D_idxs = elements[:, 1].copy()
+
+def read_model(model_path, tracks=False):
+    """Read a COLMAP model directory into a `Model`
+
+    Binary models are parsed directly with NumPy, without building a `pycolmap.Reconstruction`.
+    Per-observation data is only read when `tracks` is set. Text models fall back to pycolmap.
+    """
+    model_path = Path(model_path)
+    if not all((model_path / f"{name}.bin").exists() for name in ("cameras", "images", "points3D")):
+        return Model.from_reconstruction(pycolmap.Reconstruction(model_path), tracks=tracks)
+
+    model = Model()
+    read_cameras_binary(model, model_path / "cameras.bin")
+    read_images_binary(model, model_path / "images.bin", tracks)
+    read_points3D_binary(model, model_path / "points3D.bin", tracks)
+    return model
+
+def write_images_binary(model, path):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", model.num_reg_images))
+        for i in range(model.num_reg_images):
+            f.write(struct.pack("<I7dI", int(model.image_ids[i]), *model.quaternions[i], *model.translations[i], int(model.image_camera_ids[i])))
+            f.write(model.image_names[i].encode("utf-8") + b"\0")
+            f.write(struct.pack("<Q", len(model.image_points2D[i])))
+            f.write(np.ascontiguousarray(model.image_points2D[i], dtype=POINTS2D_DTYPE).tobytes())
+
+def write_points3D_binary(model, path):
+    # the inverse of `read_points3D_binary`, the headers and tracks are interleaved with the same mask
+    lengths = model.track_lengths.astype(np.int64)
+    headers = np.empty(model.num_points3D, dtype=POINT3D_HEADER_DTYPE)
+    headers['point_id'] = model.point_ids
+    headers['xyz'] = model.xyz
+    headers['rgb'] = model.rgb
+    headers['error'] = model.errors
+    headers['track_length'] = model.track_lengths
+
+    elements = np.empty((int(lengths.sum()), 2), dtype="<u4")
+    elements[:, 0] = model.track_image_ids
+    elements[:, 1] = model.track_point2D_idxs
+
+    is_header = point3D_header_mask(lengths)
+    data = np.empty(8 + len(is_header), dtype=np.uint8)
+    data[:8] = np.array([model.num_points3D], dtype="<u8").view(np.uint8)
+    body = data[8:]
+    body[is_header] = headers.view(np.uint8)
+    body[~is_header] = elements.view(np.uint8).ravel()
+
+    data.tofile(path)
+
+def write_model(model, model_path, source_path):
+    """Write a `Model` read with tracks as a binary COLMAP model
+
+    Cameras and any other files, such as rigs and frames, are copied from the `source_path` model.
+    """
+    model_path = Path(model_path)
+    model_path.mkdir(parents=True, exist_ok=True)
+    for path in Path(source_path).iterdir():
+        if path.is_file() and path.name not in ("images.bin", "points3D.bin"):
+            shutil.copy2(path, model_path / path.name)
+    write_images_binary(model, model_path / "images.bin")
+    write_points3D_binary(model, model_path / "points3D.bin")
@@ -0,0 +1,118 @@
+import json
+import re
+from pathlib import Path
+
+from .utils import extension_user_path
+from .glomap.property_groups import resolve_property, assign_properties
+
+# {key: (name, description, {data_path: value})}, with data paths relative to the clip like the sweep uses.
+# Every preset sets the same paths, so switching between them never leaves a value from the previous one behind.
+BUILTIN_PRESETS = {
+    'PREVIEW': ("Preview", "Fewer features, a short sequential overlap and light refinement, to block out a shot quickly", {
+        'colmap.extract_features.sift_options.max_num_features': 2048,
+        'colmap.extract_features.sift_options.first_octave': 0,
+        'colmap.match_features.matcher': 'SEQUENTIAL',
+        'colmap.match_features.sequential.overlap': 5,
+        'colmap.match_features.sequential.quadratic_overlap': False,
+        'colmap.match_features.sequential.loop_detection': False,
+        'colmap.match_features.sift_options.max_num_matches': 8192,
+        'colmap.match_features.sift_options.guided_matching': False,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_num_iterations': 10,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_refinements': 1,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_num_iterations': 20,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_refinements': 1,
+        'glomap.ba_iteration_num': 1,
+        'glomap.retriangulation_iteration_num': 0,
+        'glomap.global_positioning.max_num_iterations': 50,
+        'glomap.bundle_adjustment.max_num_iterations': 50,
+    }),
+    'PRODUCTION': ("Production", "The COLMAP and GLOMAP defaults with sequential matching, a balanced setup for most shots", {
+        'colmap.extract_features.sift_options.max_num_features': 8192,
+        'colmap.extract_features.sift_options.first_octave': -1,
+        'colmap.match_features.matcher': 'SEQUENTIAL',
+        'colmap.match_features.sequential.overlap': 10,
+        'colmap.match_features.sequential.quadratic_overlap': True,
+        'colmap.match_features.sequential.loop_detection': False,
+        'colmap.match_features.sift_options.max_num_matches': 32768,
+        'colmap.match_features.sift_options.guided_matching': False,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_num_iterations': 25,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_refinements': 2,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_num_iterations': 50,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_refinements': 5,
+        'glomap.ba_iteration_num': 3,
+        'glomap.retriangulation_iteration_num': 1,
+        'glomap.global_positioning.max_num_iterations': 100,
+        'glomap.bundle_adjustment.max_num_iterations': 200,
+    }),
+    'HERO': ("Hero", "More features, a long overlap with loop detection, guided matching and extra refinement, for the most accurate solve", {
+        'colmap.extract_features.sift_options.max_num_features': 16384,
+        'colmap.extract_features.sift_options.first_octave': -1,
+        'colmap.match_features.matcher': 'SEQUENTIAL',
+        'colmap.match_features.sequential.overlap': 20,
+        'colmap.match_features.sequential.quadratic_overlap': True,
+        'colmap.match_features.sequential.loop_detection': True,
+        'colmap.match_features.sift_options.max_num_matches': 65536,
+        'colmap.match_features.sift_options.guided_matching': True,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_num_iterations': 50,
+        'colmap.incremental_pipeline.bundle_adjustment.local_max_refinements': 3,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_num_iterations': 100,
+        'colmap.incremental_pipeline.bundle_adjustment.global_max_refinements': 10,
+        'glomap.ba_iteration_num': 5,
+        'glomap.retriangulation_iteration_num': 2,
+        'glomap.global_positioning.max_num_iterations': 200,
+        'glomap.bundle_adjustment.max_num_iterations': 400,
+    }),
+}
+
+PRESET_PATHS = list(BUILTIN_PRESETS['PRODUCTION'][2].keys())
+
+# written by `benchmarks/presets.py` on a reference clip. None is shipped, the timings depend on the clip and the hardware
+TIMINGS_PATH = Path(__file__).parent / "preset_timings.json"
+
+USER_PREFIX = "USER:"
+
+def preset_timings(key):
+    """Measured timings of a built-in preset as `{'clip', 'num_frames', 'stages': {stage: seconds}}`, or None"""
+    try:
+        with open(TIMINGS_PATH, "r") as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+def format_timings(timings):
+    stages = ", ".join(f"{stage} {seconds:.0f}s" for stage, seconds in timings['stages'].items())
+    return f"{stages} on {timings['num_frames']} frames of {timings['clip']}"
+
+def user_presets_path():
+    return extension_user_path("presets")
+
+def list_user_presets():
+    return sorted(path.stem for path in user_presets_path().glob("*.json"))
+
+def preset_values(key):
+    if key.startswith(USER_PREFIX):
+        with open(user_presets_path() / f"{key.removeprefix(USER_PREFIX)}.json", "r") as f:
+            return json.load(f)
+    return BUILTIN_PRESETS[key][2]
+
+def current_values(clip):
+    values = {}
+    for data_path in PRESET_PATHS:
+        owner, name = resolve_property(clip, data_path)
+        values[data_path] = getattr(owner, name)
+    return values
+
+def save_user_preset(clip, name):
+    """Save the current values of every preset property as a user preset. Returns the key to apply it with"""
+    name = re.sub(r"[^\w\- ]+", "_", name.strip())
+    with open(user_presets_path() / f"{name}.json", "w") as f:
+        json.dump(current_values(clip), f, indent=4)
+    return USER_PREFIX + name
+
+def delete_user_preset(name):
+    (user_presets_path() / f"{name}.json").unlink(missing_ok=True)
+
+def apply_preset(clip, key):
+    # user presets may come from an older version, so unknown paths are skipped instead of failing the whole preset
+    values = {data_path: value for data_path, value in preset_values(key).items() if data_path in PRESET_PATHS}
+    assign_properties(clip, values)
@@ -0,0 +1,40 @@
+"""Undistort a share of the frames in a process of its own, for `distortion.undistort_frames`
+
+    python undistort.py job.pickle
+
+The job is a pickled dict with the folder of the remap table saved by `undistort_frames`, the frames to undistort,
+the output folder and the frame size. Prints "undistorted <name>" for every frame it wrote.
+This runs outside of Blender, so `distortion` is imported from next to this script, not from the add-on package.
+"""
+import sys
+import pickle
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from distortion import remap
+
+def main():
+    with open(sys.argv[1], "rb") as f:
+        job = pickle.load(f)
+    width = job['width']
+    height = job['height']
+
+    # memory mapped, so every worker reads the same pages instead of holding a copy of the table
+    remap_table = tuple(np.load(Path(job['table_path']) / f"{name}.npy", mmap_mode='r') for name in ("indices", "weights", "valid"))
+
+    for frame_path in job['frame_paths']:
+        with Image.open(frame_path) as image:
+            pixels = np.asarray(image)
+        if pixels.shape[:2] != (height, width):
+            raise Exception(f"{Path(frame_path).name} is {pixels.shape[1]}x{pixels.shape[0]}, but the camera is {width}x{height}")
+        squeeze = pixels.ndim == 2
+        if squeeze:
+            pixels = pixels[:, :, None]
+        undistorted = remap(pixels, remap_table)
+        Image.fromarray(undistorted[:, :, 0] if squeeze else undistorted).save(Path(job['output_path']) / Path(frame_path).name)
+        print(f"undistorted {Path(frame_path).name}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,23 @@ import glob
 import threading
 import functools
 import re
+import struct
+import os
+import json
+import sqlite3
+import time
+import hashlib
+import traceback
+import socket
+import sys
+import uuid
 
 from PIL import Image
 import av
 import pycolmap
 
+from .model import Model, read_model
+
 def clip_path(clip):
     """Get the path for a clip
 
@@ -23,6 +35,142 @@ def clip_path(clip):
         path = Path(bpy.path.abspath(clip.filepath))
         return (path / "../BL_colmap" / path.name).resolve()
 
+# changes whenever the way frames are decoded or written changes, so stale shared frames are never reused
+FRAMES_FORMAT = "rgb24-tiff-1"
+
+_media_hashes = {} # (path, size, mtime) -> content hash, so each file is only hashed once per session
+
+def media_hash(media_path, chunk_size=16 * 1024 * 1024):
+    """Content hash of every byte of a media file, read in `chunk_size` chunks
+
+    Sampling parts of the file is not enough: a re-export of an intra-frame plate can keep its size and both ends
+    while frames in the middle change. blake2b hashes at about disk speed, far below the cost of splitting the clip.
+    """
+    stat = media_path.stat()
+    key = (str(media_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _media_hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(media_path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+        _media_hashes[key] = digest.hexdigest()
+    return _media_hashes[key]
+
+def settings_key(*settings):
+    return hashlib.blake2b(json.dumps(settings, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+def property_values(struct):
+    """All property values of a Blender struct, following pointers into nested property groups"""
+    values = {}
+    for prop in struct.bl_rna.properties:
+        if prop.identifier == 'rna_type':
+            continue
+        value = getattr(struct, prop.identifier)
+        if prop.type == 'POINTER':
+            values[prop.identifier] = property_values(value) if value is not None else None
+        elif prop.type in {'BOOLEAN', 'INT', 'FLOAT'} and getattr(prop, 'is_array', False):
+            values[prop.identifier] = list(value)
+        elif prop.type != 'COLLECTION':
+            values[prop.identifier] = value
+    return values
+
+def extension_user_path(name):
+    """A folder in the extension's user directory, shared by every .blend file"""
+    # the extension package is the parent of `src`
+    package = __name__.rpartition(".src.")[0]
+    try:
+        return Path(bpy.utils.extension_path_user(package, path=name, create=True))
+    except ValueError:
+        # loaded as a plain module, i.e. by the benchmarks
+        return Path(bpy.utils.user_resource('CONFIG', path=f"{package}/{name}", create=True))
+
+def shared_cache_path():
+    """The shared frames and features cache, or None when it is disabled"""
+    storage = bpy.context.scene.colmap_storage
+    if not storage.use_shared_cache:
+        return None
+    if storage.shared_cache_directory == "":
+        return extension_user_path("shared_cache")
+    path = Path(bpy.path.abspath(storage.shared_cache_directory)).resolve()
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def frames_cache_key(clip):
+    return settings_key(media_hash(Path(bpy.path.abspath(clip.filepath))), FRAMES_FORMAT)
+
+def features_cache_key(clip):
+    extract_features = clip.colmap.extract_features
+    camera = property_values(clip.tracking.camera) if not extract_features.estimate_camera else None
+    return settings_key(frames_cache_key(clip), property_values(extract_features), camera, list(clip.size))
+
+def link_files(source_path, target_path):
+    """Hard link every file of `source_path` into `target_path`, copying where links are not possible"""
+    for source in source_path.iterdir():
+        try:
+            os.link(source, target_path / source.name)
+        except OSError:
+            shutil.copy2(source, target_path / source.name)
+
+def publish_frames(images_path, cached_frames_path):
+    partial_path = cached_frames_path.with_name(cached_frames_path.name + ".partial")
+    shutil.rmtree(partial_path, ignore_errors=True)
+    partial_path.mkdir(parents=True)
+    link_files(images_path, partial_path)
+    try:
+        os.replace(partial_path, cached_frames_path)
+    except OSError:
+        # another clip published the same frames first
+        shutil.rmtree(partial_path, ignore_errors=True)
+
+def publish_features(database_path, cached_features_path):
+    """Store a copy of the features in a database, without its matches, in the shared cache"""
+    cached_features_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = cached_features_path.with_name(cached_features_path.name + ".partial")
+    partial_path.unlink(missing_ok=True)
+    # the backup API gives a consistent copy even if the source has a write-ahead log
+    source = sqlite3.connect(f"{database_path.resolve().as_uri()}?mode=ro", uri=True)
+    target = sqlite3.connect(partial_path)
+    try:
+        source.backup(target)
+        for table in ("matches", "two_view_geometries"):
+            try:
+                target.execute(f"DELETE FROM {table}")
+            except sqlite3.OperationalError:
+                pass
+        target.commit()
+        target.execute("VACUUM")
+    finally:
+        target.close()
+        source.close()
+    os.replace(partial_path, cached_features_path)
+
+def copy_database(database_path, copy_path):
+    """Copy a database with the backup API, which includes what is still in its write-ahead log"""
+    source = sqlite3.connect(f"{database_path.resolve().as_uri()}?mode=ro", uri=True)
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def remove_database(database_path):
+    """Delete a database along with its write-ahead log and shared memory files"""
+    for suffix in ("", "-wal", "-shm"):
+        database_path.with_name(database_path.name + suffix).unlink(missing_ok=True)
+
+def reuse_features(cached_features_path, database_path):
+    """Start a database from the cached features, only when it has none of its own"""
+    if not cached_features_path.exists() or database_stats(database_path)['num_descriptors'] > 0:
+        return False
+    partial_path = database_path.with_name(database_path.name + ".partial")
+    # `copyfile` uses copy_file_range on Linux, which shares the blocks on filesystems that support reflinks
+    shutil.copyfile(cached_features_path, partial_path)
+    for suffix in ("-wal", "-shm"):
+        database_path.with_name(database_path.name + suffix).unlink(missing_ok=True)
+    os.replace(partial_path, database_path)
+    return True
+
 def prepare_database(clip):
     """Prepare the COLMAP database for a clip.
 
@@ -33,39 +181,570 @@ def prepare_database(clip):
     path = clip_path(clip)
     path.mkdir(parents=True, exist_ok=True)
 
-    images_path = path / "frames"
+    database_path, images_path, reconstruction_path = workspace_paths(clip)
     images_path.mkdir(parents=True, exist_ok=True)
 
-    # split video into frames
+    # split video into frames, or link them from the shared cache
     if not any(images_path.iterdir()):
-        video_path = bpy.path.abspath(clip.filepath)
-        container = av.open(video_path)
-        for i, frame in enumerate(container.decode(video=0)):
-            img = frame.to_ndarray(format="rgb24")
-            Image.fromarray(img).save(images_path / f"{(i + 1):04d}.tiff")
+        cache_path = shared_cache_path()
+        cached_frames_path = cache_path / "frames" / frames_cache_key(clip) if cache_path is not None else None
+        if cached_frames_path is not None and cached_frames_path.exists():
+            touch_artifacts(cache_path, f"frames/{cached_frames_path.name}")
+            link_files(cached_frames_path, images_path)
+        else:
+            video_path = bpy.path.abspath(clip.filepath)
+            container = av.open(video_path)
+            for i, frame in enumerate(container.decode(video=0)):
+                img = frame.to_ndarray(format="rgb24")
+                Image.fromarray(img).save(images_path / f"{(i + 1):04d}.tiff")
+            if cached_frames_path is not None:
+                publish_frames(images_path, cached_frames_path)
+                touch_artifacts(cache_path, f"frames/{cached_frames_path.name}")
+    touch_artifacts(path, 'frames')
     
-    database_path = path / "database.db"
-    reconstruction_path = path / "reconstruction"
     reconstruction_path.mkdir(parents=True, exist_ok=True)
 
     return database_path, images_path, reconstruction_path
 
-def refresh_cache(clip):
-    database_path, _, _ = prepare_database(clip)
+def database_state(database_path):
+    """A key that changes whenever the database file, or its write-ahead log, is written to"""
+    state = []
+    for path in (database_path, database_path.with_name(database_path.name + "-wal")):
+        if path.exists():
+            stat = path.stat()
+            state.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(state)
 
-    database = pycolmap.Database(database_path)
+def database_stats(database_path):
+    """Count descriptors and matches in a COLMAP database
 
-    clip.colmap.cached_results.num_descriptors = database.num_descriptors
-    
-    clip.colmap.cached_results.num_matches = database.num_matches
-    clip.colmap.cached_results.num_inlier_matches = database.num_inlier_matches
-    clip.colmap.cached_results.num_matched_image_pairs = database.num_matched_image_pairs
-    clip.colmap.cached_results.num_verified_image_pairs = database.num_verified_image_pairs
+    Uses a read-only connection and only aggregates row counts and the `rows` column, which is stored before the blob,
+    so the descriptor and match data are never read.
+    """
+    stats = {
+        'num_descriptors': 0,
+        'num_matches': 0,
+        'num_inlier_matches': 0,
+        'num_matched_image_pairs': 0,
+        'num_verified_image_pairs': 0,
+    }
+    if not database_path.exists():
+        return stats
+    queries = {
+        'num_descriptors': "SELECT SUM(rows) FROM descriptors",
+        'num_matches': "SELECT SUM(rows) FROM matches",
+        'num_inlier_matches': "SELECT SUM(rows) FROM two_view_geometries",
+        'num_matched_image_pairs': "SELECT COUNT(*) FROM matches WHERE rows > 0",
+        'num_verified_image_pairs': "SELECT COUNT(*) FROM two_view_geometries WHERE rows > 0",
+    }
+    connection = sqlite3.connect(f"{database_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        for key, query in queries.items():
+            try:
+                stats[key] = int(connection.execute(query).fetchone()[0] or 0)
+            except sqlite3.OperationalError:
+                pass # the table is only created once the stage first runs
+    finally:
+        connection.close()
+    return stats
 
-    database.close()
+# COLMAP packs both image ids of a pair into one `pair_id`
+MAX_NUM_IMAGES = 2147483647
+
+def pruned_data(database_path):
+    """Which data `compact_database` removed from the database, as a dict of 'descriptors' and 'matches' flags"""
+    pruned_path = database_path.with_name("pruned.json")
+    if not pruned_path.exists():
+        return { 'descriptors': False, 'matches': False }
+    with open(pruned_path, "r") as f:
+        return json.load(f)
+
+def set_pruned_data(database_path, **flags):
+    pruned = pruned_data(database_path)
+    pruned.update(flags)
+    with open(database_path.with_name("pruned.json"), "w") as f:
+        json.dump(pruned, f)
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+def database_size(database_path):
+    return sum(path.stat().st_size for path in (database_path, database_path.with_name(database_path.name + "-wal")) if path.exists())
+
+def compact_database(database_path, drop_descriptors, drop_matches):
+    """Shrink a COLMAP database once matching is done
+
+    Optionally drops all descriptors, which are only needed to match again, and the raw matches,
+    of which the solvers only use the verified inliers in `two_view_geometries`.
+    Rows of images that no longer exist are always removed, then the file is rebuilt with `VACUUM`.
+
+    Returns the number of bytes reclaimed.
+    """
+    size_before = database_size(database_path)
+    connection = sqlite3.connect(database_path)
+    try:
+        if drop_descriptors:
+            connection.execute("DELETE FROM descriptors")
+        if drop_matches:
+            connection.execute("DELETE FROM matches")
+        for table in ("keypoints", "descriptors"):
+            connection.execute(f"DELETE FROM {table} WHERE image_id NOT IN (SELECT image_id FROM images)")
+        for table in ("matches", "two_view_geometries"):
+            connection.execute(
+                f"DELETE FROM {table} WHERE pair_id / {MAX_NUM_IMAGES} NOT IN (SELECT image_id FROM images) "
+                f"OR pair_id % {MAX_NUM_IMAGES} NOT IN (SELECT image_id FROM images)"
+            )
+        connection.commit()
+        # fold any write-ahead log back in, then rewrite the file without the free pages
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+    flags = {}
+    if drop_descriptors:
+        flags['descriptors'] = True
+    if drop_matches:
+        flags['matches'] = True
+    if len(flags) > 0:
+        set_pruned_data(database_path, **flags)
+
+    return size_before - database_size(database_path)
+
+SNAPSHOT_TABLES = ("matches", "two_view_geometries")
+
+def snapshots_path(database_path):
+    return database_path.with_name("snapshots")
+
+def snapshot_file_name(name):
+    return re.sub(r"[^\w\-]+", "_", name.strip()) + ".db"
+
+def list_snapshots(database_path):
+    path = snapshots_path(database_path)
+    if not path.exists():
+        return []
+    return sorted(snapshot.stem for snapshot in path.glob("*.db"))
+
+def active_snapshot(database_path):
+    """Name of the snapshot the matches in the database were restored from or saved to, or None once they changed"""
+    try:
+        with open(snapshots_path(database_path) / "active.json", "r") as f:
+            return json.load(f)['name']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def set_active_snapshot(database_path, name):
+    path = snapshots_path(database_path)
+    if name is None:
+        (path / "active.json").unlink(missing_ok=True)
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "active.json", "w") as f:
+        json.dump({ 'name': name }, f)
+
+def save_snapshot(database_path, name, settings):
+    """Copy the matches and two-view geometries into `snapshots/{name}.db`
+
+    The tables are created from the database's own schema, so restoring them is a plain row copy.
+    Returns the name the snapshot was saved under.
+    """
+    path = snapshots_path(database_path)
+    path.mkdir(parents=True, exist_ok=True)
+    snapshot_path = path / snapshot_file_name(name)
+    partial_path = snapshot_path.with_name(snapshot_path.name + ".partial")
+    partial_path.unlink(missing_ok=True)
+
+    connection = sqlite3.connect(database_path)
+    try:
+        connection.execute("ATTACH DATABASE ? AS snapshot", (str(partial_path),))
+        for table in SNAPSHOT_TABLES:
+            sql = connection.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if sql is None:
+                raise Exception("Match features before saving a snapshot")
+            connection.execute(re.sub(rf"\b{table}\b", f"snapshot.{table}", sql[0], count=1))
+            connection.execute(f"INSERT INTO snapshot.{table} SELECT * FROM main.{table}")
+        connection.execute("CREATE TABLE snapshot.info (key TEXT PRIMARY KEY NOT NULL, value TEXT NOT NULL)")
+        connection.executemany("INSERT INTO snapshot.info VALUES (?, ?)", [
+            ('settings', json.dumps(settings, default=str)),
+            ('matches_pruned', json.dumps(pruned_data(database_path)['matches'])),
+            ('created', json.dumps(time.time())),
+        ])
+        connection.commit()
+        connection.execute("DETACH DATABASE snapshot")
+    finally:
+        connection.close()
+    os.replace(partial_path, snapshot_path)
+
+    set_active_snapshot(database_path, snapshot_path.stem)
+    return snapshot_path.stem
+
+def restore_snapshot(database_path, name):
+    """Replace the matches and two-view geometries with those of a snapshot, in one transaction"""
+    snapshot_path = snapshots_path(database_path) / snapshot_file_name(name)
+    if not snapshot_path.exists():
+        raise Exception(f"There is no snapshot named '{name}'")
+
+    connection = sqlite3.connect(database_path)
+    try:
+        connection.execute("ATTACH DATABASE ? AS snapshot", (str(snapshot_path),))
+        info = dict(connection.execute("SELECT key, value FROM snapshot.info").fetchall())
+        with connection:
+            for table in SNAPSHOT_TABLES:
+                connection.execute(f"DELETE FROM main.{table}")
+                connection.execute(f"INSERT INTO main.{table} SELECT * FROM snapshot.{table}")
+        connection.execute("DETACH DATABASE snapshot")
+    finally:
+        connection.close()
+
+    set_pruned_data(database_path, matches=json.loads(info['matches_pruned']))
+    set_active_snapshot(database_path, snapshot_path.stem)
+    # a resumed solve would continue from the geometry of other matches
+    tombstone(checkpoints_path(database_path))
+
+def delete_snapshot(database_path, name):
+    snapshot_path = snapshots_path(database_path) / snapshot_file_name(name)
+    snapshot_path.unlink(missing_ok=True)
+    if active_snapshot(database_path) == snapshot_path.stem:
+        set_active_snapshot(database_path, None)
+
+def record_solve_snapshot(database_path, reconstruction_path):
+    """Note which snapshot the matches of a solve came from, next to its models. Returns the name, or None"""
+    name = active_snapshot(database_path)
+    reconstruction_path.mkdir(parents=True, exist_ok=True)
+    with open(reconstruction_path / "solve.json", "w") as f:
+        json.dump({ 'snapshot': name }, f)
+    return name
+
+_refreshing = set() # database paths with a refresh in flight
+
+def refresh_cache(clip, force=False):
+    """Update `clip.colmap.cached_results` from the database in the background
+
+    Unless `force` is set, does nothing if the database did not change since the last refresh.
+    """
+    database_path = clip_path(clip) / "database.db"
+    if database_path in _refreshing or (not force and clip.colmap.cached_results.database_state == database_state(database_path)):
+        return
+    _refreshing.add(database_path)
+
+    clip_name = clip.name
+    result = {}
+
+    def worker():
+        stats = None
+        state = None
+        try:
+            # count again if the database was written to while counting
+            while True:
+                state = database_state(database_path)
+                try:
+                    stats = database_stats(database_path)
+                except sqlite3.Error as e:
+                    print(f"Failed to read {database_path}: {e}")
+                    stats = None
+                if stats is None or database_state(database_path) == state:
+                    break
+            if stats is not None:
+                stats['active_snapshot'] = active_snapshot(database_path) or ""
+        except Exception:
+            traceback.print_exc()
+            stats = None
+        finally:
+            # always, or the timer would poll forever and the path would never be refreshed again
+            result['stats'] = stats
+            result['state'] = state
+
+    def apply():
+        if 'state' not in result:
+            return 0.1
+        _refreshing.discard(database_path)
+        clip = bpy.data.movieclips.get(clip_name)
+        if clip is None or result['stats'] is None:
+            return None
+        for key, value in result['stats'].items():
+            setattr(clip.colmap.cached_results, key, value)
+        clip.colmap.cached_results.database_state = result['state']
+        # timers run without a window, so there is no `bpy.context.screen` to redraw
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'CLIP_EDITOR':
+                    area.tag_redraw()
+        return None
+
+    threading.Thread(target=worker, daemon=True).start()
+    # the properties are only written from the main thread
+    bpy.app.timers.register(apply, first_interval=0.1)
+
+def list_models(reconstruction_path):
+    """List the sub-model directories written by the mapper, ordered by index"""
+    if not reconstruction_path.exists():
+        return []
+    return sorted((path for path in reconstruction_path.iterdir() if path.is_dir() and path.name.isdigit()), key=lambda path: int(path.name))
+
+def model_summary(model_path):
+    """Count the cameras, registered images and 3D points of a model
+
+    Only the 8 byte header of each binary file is read, so this is cheap even for very large models.
+    Models saved as text fall back to loading the full reconstruction.
+    """
+    summary = {}
+    for key, name in (('num_cameras', "cameras"), ('num_reg_images', "images"), ('num_points3D', "points3D")):
+        binary_path = model_path / f"{name}.bin"
+        if not binary_path.exists():
+            reconstruction = pycolmap.Reconstruction(model_path)
+            return {
+                'num_cameras': reconstruction.num_cameras(),
+                'num_reg_images': reconstruction.num_reg_images(),
+                'num_points3D': reconstruction.num_points3D(),
+            }
+        with open(binary_path, "rb") as f:
+            summary[key] = struct.unpack("<Q", f.read(8))[0]
+    return summary
+
+def largest_model(reconstruction_path):
+    """Path of the model with the most registered images, or `None` if nothing was reconstructed"""
+    models = list_models(reconstruction_path)
+    if len(models) == 0:
+        return None
+    def size(model_path):
+        summary = model_summary(model_path)
+        return (summary['num_reg_images'], summary['num_points3D'])
+    return max(models, key=size)
+
+def selected_model_path(reconstruction_path, selection):
+    """Path of the single model chosen by `selection`, the largest one for 'LARGEST' and 'MERGED', or `None`"""
+    if selection in ('LARGEST', 'MERGED'):
+        return largest_model(reconstruction_path)
+    model_path = reconstruction_path / selection
+    return model_path if model_path.exists() else None
+
+def filtered_model_path(model_path):
+    """The filtered version of a model, written by `colmap.filter_points`, or the model itself
+
+    A filtered version older than its model is left over from a previous solve and is ignored.
+    """
+    filtered_points = model_path / "filtered" / "points3D.bin"
+    points = model_path / "points3D.bin"
+    if filtered_points.exists() and points.exists() and filtered_points.stat().st_mtime >= points.stat().st_mtime:
+        return model_path / "filtered"
+    return model_path
+
+def load_models(reconstruction_path, selection, filtered=False):
+    """Load the reconstruction(s) chosen by `selection`
+
+    `selection` is 'LARGEST', 'MERGED', or the name of a sub-model directory.
+    'MERGED' aligns every sub-model that shares images with the largest model into its coordinate frame.
+    Sub-models that share no images, or fail to align, are skipped.
+    With `filtered`, the filtered version of each model is loaded where there is one.
+
+    Returns a list of `Model`, the largest first.
+    """
+    models = list_models(reconstruction_path)
+    if len(models) == 0:
+        raise Exception("No reconstruction found, solve camera motion first")
+
+    version = filtered_model_path if filtered else lambda model_path: model_path
+
+    match selection:
+        case 'LARGEST':
+            return [read_model(version(largest_model(reconstruction_path)))]
+        case 'MERGED':
+            models.sort(key=lambda model_path: model_summary(model_path)['num_reg_images'], reverse=True)
+            # alignment needs the full object graph, so merging goes through pycolmap
+            base = pycolmap.Reconstruction(version(models[0]))
+            base_names = { image.name for image in base.images.values() }
+            merged = [Model.from_reconstruction(base)]
+            for model_path in models[1:]:
+                reconstruction = pycolmap.Reconstruction(version(model_path))
+                if base_names.isdisjoint(image.name for image in reconstruction.images.values()):
+                    continue
+                base_from_model = pycolmap.align_reconstructions_via_reprojections(reconstruction, base)
+                if base_from_model is None:
+                    continue
+                reconstruction.transform(base_from_model)
+                merged.append(Model.from_reconstruction(reconstruction))
+            return merged
+        case _:
+            model_path = reconstruction_path / selection
+            if not model_path.exists():
+                raise Exception(f"Model '{selection}' does not exist")
+            return [read_model(version(model_path))]
+
+class SolveCancelled(Exception):
+    """Raised from a mapper callback to stop an in-progress incremental solve"""
+    pass
+
+def reconstruction_stats(model_path):
+    """Summarize the quality of a reconstructed model
+
+    Returns a dict with the number of registered images and 3D points, the mean reprojection error and the mean track length.
+    """
+    model = read_model(model_path)
+    return {
+        'num_reg_images': model.num_reg_images,
+        'num_points3D': model.num_points3D,
+        'mean_reprojection_error': float(model.errors.mean()) if model.num_points3D > 0 else 0.0,
+        'mean_track_length': float(model.track_lengths.mean()) if model.num_points3D > 0 else 0.0,
+    }
+
+def stats_key(stats):
+    """Sort key for `reconstruction_stats`, larger is better
+
+    Models are ranked by registered images first, then by lower reprojection error, then by longer tracks.
+    """
+    if stats is None:
+        return (-1, 0.0, 0.0)
+    return (stats['num_reg_images'], -stats['mean_reprojection_error'], stats['mean_track_length'])
+
+def latest_checkpoint(checkpoints_path):
+    """Path of the newest complete checkpoint, or `None` if there is none"""
+    if not checkpoints_path.exists():
+        return None
+    checkpoints = [path for path in checkpoints_path.iterdir() if path.name.isdigit() and (path / "checkpoint.json").exists()]
+    if len(checkpoints) == 0:
+        return None
+    return max(checkpoints, key=lambda path: int(path.name))
+
+class CheckpointWriter:
+    """Periodically snapshot an in-progress incremental reconstruction
+
+    Each snapshot is a versioned `{checkpoints_path}/{version}` directory with one sub-directory per model.
+    The reconstructions are copied on the mapper thread, and written to disk on a background thread.
+    If the previous snapshot is still being written the new one is skipped, so the mapper never waits on disk.
+    Each snapshot records the `database_state` it was solved from, and is only restored while the database is unchanged.
+    """
+    def __init__(self, checkpoints_path, database_state, every_images, every_minutes, keep):
+        self.checkpoints_path = checkpoints_path
+        self.database_state = database_state
+        self.every_images = every_images
+        self.every_seconds = every_minutes * 60
+        self.keep = keep
+
+        latest = latest_checkpoint(checkpoints_path)
+        self._version = int(latest.name) + 1 if latest is not None else 0
+        self._num_reg_images = 0
+        self._last_num_reg_images = 0
+        self._last_time = time.monotonic()
+        self._thread = None
+
+    def restore(self, reconstruction_manager):
+        """Load the newest checkpoint into `reconstruction_manager`
+
+        The model that was being built is loaded first, so the mapper continues it. Other models are kept as they were.
+
+        Returns the number of registered images in the restored model, or `None` if there is no checkpoint.
+        """
+        checkpoint_path = latest_checkpoint(self.checkpoints_path)
+        if checkpoint_path is None:
+            return None
+        with open(checkpoint_path / "checkpoint.json", "r") as f:
+            info = json.load(f)
+        if info.get('database_state') != self.database_state:
+            print("Not resuming from checkpoint, the features or matches changed since it was saved")
+            return None
+        models = list_models(checkpoint_path)
+        models.sort(key=lambda model_path: model_path.name != str(info['active_model']))
+        for model_path in models:
+            reconstruction_manager.read(str(model_path))
+        self._num_reg_images = self._last_num_reg_images = info['num_reg_images']
+        return info['num_reg_images']
+
+    def next_image(self, reconstruction_manager):
+        """Call from `next_image_callback`, snapshots the reconstruction if a checkpoint is due"""
+        self._num_reg_images += 1
+        now = time.monotonic()
+        due = (
+            (self.every_images > 0 and self._num_reg_images - self._last_num_reg_images >= self.every_images)
+            or (self.every_seconds > 0 and now - self._last_time >= self.every_seconds)
+        )
+        if not due or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        reconstructions = [pycolmap.Reconstruction(reconstruction_manager.get(i)) for i in range(reconstruction_manager.size())]
+        info = {
+            'version': self._version,
+            'active_model': len(reconstructions) - 1,
+            'num_reg_images': reconstructions[-1].num_reg_images(),
+            'database_state': self.database_state,
+            'time': time.time(),
+        }
+        self._version += 1
+        self._last_num_reg_images = self._num_reg_images
+        self._last_time = now
+
+        self._thread = threading.Thread(target=self._write, args=(info, reconstructions), daemon=True)
+        self._thread.start()
+
+    def _write(self, info, reconstructions):
+        checkpoint_path = self.checkpoints_path / f"{info['version']:06d}"
+        partial_path = self.checkpoints_path / f"{info['version']:06d}.partial"
+        shutil.rmtree(partial_path, ignore_errors=True)
+        for i, reconstruction in enumerate(reconstructions):
+            model_path = partial_path / str(i)
+            model_path.mkdir(parents=True)
+            reconstruction.write(str(model_path))
+        with open(partial_path / "checkpoint.json", "w") as f:
+            json.dump(info, f)
+        # the checkpoint only appears once it is complete
+        os.replace(partial_path, checkpoint_path)
+
+        checkpoints = sorted((path for path in self.checkpoints_path.iterdir() if path.name.isdigit()), key=lambda path: int(path.name))
+        for path in checkpoints[:-self.keep]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def finish(self):
+        """Wait for the last snapshot and remove all checkpoints, once the solve completed"""
+        if self._thread is not None:
+            self._thread.join()
+        shutil.rmtree(self.checkpoints_path, ignore_errors=True)
+
+# deleted folders are renamed to this first, then removed in the background
+TOMBSTONE_PREFIX = ".deleting-"
+
+def tombstone(path):
+    """Move a directory out of the way with one rename, so `delete_tombstones` can remove it in the background"""
+    if path.exists():
+        os.replace(path, path.with_name(f"{TOMBSTONE_PREFIX}{path.name}-{time.time_ns()}"))
+
+def delete_tombstones(path, on_progress=None):
+    """Delete every tombstone in a clip folder, including those left behind by an interrupted deletion"""
+    files = []
+    directories = []
+    for tombstone_path in path.glob(f"{TOMBSTONE_PREFIX}*") if path.exists() else []:
+        # bottom up, so every directory is empty by the time it is removed
+        for root, _, file_names in os.walk(tombstone_path, topdown=False):
+            files.extend(os.path.join(root, file_name) for file_name in file_names)
+            directories.append(root)
+
+    for i, file in enumerate(files):
+        try:
+            os.unlink(file)
+        except FileNotFoundError:
+            pass # another clear is deleting the same tombstone
+        if on_progress is not None:
+            on_progress(i + 1, len(files))
+    for directory in directories:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+def checkpoints_path(database_path):
+    return database_path.with_name("checkpoints")
+
+def workspace_paths(clip):
+    """The database, frames and reconstruction paths of a clip, without creating or splitting anything"""
+    path = clip_path(clip)
+    return path / "database.db", path / "frames", path / "reconstruction"
 
 def clear_feature_extraction(clip):
-    database_path, _, _ = prepare_database(clip)
+    database_path, _, _ = workspace_paths(clip)
+    if not database_path.exists():
+        return
 
     database = pycolmap.Database(database_path)
 
@@ -76,10 +755,17 @@ def clear_feature_extraction(clip):
 
     database.close()
 
+    set_pruned_data(database_path, descriptors=False)
+    # the snapshots and checkpoints refer to image ids that no longer exist
+    tombstone(snapshots_path(database_path))
+    tombstone(checkpoints_path(database_path))
+
     refresh_cache(clip)
 
 def clear_feature_matches(clip):
-    database_path, _, _ = prepare_database(clip)
+    database_path, _, _ = workspace_paths(clip)
+    if not database_path.exists():
+        return
 
     database = pycolmap.Database(database_path)
     
@@ -88,32 +774,267 @@ def clear_feature_matches(clip):
 
     database.close()
 
+    set_pruned_data(database_path, matches=False)
+    set_active_snapshot(database_path, None)
+    tombstone(checkpoints_path(database_path))
+
     refresh_cache(clip)
 
+def drop_pruned_features(database_path):
+    """Let feature extraction run again after `compact_database` removed the descriptors
+
+    COLMAP skips images that already have keypoints, so those are removed along with what is left of the descriptors.
+    Matches refer to keypoints by index, and extracting again may find different ones, so the matches
+    and the snapshots of them are removed as well. Returns whether anything was removed.
+    """
+    if not database_path.exists() or not pruned_data(database_path)['descriptors']:
+        return False
+
+    database = pycolmap.Database(database_path)
+
+    database.clear_keypoints()
+    database.clear_descriptors()
+    database.clear_matches()
+    database.clear_two_view_geometries()
+
+    database.close()
+
+    set_pruned_data(database_path, descriptors=False, matches=False)
+    set_active_snapshot(database_path, None)
+    tombstone(snapshots_path(database_path))
+    tombstone(checkpoints_path(database_path))
+    return True
+
 def clear_reconstruction(clip):
-    _, _, reconstruction_path = prepare_database(clip)
+    database_path, _, reconstruction_path = workspace_paths(clip)
 
-    shutil.rmtree(reconstruction_path)
+    tombstone(reconstruction_path)
+    tombstone(checkpoints_path(database_path))
+    tombstone(clip_path(clip) / "undistorted")
 
 def clear_images(clip):
-    _, images_path, _ = prepare_database(clip)
+    _, images_path, _ = workspace_paths(clip)
 
-    shutil.rmtree(images_path)
+    tombstone(images_path)
 
 def clear_all(clip):
-    database_path, _, _ = prepare_database(clip)
+    database_path, _, _ = workspace_paths(clip)
 
-    database = pycolmap.Database(database_path)
+    if database_path.exists():
+        database = pycolmap.Database(database_path)
 
-    database.clear_all_tables()
+        database.clear_all_tables()
 
-    database.close()
+        database.close()
 
-    refresh_cache(clip)
+        database_path.with_name("pruned.json").unlink(missing_ok=True)
+        tombstone(snapshots_path(database_path))
+
+        refresh_cache(clip)
 
     clear_reconstruction(clip)
     clear_images(clip)
 
+# evicted first to last. Frames are split again by the next stage that needs them, the shared cache only speeds up
+# other clips, and descriptors are extracted again by the next feature extraction, which then has to match again,
+# see `drop_pruned_features`
+EVICTABLE_ARTIFACTS = ('frames', 'shared_frames', 'shared_features', 'descriptors')
+
+_enforcing = threading.Lock()
+
+# a workspace holds one of these files for each stage running in it, in this or any other Blender process
+LOCK_PREFIX = "running-"
+
+def lock_workspace(path):
+    """Mark a workspace as in use by a running stage, so no storage budget evicts from under it. Returns the lock file"""
+    path.mkdir(parents=True, exist_ok=True)
+    lock_path = path / f"{LOCK_PREFIX}{uuid.uuid4().hex}.lock"
+    with open(lock_path, "w") as f:
+        json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, f)
+    return lock_path
+
+def unlock_workspace(lock_path):
+    lock_path.unlink(missing_ok=True)
+
+def process_alive(pid):
+    # on Windows, signaling a process terminates it, so locks left behind there are never treated as stale
+    if sys.platform.startswith('win'):
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def workspace_locked(path):
+    """Whether a stage is running in the workspace. Locks left by crashed processes of this host are removed"""
+    for lock_path in path.glob(f"{LOCK_PREFIX}*.lock"):
+        try:
+            with open(lock_path, "r") as f:
+                owner = json.load(f)
+        except (OSError, ValueError):
+            return True # still being written
+        if owner.get('host') == socket.gethostname() and not process_alive(owner.get('pid')):
+            lock_path.unlink(missing_ok=True)
+            continue
+        return True
+    return False
+
+def touch_artifacts(path, *artifacts):
+    """Record that the artifacts of the workspace at `path` were just used
+
+    File access times are unreliable on most mounts, so they are kept in an `access.json` ledger.
+    """
+    ledger_path = path / "access.json"
+    try:
+        with open(ledger_path, "r") as f:
+            ledger = json.load(f)
+    except (OSError, ValueError):
+        ledger = {}
+    now = time.time()
+    for artifact in artifacts:
+        ledger[artifact] = now
+    with open(ledger_path, "w") as f:
+        json.dump(ledger, f)
+
+def storage_workspaces():
+    """Every clip workspace on disk: the custom directories of loaded clips, and every folder in the
+    `BL_colmap` directories they use, including those of clips that are no longer loaded"""
+    workspaces = set()
+    for clip in bpy.data.movieclips:
+        path = clip_path(clip)
+        if clip.colmap.use_custom_directory:
+            workspaces.add(path)
+        elif path.parent.exists():
+            workspaces.update(child for child in path.parent.iterdir() if child.is_dir())
+    return sorted(workspace for workspace in workspaces if workspace.exists())
+
+def directory_size(path, seen=None):
+    """Bytes used by the files under `path`
+
+    Hard linked files are only counted the first time they show up in `seen`, a set of `(device, inode)` shared between calls.
+    """
+    size = 0
+    for entry in path.rglob("*"):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if seen is not None and stat.st_nlink > 1:
+            if (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+        size += stat.st_size
+    return size
+
+def remove_files(path):
+    """Delete a file or folder. Returns the bytes that became free, which excludes files still hard linked elsewhere"""
+    entries = [path] if path.is_file() else [entry for entry in path.rglob("*") if entry.is_file()]
+    freed = 0
+    for entry in entries:
+        stat = entry.stat()
+        if stat.st_nlink == 1:
+            freed += stat.st_size
+    if path.is_file():
+        path.unlink(missing_ok=True)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+    return freed
+
+def workspace_artifacts(path):
+    """Size and last access time of each evictable artifact in a workspace"""
+    try:
+        with open(path / "access.json", "r") as f:
+            ledger = json.load(f)
+    except (OSError, ValueError):
+        ledger = {}
+
+    artifacts = []
+    frames_path = path / "frames"
+    if frames_path.exists():
+        artifacts.append(('frames', frames_path, directory_size(frames_path), ledger.get('frames', frames_path.stat().st_mtime)))
+    database_path = path / "database.db"
+    if database_path.exists() and not pruned_data(database_path)['descriptors']:
+        connection = sqlite3.connect(f"{database_path.as_uri()}?mode=ro", uri=True)
+        try:
+            size = int(connection.execute("SELECT SUM(LENGTH(data)) FROM descriptors").fetchone()[0] or 0)
+        except sqlite3.OperationalError:
+            size = 0
+        finally:
+            connection.close()
+        artifacts.append(('descriptors', database_path, size, ledger.get('descriptors', database_path.stat().st_mtime)))
+    return [artifact for artifact in artifacts if artifact[2] > 0]
+
+def shared_cache_artifacts(cache_path):
+    """Size and last access time of each entry of the shared frames and features cache"""
+    try:
+        with open(cache_path / "access.json", "r") as f:
+            ledger = json.load(f)
+    except (OSError, ValueError):
+        ledger = {}
+
+    artifacts = []
+    for kind, artifact in (("frames", 'shared_frames'), ("features", 'shared_features')):
+        if not (cache_path / kind).exists():
+            continue
+        for entry in (cache_path / kind).iterdir():
+            # entries still being published are not in use yet
+            if entry.name.endswith(".partial"):
+                continue
+            size = directory_size(entry) if entry.is_dir() else entry.stat().st_size
+            artifacts.append((artifact, entry, size, ledger.get(f"{kind}/{entry.name}", entry.stat().st_mtime)))
+    return [artifact for artifact in artifacts if artifact[2] > 0]
+
+def enforce_storage_budget(workspaces, budget, shared_cache=None, on_progress=None):
+    """Evict artifacts until the workspaces and the shared cache fit in `budget` bytes
+
+    Kinds of artifacts are evicted in the order of `EVICTABLE_ARTIFACTS`, the least recently used ones first within each kind.
+    Databases and reconstructions are never evicted. Workspaces in use by a running stage are skipped.
+    Frames hard linked between a workspace and the shared cache count once, and only free space once every link is gone.
+
+    Returns `(usage, freed)` in bytes.
+    """
+    with _enforcing:
+        roots = [*workspaces, *([shared_cache] if shared_cache is not None and shared_cache.exists() else [])]
+        seen = set()
+        usage = sum(directory_size(root, seen) for root in roots)
+        if usage <= budget:
+            return usage, 0
+
+        candidates = []
+        for workspace in workspaces:
+            for artifact, path, size, last_access in workspace_artifacts(workspace):
+                candidates.append((EVICTABLE_ARTIFACTS.index(artifact), last_access, str(path), artifact, workspace))
+        if shared_cache is not None and shared_cache.exists():
+            for artifact, path, size, last_access in shared_cache_artifacts(shared_cache):
+                candidates.append((EVICTABLE_ARTIFACTS.index(artifact), last_access, str(path), artifact, None))
+        candidates.sort()
+
+        freed = 0
+        for i, (_, _, path, artifact, workspace) in enumerate(candidates):
+            if usage - freed <= budget:
+                break
+            # checked right before evicting, a stage may have started since the scan
+            if workspace is not None and workspace_locked(workspace):
+                continue
+            path = Path(path)
+            match artifact:
+                case 'frames' | 'shared_frames' | 'shared_features':
+                    freed += remove_files(path)
+                case 'descriptors':
+                    freed += compact_database(path, drop_descriptors=True, drop_matches=False)
+            if on_progress is not None:
+                on_progress(i + 1, len(candidates))
+
+        return usage - freed, freed
+
+def start_enforcing_storage_budget(args):
+    """Enforce the storage budget on a background thread, unless it is already being enforced"""
+    if _enforcing.locked():
+        return
+    threading.Thread(target=enforce_storage_budget, kwargs=args, daemon=True).start()
+
 class BlockingOperator(bpy.types.Operator):
     def prepare(self, context):
         pass
@@ -121,6 +1042,7 @@ class BlockingOperator(bpy.types.Operator):
         pass
     
     parse_logs = True
+    uses_workspace = True # locks the clip workspace, so no storage budget evicts from under the stage
     progress_expression = re.compile(r"Processed file \[(\d+)\/(\d+)\]")
 
     def _set_running(self, running):
@@ -144,6 +1066,8 @@ class BlockingOperator(bpy.types.Operator):
     _timer = None
 
     _clip = None
+    _lock_path = None
+    _modal = False # whether `modal` cleans up after the stage, which it only does when invoked
 
     _message = ""
 
@@ -197,23 +1121,45 @@ class BlockingOperator(bpy.types.Operator):
                 if area.type == 'CLIP_EDITOR':
                     area.tag_redraw()
             refresh_cache(self._clip)
+            if self._lock_path is not None:
+                unlock_workspace(self._lock_path)
+                self._lock_path = None
+            if self.uses_workspace:
+                storage = context.scene.colmap_storage
+                if storage.use_budget and storage.auto_enforce:
+                    start_enforcing_storage_budget(storage.build())
             self._clip = None
             return {'FINISHED'}
 
     def execute(self, context):
         self._progress_total = 1 # get the progress bar to show right away
         self._clip = context.space_data.clip
+        if self.uses_workspace:
+            self._lock_path = lock_workspace(clip_path(self._clip))
+
+        def release():
+            # without `modal`, e.g. when run with 'EXEC_DEFAULT', nothing else would ever remove the lock
+            if not self._modal and self._lock_path is not None:
+                unlock_workspace(self._lock_path)
+                self._lock_path = None
 
         try:
             args = self.prepare(context)
         except Exception as e:
             self.report({'ERROR'}, str(e))
             self._running = False
+            release()
             return {'FINISHED'}
 
         def run(args):
-            self.execute_async(args)
-            self._running = False
+            try:
+                self.execute_async(args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                release()
+                # always, or the operator would stay running for the rest of the session
+                self._running = False
         
         t = threading.Thread(target=run, args=args)
         t.start()
@@ -235,6 +1181,7 @@ class BlockingOperator(bpy.types.Operator):
         self._timer = functools.partial(BlockingOperator._update_progress, self)
         bpy.app.timers.register(self._timer, first_interval=0.1)
 
+        self._modal = True
         self.execute(context)
         
         context.window_manager.modal_handler_add(self)